@@ -1,29 +1,353 @@
-import pandas as pd
-
-def remove_duplicates(input_file, output_file):
-    # Read the CSV file
-    print(f"Reading data from {input_file}...")
-    df = pd.read_csv(input_file)
-    
-    # Count original rows
-    original_count = len(df)
-    print(f"Original row count: {original_count}")
-    
-    # Remove duplicates
-    df_deduplicated = df.drop_duplicates()
-    
-    # Count after deduplication
-    deduplicated_count = len(df_deduplicated)
-    print(f"Row count after deduplication: {deduplicated_count}")
-    print(f"Removed {original_count - deduplicated_count} duplicate rows")
-    
-    # Save the deduplicated data
-    df_deduplicated.to_csv(output_file, index=False)
-    print(f"Deduplicated data saved to {output_file}")
-
-# Define input and output file paths
-input_file = "/Users/omprakashgunja/Documents/GitHub/lastbite-ai/backend/data/user_product_link_table_v2.csv"
-output_file = "/Users/omprakashgunja/Documents/GitHub/lastbite-ai/backend/data/user_product_link_table_v2.csv"
-
-# Run the deduplication
-remove_duplicates(input_file, output_file)
\ No newline at end of file
+# app/clean.py
+"""
+Streaming dedupe and repair for the data tables.
+
+    python -m app.clean links                      # report on data/user_product_link_table_v2.csv
+    python -m app.clean links --in-place           # ...and repair it
+    python -m app.clean users export.csv -o users_clean.csv
+
+Rows are grouped by key — product_uid, user_uid, or (user_uid, product_uid)
+for links. Identical rows are dropped; the rest of a group is merged:
+
+  links     quantities summed (blank or unparsable ones count as
+            --blank-quantity), the first non-blank scan_date kept
+  users     the last row's profile, at the last valid location it gave
+  products  the last row wins
+
+Links whose product or user is missing from the other tables are reported,
+and dropped with --drop-orphans. Output keeps the input order (each group
+sits where its key first appeared).
+
+Memory stays bounded for tables larger than RAM: when the table won't fit in
+--memory-mb it is hash-partitioned into temp files by key, each partition is
+grouped on its own, and the sorted partitions are merged back in order.
+--in-place works on a snapshot, so the app keeps writing while it runs; rows
+appended meanwhile are carried over unmerged.
+"""
+
+import os
+import gc
+import csv
+import sys
+import math
+import time
+import heapq
+import argparse
+import tempfile
+from collections import Counter
+from functools import partial
+from itertools import islice
+
+import numpy as np
+
+from app.services.csv_index import DATA_DIR
+from app.services.journal import CsvJournal
+from app.services.product_catalog import PRODUCT_FIELDS
+from app.services.inventory_index import LINK_FIELDS
+from app.services.geo_index import USER_FIELDS, parse_coordinates
+
+# ── tweak these for your deployment ─────────────────────────────
+CLEAN_MEMORY_MB = int(os.getenv('LASTBITE_CLEAN_MEMORY_MB', 512))   # grouping memory before partitioning
+# ----------------------------------------------------------------
+
+RESIDENT_PER_BYTE = 8        # measured: bytes held while grouping, per byte of CSV
+MAX_PARTITIONS    = 1000     # keeps open temp files under the usual fd limit
+ORPHAN_CHUNK      = 50_000   # links checked per NumPy lookup
+ORPHAN_SAMPLE     = 20       # orphans listed in the report
+
+TABLES = {
+    'products': ('products_table_v2.csv', PRODUCT_FIELDS),
+    'users':    ('users_table_v2.csv', USER_FIELDS),
+    'links':    ('user_product_link_table_v2.csv', LINK_FIELDS),
+}
+
+
+def _key(table, row):
+    """Group key of a row (a list in the table's field order), or None if it has none"""
+    if table == 'links':
+        user, product = row[0].strip(), row[1].strip()
+        return (user, product) if user and product else None
+    return row[0].strip() or None
+
+
+# ── reading ─────────────────────────────────────────────────────
+
+def open_table(path, fields, journaled):
+    """
+    (rows, size in bytes, journal snapshot or None). Rows are lists in
+    `fields` order, base file first, then the journal when `journaled`. The
+    snapshot (journal, base signature, offset) is what rewrite() needs.
+    """
+    if journaled:
+        journal = CsvJournal(path, fields)
+        base, signature, journal_rows, offset = journal.snapshot()
+        size = (os.fstat(base.fileno()).st_size if base else 0) + offset
+        return _rows(base, journal_rows, fields), size, (journal, signature, offset)
+    base = open(path, newline='')
+    return _rows(base, (), fields), os.fstat(base.fileno()).st_size, None
+
+
+def _rows(base, journal_rows, fields):
+    if base is not None:
+        with base:
+            reader = csv.reader(base)
+            header = next(reader, None) or fields
+            width = len(header)
+            take = None if header == fields else [header.index(f) if f in header else None for f in fields]
+            for row in reader:
+                if not row:
+                    continue
+                if len(row) < width:
+                    row += [''] * (width - len(row))
+                yield row if take is None else [row[i] if i is not None else '' for i in take]
+    for row in journal_rows:
+        yield [row.get(f) or '' for f in fields]
+
+
+def _known_hashes(path, fields):
+    """Sorted hashes of a table's first column (its uid), or None if the table is missing"""
+    if not os.path.exists(path):
+        return None
+    rows, _, _ = open_table(path, fields, os.path.exists(path + '.journal'))
+    return np.unique(np.fromiter((hash(r[0].strip()) for r in rows), dtype=np.int64))
+
+
+# ── grouping ────────────────────────────────────────────────────
+# Each fold takes (seq, row) pairs and yields (seq, merged row) once all are
+# read, in first-seen order. A group remembers its first row's signature and
+# only becomes a set of signatures if a different row turns up.
+
+def _repeat(group, slot, signature, stats):
+    """True if `signature` was seen in this group before; records it otherwise"""
+    seen = group[slot]
+    if seen == signature or (type(seen) is set and signature in seen):
+        stats['exact_duplicates'] += 1
+        return True
+    if type(seen) is not set:
+        seen = group[slot] = {seen}
+    seen.add(signature)
+    stats['merged'] += 1
+    return False
+
+
+def _quantity(value, stats, blank_quantity):
+    value = value.strip()
+    if value.isdecimal():
+        return int(value)
+    stats['blank_quantity' if not value else 'bad_quantity'] += 1
+    return blank_quantity
+
+
+def fold_links(rows, stats, blank_quantity=1):
+    """Repeated links merged: quantities summed, the first non-blank scan_date kept"""
+    groups, strings = {}, {}
+    same = strings.setdefault     # one object per distinct uid/date/quantity, not one per row
+    for seq, row in rows:
+        user, product = row[0].strip(), row[1].strip()
+        if not user or not product:
+            stats['missing_key'] += 1
+            continue
+        key = (same(user, user), same(product, product))
+        raw = (same(row[2], row[2]), same(row[3], row[3]))
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [seq, raw[0].strip(), _quantity(raw[1], stats, blank_quantity), raw]
+        elif not _repeat(group, 3, raw, stats):
+            if not group[1]:
+                group[1] = raw[0].strip()
+            group[2] += _quantity(raw[1], stats, blank_quantity)
+    for (user, product), (seq, scan_date, quantity, _) in groups.items():
+        yield seq, [user, product, scan_date, str(quantity)]
+
+
+def fold_profiles(rows, stats, located=False):
+    """
+    Repeated products or users: the last row wins. With `located` (users),
+    it keeps the last valid location_lat/location_lng any of its rows gave.
+    """
+    groups = {}
+    for seq, row in rows:
+        uid = row[0] = row[0].strip()
+        if not uid:
+            stats['missing_key'] += 1
+            continue
+        where = row if located and parse_coordinates(row[3], row[4]) else None
+        group = groups.get(uid)
+        if group is None:
+            groups[uid] = [seq, row, where, tuple(row)]
+        elif not _repeat(group, 3, tuple(row), stats):
+            group[1] = row
+            if where is not None:
+                if group[2] is not None and (group[2][3], group[2][4]) != (row[3], row[4]):
+                    stats['moved'] += 1
+                group[2] = where
+    for seq, row, where, _ in groups.values():
+        if where is not None and where is not row:
+            row = [*row[:3], where[3], where[4], *row[5:]]
+        yield seq, row
+
+
+def _fold(table, blank_quantity):
+    if table == 'links':
+        return partial(fold_links, blank_quantity=blank_quantity)
+    return partial(fold_profiles, located=table == 'users')
+
+
+# ── partitioning ────────────────────────────────────────────────
+
+def _numbered(rows, stats):
+    seq = -1
+    for seq, row in enumerate(rows):
+        yield seq, row
+    stats['rows_in'] = seq + 1
+
+
+def grouped(table, rows, partitions, tmpdir, stats, blank_quantity):
+    """Every merged row in input order, grouping one partition's worth of keys at a time"""
+    fold = _fold(table, blank_quantity)
+    if partitions == 1:
+        for _, row in fold(_numbered(rows, stats), stats):
+            yield row
+        return
+
+    parts = [open(os.path.join(tmpdir, f'part{p}.csv'), 'w+', newline='') for p in range(partitions)]
+    writers = [csv.writer(f, lineterminator='\n') for f in parts]
+    for seq, row in _numbered(rows, stats):
+        key = _key(table, row)
+        writers[hash(key) % partitions if key is not None else 0].writerow([seq, *row])
+
+    merged = []
+    for p, f in enumerate(parts):
+        f.seek(0)
+        path = os.path.join(tmpdir, f'merged{p}.csv')
+        with open(path, 'w', newline='') as m:
+            out = fold(((int(r[0]), r[1:]) for r in csv.reader(f)), stats)
+            csv.writer(m, lineterminator='\n').writerows([seq, *row] for seq, row in out)
+        f.close()
+        os.remove(f.name)
+        merged.append(path)
+
+    readers = [open(path, newline='') for path in merged]
+    try:
+        for r in heapq.merge(*(csv.reader(f) for f in readers), key=lambda r: int(r[0])):
+            yield r[1:]
+    finally:
+        for f in readers:
+            f.close()
+
+
+def check_orphans(rows, products, users, stats, drop):
+    """Count (and optionally drop) links to unknown products or users, a chunk at a time"""
+    while True:
+        chunk = list(islice(rows, ORPHAN_CHUNK))
+        if not chunk:
+            return
+        orphan = np.zeros(len(chunk), dtype=bool)
+        for column, known, name in ((1, products, 'missing_product'), (0, users, 'missing_user')):
+            if known is None:
+                continue
+            h = np.fromiter((hash(r[column]) for r in chunk), dtype=np.int64, count=len(chunk))
+            at = np.minimum(np.searchsorted(known, h), max(len(known) - 1, 0))
+            missing = known[at] != h if len(known) else np.ones(len(chunk), dtype=bool)
+            stats[name] += int(missing.sum())
+            orphan |= missing
+        for i in np.flatnonzero(orphan)[:ORPHAN_SAMPLE - len(stats['orphan_sample'])]:
+            stats['orphan_sample'].append(chunk[i][:2])
+        if drop:
+            stats['orphans_dropped'] += int(orphan.sum())
+            chunk = [r for r, o in zip(chunk, orphan) if not o]
+        yield from chunk
+
+
+# ── driver ──────────────────────────────────────────────────────
+
+def clean(table, path, output=None, in_place=False, memory_mb=CLEAN_MEMORY_MB, blank_quantity=1,
+          products_path=None, users_path=None, drop_orphans=False, tmp_dir=None):
+    """Dedupe and repair one table; returns the report dict. Writes only with `output` or `in_place`."""
+    t0 = time.perf_counter()
+    fields = TABLES[table][1]
+    journaled = in_place or os.path.exists(path + '.journal')
+    rows, size, snapshot = open_table(path, fields, journaled)
+    partitions = min(MAX_PARTITIONS, max(1, math.ceil(size * RESIDENT_PER_BYTE / (memory_mb * 2**20))))
+    stats = Counter()
+    stats['orphan_sample'] = []
+
+    # grouping allocates millions of small acyclic objects; the cyclic GC would rescan them all repeatedly
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        if in_place:
+            output = path + '.clean'
+        # partitions go next to the output, not /tmp, which may be RAM-backed
+        tmp_dir = tmp_dir or os.path.dirname(os.path.abspath(output or path))
+        with tempfile.TemporaryDirectory(prefix='lastbite-clean-', dir=tmp_dir) as tmp:
+            out_rows = grouped(table, rows, partitions, tmp, stats, blank_quantity)
+            if table == 'links':
+                here = os.path.dirname(os.path.abspath(path))
+                products_path = products_path or os.path.join(here, TABLES['products'][0])
+                users_path = users_path or os.path.join(here, TABLES['users'][0])
+                out_rows = check_orphans(out_rows, _known_hashes(products_path, PRODUCT_FIELDS),
+                                         _known_hashes(users_path, USER_FIELDS), stats, drop_orphans)
+            written = 0
+            if output:
+                with open(output, 'w', newline='') as f:
+                    w = csv.writer(f, lineterminator='\n')
+                    w.writerow(fields)
+                    for row in out_rows:
+                        w.writerow(row)
+                        written += 1
+                    f.flush()
+                    os.fsync(f.fileno())
+            else:
+                written = sum(1 for _ in out_rows)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    if in_place:
+        journal, signature, offset = snapshot
+        try:
+            journal.rewrite(output, signature, offset)
+        finally:
+            if os.path.exists(output):
+                os.remove(output)
+
+    return {'table': table, 'path': path, 'rows_in': stats.pop('rows_in'), 'rows_out': written,
+            'partitions': partitions, 'elapsed_s': round(time.perf_counter() - t0, 2), **stats}
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog='python -m app.clean', description=__doc__.split('\n\n')[0].strip())
+    ap.add_argument('table', choices=sorted(TABLES))
+    ap.add_argument('path', nargs='?', help="CSV to clean (default: the table in data/)")
+    dest = ap.add_mutually_exclusive_group()
+    dest.add_argument('-o', '--output', help="write the cleaned table here")
+    dest.add_argument('--in-place', action='store_true', help="replace the table (and fold its journal)")
+    ap.add_argument('--memory-mb', type=int, default=CLEAN_MEMORY_MB)
+    ap.add_argument('--blank-quantity', type=int, default=1, help="quantity for blank links (default 1)")
+    ap.add_argument('--products', help="products table for the orphan check (default: next to the links)")
+    ap.add_argument('--users', help="users table for the orphan check (default: next to the links)")
+    ap.add_argument('--drop-orphans', action='store_true')
+    ap.add_argument('--tmp-dir', help="where partitions go (default: next to the output)")
+    args = ap.parse_args(argv)
+    if args.memory_mb < 1:
+        ap.error("--memory-mb must be at least 1")
+
+    path = args.path or os.path.join(DATA_DIR, TABLES[args.table][0])
+    if not os.path.exists(path):
+        ap.error(f"{path} not found")
+    report = clean(args.table, path, output=args.output, in_place=args.in_place, memory_mb=args.memory_mb,
+                   blank_quantity=args.blank_quantity, products_path=args.products, users_path=args.users,
+                   drop_orphans=args.drop_orphans, tmp_dir=args.tmp_dir)
+
+    sample = report.pop('orphan_sample')
+    for name, value in report.items():
+        print(f"{name:>18}: {value}")
+    for user, product in sample:
+        print(f"{'orphan':>18}: {user} -> {product}")
+    if not (args.output or args.in_place):
+        print("report only; pass -o FILE or --in-place to write the cleaned table")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
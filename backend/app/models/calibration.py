@@ -0,0 +1,175 @@
+# app/models/calibration.py
+"""
+Temperature scaling for the two heads of DualFruitCNN: one scalar T per
+head, fitted on held-out images so that softmax(logits / T) is a calibrated
+confidence. T only rescales the logits, so the predicted labels never change.
+
+    cd backend && python -m app.models.calibration --data path/to/held_out [--checkpoint path/to/model.pth]
+
+The held-out directory holds images in folders whose path names one fruit
+and one state of the checkpoint's class map, e.g. freshapples/,
+rotten_banana/ or orange/fresh/. The fitted temperatures are written next
+to the checkpoint as <checkpoint>.calibration.json, which
+classification_service reads when it loads the model.
+"""
+
+import os
+import json
+import glob
+import logging
+import argparse
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from app.models.fruit_model import load_model_checkpoint, model_device, INPUT_SIZE
+
+logger = logging.getLogger(__name__)
+
+HEADS = ('fruit', 'state')
+ECE_BINS = 15
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+
+def calibration_path(checkpoint_path):
+    """Where the temperatures fitted for a checkpoint live"""
+    return os.path.splitext(checkpoint_path)[0] + '.calibration.json'
+
+
+def load_temperatures(path):
+    """{head: T} from a calibration file; T = 1 (raw softmax) for heads it doesn't cover"""
+    temperatures = dict.fromkeys(HEADS, 1.0)
+    try:
+        with open(path) as f:
+            fitted = json.load(f).get('temperature', {})
+    except FileNotFoundError:
+        logger.warning("no calibration file at %s; confidences are uncalibrated softmax", path)
+        return temperatures
+    for head in HEADS:
+        if head in fitted:
+            temperatures[head] = float(fitted[head])
+    return temperatures
+
+
+def fit_temperature(logits, labels, max_iter=200):
+    """The T > 0 minimizing the negative log-likelihood of softmax(logits / T) on (logits, labels)"""
+    logits, labels = logits.detach().float(), labels.detach().long()
+    log_t = torch.zeros(1, requires_grad=True)     # optimize log T so T stays positive
+    opt = torch.optim.LBFGS([log_t], lr=0.1, max_iter=max_iter, line_search_fn='strong_wolfe')
+
+    def closure():
+        opt.zero_grad()
+        loss = F.cross_entropy(logits / log_t.exp(), labels)
+        loss.backward()
+        return loss
+
+    opt.step(closure)
+    return float(log_t.exp())
+
+
+def nll(logits, labels, temperature=1.0):
+    return float(F.cross_entropy(logits.float() / temperature, labels.long()))
+
+
+def expected_calibration_error(logits, labels, temperature=1.0, bins=ECE_BINS):
+    """
+    Mean |accuracy - confidence| over equal-width confidence bins, weighted
+    by how many predictions fall in each.
+    """
+    probs = torch.softmax(logits.float() / temperature, dim=1)
+    confidence, predicted = probs.max(dim=1)
+    correct = (predicted == labels).float().numpy()
+    confidence = confidence.numpy()
+    which = np.minimum((confidence * bins).astype(np.int64), bins - 1)
+    ece = 0.0
+    for b in range(bins):
+        in_bin = which == b
+        if in_bin.any():
+            ece += in_bin.mean() * abs(correct[in_bin].mean() - confidence[in_bin].mean())
+    return float(ece)
+
+
+def labelled_images(directory, class_map):
+    """[(path, fruit index, state index)] for images whose folder path names exactly one fruit and one state"""
+    def index_of(labels, text):
+        hits = [i for i, label in labels.items() if label in text]
+        return hits[0] if len(hits) == 1 else None
+
+    items = []
+    for path in sorted(glob.glob(os.path.join(directory, '**', '*.*'), recursive=True)):
+        if not path.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        folders = os.path.relpath(os.path.dirname(path), directory).lower()
+        fruit, state = index_of(class_map['fruit'], folders), index_of(class_map['state'], folders)
+        if fruit is not None and state is not None:
+            items.append((path, int(fruit), int(state)))
+    return items
+
+
+def collect_logits(model, items, load_array, batch_size=64):
+    """
+    Both heads' logits over `items`, preprocessed with `load_array` (the
+    serving pipeline), plus the labels: (fruit logits, state logits,
+    fruit labels, state labels).
+    """
+    device = model_device(model)
+    fruit, state = [], []
+    with torch.no_grad():
+        for i in range(0, len(items), batch_size):
+            chunk = items[i:i + batch_size]
+            batch = np.empty((len(chunk), 3, *INPUT_SIZE), dtype=np.float32)
+            for row, (path, _, _) in enumerate(chunk):
+                with open(path, 'rb') as f:
+                    load_array(f.read(), batch[row])
+            f_logits, s_logits = model(torch.from_numpy(batch).to(device))
+            fruit.append(f_logits.float().cpu())
+            state.append(s_logits.float().cpu())
+    return (torch.cat(fruit), torch.cat(state),
+            torch.tensor([f for _, f, _ in items]), torch.tensor([s for _, _, s in items]))
+
+
+def calibrate(fruit_logits, state_logits, fruit_labels, state_labels):
+    """Fit one temperature per head; returns the calibration file's contents with before/after NLL and ECE"""
+    report = {'temperature': {}, 'heads': {}, 'samples': len(fruit_labels)}
+    for head, logits, labels in (('fruit', fruit_logits, fruit_labels), ('state', state_logits, state_labels)):
+        t = fit_temperature(logits, labels)
+        report['temperature'][head] = t
+        report['heads'][head] = {
+            'accuracy': float((logits.argmax(dim=1) == labels).float().mean()),
+            'nll_before': nll(logits, labels), 'nll_after': nll(logits, labels, t),
+            'ece_before': expected_calibration_error(logits, labels),
+            'ece_after': expected_calibration_error(logits, labels, t),
+        }
+    return report
+
+
+def main():
+    # imported here: classification_service imports this module
+    from app.services.classification_service import MODEL_PATH, load_array
+
+    ap = argparse.ArgumentParser(description="Fit per-head softmax temperatures on held-out images")
+    ap.add_argument('--data', required=True, help="held-out images in folders named by fruit and state")
+    ap.add_argument('--checkpoint', default=MODEL_PATH)
+    ap.add_argument('--out', help="default: <checkpoint>.calibration.json")
+    args = ap.parse_args()
+
+    # fit on the fp32 weights, whichever LASTBITE_MODEL_BACKEND serves them
+    model, class_map = load_model_checkpoint(args.checkpoint, backend='eager')
+    items = labelled_images(args.data, class_map)
+    if not items:
+        raise SystemExit(f"no labelled images under {args.data}")
+    report = calibrate(*collect_logits(model, items, load_array))
+    out = args.out or calibration_path(args.checkpoint)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{report['samples']} held-out images")
+    for head, r in report['heads'].items():
+        print(f"{head:<5}  T = {report['temperature'][head]:.3f}  accuracy {r['accuracy']:.3f}  "
+              f"NLL {r['nll_before']:.3f} -> {r['nll_after']:.3f}  ECE {r['ece_before']:.3f} -> {r['ece_after']:.3f}")
+    print(f"wrote {out}")
+
+
+if __name__ == '__main__':
+    main()
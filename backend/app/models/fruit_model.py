@@ -1,8 +1,31 @@
 # app/models/fruit_model.py
 
+import os
+import copy
+import glob
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torchvision import transforms
+
+# ── inference backend, picked at load time ──────────────────────
+#   eager        plain fp32 nn.Module
+#   torchscript  torch.jit.script + freeze
+#   traced       torch.jit.trace + freeze
+#   dynamic_int8 int8 weights for the Linear layers (fc_shared is 32768×128)
+#   static_int8  int8 convs + Linears, activations calibrated ahead of time
+MODEL_BACKEND         = os.getenv('LASTBITE_MODEL_BACKEND', 'eager')
+QUANT_CALIBRATION_DIR = os.getenv('LASTBITE_QUANT_CALIBRATION_DIR')  # images for static_int8 (required)
+BACKENDS = ('eager', 'torchscript', 'traced', 'dynamic_int8', 'static_int8')
+# ----------------------------------------------------------------
+
+INPUT_SIZE = (128, 128)
+
+preprocess = transforms.Compose([
+    transforms.Resize(INPUT_SIZE),
+    transforms.ToTensor(),
+    transforms.Normalize([0.5]*3, [0.5]*3)
+])
 
 class DualFruitCNN(nn.Module):
     def __init__(self):
@@ -17,18 +40,103 @@ class DualFruitCNN(nn.Module):
     def forward(self, x):
         x = self.pool(F.relu(self.conv1(x)))
         x = self.pool(F.relu(self.conv2(x)))
-        x = x.view(x.size(0), -1)
+        x = torch.flatten(x, 1)
         x = F.relu(self.fc_shared(x))
         return self.fc_fruit(x), self.fc_state(x)
 
-def load_model_checkpoint(checkpoint_path, device=None):
+def model_device(model):
+    """Device of a model's weights; frozen/quantized backends may expose none, so default to CPU"""
+    for t in model.parameters():
+        return t.device
+    for t in model.buffers():
+        return t.device
+    return torch.device('cpu')
+
+def calibration_batches(directory=QUANT_CALIBRATION_DIR, batch_size=16, limit=256):
+    """
+    Batches of the images under `directory` for static quantization,
+    decoded and normalized by the serving pipeline (fast_preprocess) so the
+    activation ranges are those of real requests. Raises ValueError when no
+    directory is set or it holds no readable images: ranges calibrated on
+    anything else would quietly cost accuracy.
+    """
+    # imported here: image_preprocess itself imports INPUT_SIZE from this module
+    from app.services.image_preprocess import fast_preprocess
+    if not directory:
+        raise ValueError("static_int8 needs calibration images: set LASTBITE_QUANT_CALIBRATION_DIR")
+    paths = sorted(glob.glob(os.path.join(directory, '**', '*.*'), recursive=True))[:limit]
+    tensors = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                tensors.append(torch.from_numpy(fast_preprocess(f.read())))
+        except Exception:
+            continue
+    if not tensors:
+        raise ValueError(f"no readable calibration images in {directory!r}")
+    return [torch.stack(tensors[i:i + batch_size]) for i in range(0, len(tensors), batch_size)]
+
+def build_backend(model, backend, calibration=None):
+    """Return an inference-ready variant of an eval-mode fp32 DualFruitCNN"""
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown model backend {backend!r}, expected one of {BACKENDS}")
+    if backend == 'eager':
+        return model
+
+    example = torch.randn(1, 3, *INPUT_SIZE, device=model_device(model))
+    if backend == 'torchscript':
+        return torch.jit.freeze(torch.jit.script(model))
+    if backend == 'traced':
+        return torch.jit.freeze(torch.jit.trace(model, example))
+
+    # quantized kernels are CPU-only
+    fp32 = copy.deepcopy(model).cpu().eval()
+    if backend == 'dynamic_int8':
+        from torch.ao.quantization import quantize_dynamic
+        return quantize_dynamic(fp32, {nn.Linear}, dtype=torch.qint8)
+
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+    prepared = prepare_fx(fp32, get_default_qconfig_mapping(torch.backends.quantized.engine), (example.cpu(),))
+    with torch.no_grad():
+        for batch in (calibration if calibration is not None else calibration_batches()):
+            prepared(batch)
+    return convert_fx(prepared)
+
+def backend_parity(reference, candidate, inputs):
+    """
+    Compare a backend against the fp32 model on the same inputs: argmax
+    agreement per head and the largest absolute logit difference.
+    """
+    agree = {'fruit': 0, 'state': 0}
+    max_diff, total = 0.0, 0
+    with torch.no_grad():
+        for x in inputs:
+            ref = reference(x)
+            out = candidate(x.to(model_device(candidate)))
+            for head, r, c in zip(('fruit', 'state'), ref, out):
+                c = c.to(r.device).float()
+                agree[head] += (r.argmax(dim=1) == c.argmax(dim=1)).sum().item()
+                max_diff = max(max_diff, (r - c).abs().max().item())
+            total += x.size(0)
+    return {
+        'fruit_agreement': agree['fruit'] / max(total, 1),
+        'state_agreement': agree['state'] / max(total, 1),
+        'max_logit_diff': max_diff,
+    }
+
+def load_model_checkpoint(checkpoint_path, device=None, backend=None):
     """
     Loads model weights and returns:
-      - model: DualFruitCNN in eval() mode
+      - model: DualFruitCNN in eval() mode, converted to `backend`
+        (default: LASTBITE_MODEL_BACKEND)
       - class_map: dict mapping indices to labels
     """
+    backend = backend or MODEL_BACKEND
     if device is None:
         device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    if backend.endswith('_int8'):
+        device = torch.device('cpu')
 
     # instantiate model
     model = DualFruitCNN().to(device)
@@ -42,6 +150,7 @@ def load_model_checkpoint(checkpoint_path, device=None):
 
     model.load_state_dict(checkpoint['model_state_dict'])
     model.eval()
+    model = build_backend(model, backend)
 
     # retrieve the class maps you saved (these are plain dicts, not tensors)
     class_map = checkpoint.get('class_map', {
@@ -1,12 +1,24 @@
-from flask import Blueprint
-from .classification import bp as classification_bp
 from .inventory      import bp as inventory_bp
 from .barcode        import bp as barcode_bp
 from .confirm_product import bp as confirm_product_bp
+from .routing        import bp as routing_bp
+from .expiring       import bp as expiring_bp
+from .at_risk        import bp as at_risk_bp
+from .bulk_import    import bp as bulk_import_bp
+from .metrics        import bp as metrics_bp
 
 
-def register_blueprints(app):
-    app.register_blueprint(classification_bp, url_prefix='/api')
+def register_blueprints(app, classification=True):
+    if classification:
+        # imported here so barcode/inventory-only workers skip the ML/OpenAI imports
+        from .classification import bp as classification_bp
+        app.register_blueprint(classification_bp, url_prefix='/api')
     app.register_blueprint(inventory_bp,url_prefix='/api')
     app.register_blueprint(barcode_bp,url_prefix='/api')
-    app.register_blueprint(confirm_product_bp, url_prefix='/api')
\ No newline at end of file
+    app.register_blueprint(confirm_product_bp, url_prefix='/api')
+    app.register_blueprint(routing_bp, url_prefix='/api')
+    app.register_blueprint(expiring_bp, url_prefix='/api')
+    app.register_blueprint(at_risk_bp, url_prefix='/api')
+    app.register_blueprint(bulk_import_bp, url_prefix='/api')
+    # Prometheus scrapes /metrics by convention, outside /api
+    app.register_blueprint(metrics_bp)
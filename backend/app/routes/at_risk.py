@@ -0,0 +1,115 @@
+# app/routes/at_risk.py
+
+import os
+import numpy as np
+from flask import Blueprint, request, jsonify, current_app, abort
+from app.services.repository import get_repository
+
+bp = Blueprint('at_risk', __name__)
+
+# ── tweak these for your deployment ─────────────────────────────
+AT_RISK_DEFAULT_LIMIT = int(os.getenv('LASTBITE_AT_RISK_DEFAULT_LIMIT', 50))
+AT_RISK_MAX_LIMIT     = int(os.getenv('LASTBITE_AT_RISK_MAX_LIMIT', 500))
+# ----------------------------------------------------------------
+
+
+def _page_args():
+    """
+    (offset, limit, as_of, include_expired) from ?offset=, ?limit=, ?as_of=
+    (default today) and ?include_expired=, or an error response
+    """
+    try:
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', AT_RISK_DEFAULT_LIMIT))
+        as_of = np.datetime64(request.args.get('as_of') or 'today', 'D')
+    except ValueError:
+        return None, (jsonify({"error": "offset and limit must be integers, as_of a YYYY-MM-DD date"}), 400)
+    if offset < 0 or not 1 <= limit <= AT_RISK_MAX_LIMIT:
+        return None, (jsonify({"error": f"offset must not be negative, limit between 1 and {AT_RISK_MAX_LIMIT}"}), 400)
+    include_expired = request.args.get('include_expired', '0').lower() in ('1', 'true', 'yes')
+    return (offset, limit, as_of, include_expired), None
+
+
+@bp.route('/at-risk/<user_uid>', methods=['GET'])
+def at_risk_for_user(user_uid):
+    """
+    The dashboard's "use these first": a user's items at risk of going to
+    waste on ?as_of=, most urgent first, with remaining shelf life and risk
+    score, paginated with ?offset= and ?limit=. Items expired more than
+    RISK_EXPIRED_GRACE_DAYS ago are waste already; ?include_expired=1 lists
+    them too.
+    """
+    args, error = _page_args()
+    if error:
+        return error
+    offset, limit, as_of, include_expired = args
+
+    repo = get_repository()
+    try:
+        summary, page = repo.at_risk(user_uid, as_of, offset=offset, limit=limit,
+                                     include_expired=include_expired)
+        products = repo.get_products(product_uid for product_uid, _, _, _, _ in page)
+    except Exception as e:
+        current_app.logger.error(f"Error scoring waste risk from {repo}: {e}")
+        abort(500, 'could not read link data')
+
+    items = []
+    for product_uid, quantity, expiry, risk, state in page:
+        prod = products.get(product_uid) or {}
+        items.append({
+            'product_uid': product_uid,
+            'item_name': prod.get('item_name'),
+            'category': prod.get('category'),
+            'quantity': quantity,
+            'expiry_date': str(expiry),
+            'days_until_expiry': int((expiry - as_of).astype(int)),
+            'risk': risk,
+            'freshness': state,
+        })
+
+    total = summary['items']
+    next_offset = offset + len(items) if offset + len(items) < total else None
+    return jsonify({
+        'user_uid': user_uid,
+        'as_of': str(as_of),
+        'include_expired': include_expired,
+        'total': total,
+        'quantity': summary['quantity'],
+        'risk_total': summary['risk_total'],
+        'offset': offset,
+        'limit': limit,
+        'next_offset': next_offset,
+        'items': items
+    }), 200
+
+
+@bp.route('/at-risk', methods=['GET'])
+def at_risk_users():
+    """
+    Who to notify: users with items at risk on ?as_of=, the largest risk
+    total (risk × quantity over their items) first. ?include_expired= as
+    for a single user.
+    """
+    args, error = _page_args()
+    if error:
+        return error
+    offset, limit, as_of, include_expired = args
+
+    repo = get_repository()
+    try:
+        total, page = repo.at_risk_users(as_of, offset=offset, limit=limit, include_expired=include_expired)
+    except Exception as e:
+        current_app.logger.error(f"Error scoring waste risk from {repo}: {e}")
+        abort(500, 'could not read link data')
+
+    next_offset = offset + len(page) if offset + len(page) < total else None
+    return jsonify({
+        'as_of': str(as_of),
+        'include_expired': include_expired,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'next_offset': next_offset,
+        'users': [{'user_uid': u, 'items': items, 'quantity': quantity, 'risk_total': risk}
+                  for u, items, quantity, risk in page]
+    }), 200
@@ -1,33 +1,26 @@
 # app/routes/barcode.py
 
-import os
 import uuid
-import requests
-import pandas as pd
 from datetime import datetime, timedelta
 from flask import Blueprint, current_app, request, jsonify, abort
+from app.services.off_lookup import get_off_lookup
+from app.services.repository import get_repository
+from app.services.metrics import stage
+from app.services.waste_risk import DEFAULT_SHELF_LIFE, shelf_life_days
 
 bp = Blueprint('barcode', __name__)
 
-# ── tweak these for your project ────────────────────────────────
-PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-PRODUCTS_CSV = os.path.join(PROJECT_ROOT, 'data', 'products_table_v2.csv')
-LINKS_CSV    = os.path.join(PROJECT_ROOT, 'data', 'user_product_link_table_v2.csv')
-DEFAULT_SHELF_LIFE = {
-    "Dairy": 7, "Meat": 3, "Produce": 5, "Bakery": 2,
-    "Frozen": 180, "Canned Goods": 365, "Snacks": 120, "Beverages": 90,
-}
-# ----------------------------------------------------------------
-
-def load_products_df():
-    if os.path.exists(PRODUCTS_CSV):
-        return pd.read_csv(PRODUCTS_CSV, dtype=str)
-    return pd.DataFrame(columns=["barcode","name","category","expiry_date"])
-
-def load_links_df():
-    if os.path.exists(LINKS_CSV):
-        return pd.read_csv(LINKS_CSV, dtype=str)
-    return pd.DataFrame(columns=["user_id","product_id","scan_date","quantity"])
+# scan responses offer the catalog's categories plus the defaults; the union is
+# only re-sorted when the catalog gains a category
+_all_categories = ((), sorted(DEFAULT_SHELF_LIFE))
+
+def all_categories(repo):
+    global _all_categories
+    cats = repo.categories()
+    if _all_categories[0] is not cats:
+        _all_categories = (cats, sorted(set(cats) | set(DEFAULT_SHELF_LIFE)))
+    return _all_categories[1]
+
 @bp.route('/barcode/scan', methods=['POST'])
 def scan_barcode():
     data = request.get_json(silent=True) or {}
@@ -36,12 +29,12 @@ def scan_barcode():
         return jsonify({'error':'barcode required'}), 400
 
     today = datetime.today().strftime("%Y-%m-%d")
-    df = load_products_df()  # reads products_table_v2.csv
+    repo = get_repository()  # indexed barcode lookup, CSV or SQLite
 
     # 1) If already in catalog, return it immediately
-    existing = df[df['barcode'] == barcode]
-    if not existing.empty:
-        row = existing.iloc[0]
+    with stage('db_lookup'):
+        row = repo.product_by_barcode(barcode)
+    if row is not None:
         return jsonify({
             'barcode':      barcode,
             'item_name':    row['item_name'],
@@ -51,28 +44,18 @@ def scan_barcode():
             'already_exists': True
         }), 200
 
-    # 2) Fetch name from OpenFoodFacts
-    name = None
-    try:
-        r = requests.get(
-            f"https://world.openfoodfacts.org/api/v0/product/{barcode}.json",
-            timeout=5
-        )
-        j = r.json()
-        if j.get('status') == 1:
-            name = j['product'].get('product_name')
-    except Exception as e:
-        current_app.logger.warning(f"OFF error: {e}")
+    # 2) Fetch name from OpenFoodFacts (cached, pooled, coalesced; see off_lookup)
+    with stage('off_lookup'):
+        name = get_off_lookup().lookup(barcode)
     if not name:
         name = "Unknown product"
 
     # 3) Prepare categories list
-    existing_cats = sorted(df['category'].dropna().unique().tolist())
-    all_cats = sorted(set(existing_cats) | set(DEFAULT_SHELF_LIFE.keys()))
+    all_cats = all_categories(repo)
 
     # 4) Suggest expiry based on first default category
     default_cat = all_cats[0] if all_cats else 'Misc'
-    days = DEFAULT_SHELF_LIFE.get(default_cat, 30)
+    days = shelf_life_days(default_cat)
     suggested = (datetime.today() + timedelta(days=days)).strftime("%Y-%m-%d")
 
     return jsonify({
@@ -84,6 +67,11 @@ def scan_barcode():
         'already_exists':  False
     }), 200
 
+@bp.route('/barcode/off-stats', methods=['GET'])
+def off_stats():
+    """Hit ratio and upstream latency of the OpenFoodFacts lookup cache"""
+    return jsonify(get_off_lookup().stats()), 200
+
 @bp.route('/barcode/confirm', methods=['POST'])
 def confirm_barcode():
     data     = request.get_json(silent=True) or {}
@@ -95,17 +83,19 @@ def confirm_barcode():
         return jsonify({'error':'barcode, category & user_id required'}), 400
 
     today = datetime.today().strftime("%Y-%m-%d")
-    df   = load_products_df()
+    repo    = get_repository()
+    with stage('db_lookup'):
+        row = repo.product_by_barcode(barcode)
 
     # 1) Append to products if missing
-    if df[df['barcode'] == barcode].empty:
+    if row is None:
         # new product_uid
         uid = str(uuid.uuid4())
         # default expiry
-        days = DEFAULT_SHELF_LIFE.get(category, 30)
+        days = shelf_life_days(category)
         expiry = (datetime.today() + timedelta(days=days)).strftime("%Y-%m-%d")
 
-        df = df.append({
+        new_row = {
             'product_uid': uid,
             'product_id':  uid,
             'barcode':     barcode,
@@ -113,29 +103,29 @@ def confirm_barcode():
             'category':    category,
             'scanned_date': today,
             'expiry_date': expiry
-        }, ignore_index=True)
-
+        }
+        # group-committed journal append (CSV) or conditional insert (SQLite); if a
+        # concurrent confirm of the same barcode got there first, link to its product
         try:
-            df.to_csv(PRODUCTS_CSV, index=False)
+            with stage('db_write'):
+                row, _ = repo.get_or_add_product(new_row)
         except Exception as e:
             current_app.logger.error(f"Saving products CSV failed: {e}")
             abort(500, 'could not save product catalog')
-    else:
-        # existing uid & expiry
-        row = df[df['barcode'] == barcode].iloc[0]
-        uid = row['product_uid']
-        expiry = row['expiry_date']
+
+    # existing (or just added) uid & expiry
+    uid = row['product_uid']
+    expiry = row['expiry_date']
 
     # 2) Append to user–product links
-    links = load_links_df()
-    links = links.append({
-        'user_id':     user_id,
-        'product_id':  uid,
-        'scan_date':   today,
-        'quantity':    data.get('quantity', 1)
-    }, ignore_index=True)
     try:
-        links.to_csv(LINKS_CSV, index=False)
+        with stage('db_write'):
+            repo.add_link({
+                'user_uid':    user_id,
+                'product_uid': uid,
+                'scan_date':   today,
+                'quantity':    data.get('quantity', 1)
+            })
     except Exception as e:
         current_app.logger.error(f"Saving links CSV failed: {e}")
         abort(500, 'could not save user link')
@@ -0,0 +1,35 @@
+# app/routes/bulk_import.py
+
+from flask import Blueprint, request, jsonify, current_app
+from app.services.waste_risk import DEFAULT_SHELF_LIFE
+from app.services.bulk_import import BulkImport, read_csv, read_ndjson
+from app.services.repository import get_repository
+
+bp = Blueprint('bulk_import', __name__)
+
+READERS = {'csv': read_csv, 'ndjson': read_ndjson}
+
+
+@bp.route('/import', methods=['POST'])
+def bulk_import():
+    """
+    Bulk-load products and stock lines from a streamed CSV or NDJSON body
+    (?format=csv|ndjson, otherwise taken from the Content-Type). Columns:
+    product_uid or barcode (+ item_name, category, expiry_date for new
+    products), and optionally user_uid, quantity, scan_date for stock.
+    Rows are validated and committed in batches as they arrive; the reply
+    reports what was created, skipped as duplicate, or rejected and why.
+    """
+    fmt = request.args.get('format') or ('ndjson' if 'json' in (request.mimetype or '') else 'csv')
+    if fmt not in READERS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+
+    importer = BulkImport(get_repository(), DEFAULT_SHELF_LIFE)
+    try:
+        summary = importer.run(READERS[fmt](request.stream))
+    except Exception as e:
+        current_app.logger.error(f"Bulk import failed after row {importer.summary['rows']}: {e}")
+        return jsonify({"error": "import failed; rows before the current batch were saved",
+                        **importer.summary}), 500
+
+    return jsonify({"format": fmt, **summary}), 400 if summary['aborted'] else 200
@@ -1,78 +1,106 @@
-from flask import Blueprint, request, jsonify, send_file
-from app.services.classification_service import predict_fruit_state
-import numpy as np
-from PIL import Image
-import io
+from flask import Blueprint, request, jsonify, current_app
 import os
 import openai
-import base64
 import json
-import re
-import pandas as pd
-from datetime import datetime, timedelta
+from datetime import date, timedelta
+from app.services.repository import get_repository
+from app.services.result_cache import result_cache
+from app.services.vision_fallback import vision_fallback, FallbackUnavailable
+from app.services.cascade import get_cascade
+from app.services.metrics import stage
 
 bp = Blueprint('classification', __name__)
 
-# Load and cache the product database
-PRODUCTS_DB_PATH = '/Users/omprakashgunja/Documents/GitHub/lastbite-ai/backend/data/products_table_v2.csv'
-products_df = None
+# Upper bound on images in one /classify/batch request (one stacked tensor)
+CLASSIFY_BATCH_MAX_IMAGES = int(os.getenv('LASTBITE_CLASSIFY_BATCH_MAX_IMAGES', 64))
 
-def get_products_df():
-    """Load products database if not already loaded"""
-    global products_df
-    if products_df is None:
-        products_df = pd.read_csv(PRODUCTS_DB_PATH)
-    return products_df
+# The model stack (torch, weights) is imported on first use rather than when
+# the blueprint is registered, so barcode/inventory traffic never pays for it.
+# Predictions are cached by image content, so re-uploads skip decode + inference.
+def _upload_bytes(file_storage):
+    file_storage.stream.seek(0)
+    return file_storage.read()
+
+def predict_fruit_state(file_storage):
+    from app.services.classification_service import predict_image_bytes
+    img_bytes = _upload_bytes(file_storage)
+    return result_cache.get_or_compute('model', img_bytes, lambda: predict_image_bytes(img_bytes))
+
+def predict_fruit_states(images):
+    from app.services.classification_service import predict_fruit_states as predict
+    results = [result_cache.get('model', b) for b in images]
+    misses = [i for i, r in enumerate(results) if r is None]
+    if misses:
+        for i, r in zip(misses, predict([images[i] for i in misses])):
+            if not isinstance(r, Exception):
+                result_cache.put('model', images[i], r)
+            results[i] = r
+    return results
 
 def find_matching_products(item_name, state):
     """Find matching products in the database based on item name"""
-    df = get_products_df()
-    
-    # Case-insensitive match on item_name
-    matches = df[df['item_name'].str.lower() == item_name.lower()]
-    
-    if matches.empty:
+    with stage('db_enrichment'):
+        match = get_repository().product_by_name(item_name)
+    if match is None:
         return None
-    
+    row, expiry_date = match
+
     # Get current date
-    today = datetime.now().date()
-    
-    # Get the first matching product
-    product = matches.iloc[0].to_dict()
-    
+    today = date.today()
+
+    # Copy of the first matching product; the CSV backend's row is shared
+    product = dict(row)
+
     # If item is rotten but has a future expiry date, override it to be expiring soon
-    if state.lower() == 'rotten' and 'expiry_date' in product and product['expiry_date']:
+    if state.lower() == 'rotten' and product.get('expiry_date'):
         # Store original expiry
         product['original_expiry'] = product['expiry_date']
-        
+
         # Set expiry to yesterday or today
-        product['expiry_date'] = (today - timedelta(days=1)).strftime('%Y-%m-%d')
+        expiry_date = today - timedelta(days=1)
+        product['expiry_date'] = expiry_date.strftime('%Y-%m-%d')
         product['expiry_overridden'] = True
-    
-    # Calculate days until expiry
-    if 'expiry_date' in product and product['expiry_date']:
-        try:
-            expiry_date = datetime.strptime(product['expiry_date'], '%Y-%m-%d').date()
-            product['days_until_expiry'] = (expiry_date - today).days
-        except ValueError:
-            product['days_until_expiry'] = None
-    else:
-        product['days_until_expiry'] = None
-    
+
+    # Calculate days until expiry (the repository returns it already parsed)
+    product['days_until_expiry'] = (expiry_date - today).days if expiry_date else None
+
     return product
 
+def record_classification(result):
+    """
+    Keep the verdict as the latest freshness of a user's item when the
+    upload names one (form fields user_uid and product_uid); waste-risk
+    scoring reads it. A failed write is logged, the response still goes out.
+    """
+    user_uid, product_uid = request.form.get('user_uid'), request.form.get('product_uid')
+    if not (user_uid and product_uid and result.get('state')):
+        return
+    try:
+        with stage('db_write'):
+            get_repository().add_classification({
+                'user_uid': user_uid,
+                'product_uid': product_uid,
+                'state': result['state'],
+                'confidence': result.get('confidence', ''),
+                'classified_date': date.today().isoformat(),
+                'source': result.get('source', 'model'),
+            })
+    except Exception as e:
+        current_app.logger.error(f"Could not record classification of {user_uid}/{product_uid}: {e}")
+
 
 @bp.route("/classify/model", methods=["POST"])
 def classify_with_model():
     """Classify fruit using custom trained model"""
-    print("Received request for model classification")
-    print(request.files)
-    
+    with stage('upload'):
+        files = request.files
+    current_app.logger.debug("model classification request: %s", files)
+
     # make sure 'image' is in the form data
-    if "image" not in request.files:
+    if "image" not in files:
         return jsonify({"error": "no image uploaded"}), 400
 
-    img = request.files["image"]
+    img = files["image"]
     try:
         # Get prediction from our model
         result = predict_fruit_state(img)
@@ -82,59 +110,83 @@ def classify_with_model():
             db_info = find_matching_products(result['fruit'], result['state'])
             if db_info:
                 result['product_info'] = db_info
-        
+
+        record_classification(result)
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@bp.route("/classify/batch", methods=["POST"])
+def classify_batch():
+    """Classify many fruit images (e.g. a whole crate) sent in one multipart request"""
+    with stage('upload'):
+        files = request.files.getlist("images") or request.files.getlist("image")
+    if not files:
+        return jsonify({"error": "no images uploaded"}), 400
+    if len(files) > CLASSIFY_BATCH_MAX_IMAGES:
+        return jsonify({"error": f"at most {CLASSIFY_BATCH_MAX_IMAGES} images per batch"}), 413
+
+    try:
+        predictions = predict_fruit_states([f.read() for f in files])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    # Enrich once per distinct prediction, not once per image
+    product_info = {}
+    results = []
+    for i, (f, pred) in enumerate(zip(files, predictions)):
+        item = {"index": i, "filename": f.filename}
+        if isinstance(pred, Exception):
+            item["error"] = f"could not read image: {pred}"
+            results.append(item)
+            continue
+
+        item.update(pred)
+        key = (pred['fruit'], pred['state'])
+        try:
+            if key not in product_info:
+                product_info[key] = find_matching_products(*key)
+            if product_info[key]:
+                item['product_info'] = product_info[key]
+        except Exception as e:
+            product_info.pop(key, None)
+            item["error"] = f"product lookup failed: {e}"
+        results.append(item)
+
+    return jsonify({
+        "results": results,
+        "count": len(results),
+        "errors": sum(1 for r in results if "error" in r)
+    }), 200
+
+
 @bp.route("/classify/openai", methods=["POST"])
 def classify_with_openai():
     """Classify fruit using OpenAI vision model"""
-    print("Received request for OpenAI classification")
-    print(request.files)
-    
+    with stage('upload'):
+        files = request.files
+    current_app.logger.debug("OpenAI classification request: %s", files)
+
     # make sure 'image' is in the form data
-    if "image" not in request.files:
+    if "image" not in files:
         return jsonify({"error": "no image uploaded"}), 400
 
-    img = request.files["image"]
+    img = files["image"]
     try:
         # Reset file cursor
         img.seek(0)
         
         try:
-            # Create OpenAI client
-            client = openai.OpenAI(api_key = os.getenv("OPENAI_API_KEY"))
-            
-            # Read and encode image
+            # Read image
             img_data = img.read()
-            print(f"Image size: {len(img_data)} bytes")
-            encoded_img = base64.b64encode(img_data).decode('utf-8')
-            
-            # Call OpenAI API
-            print("Calling OpenAI API...")
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": "Identify this fruit and tell me if it's fresh or rotten. Reply with JSON only: {\"fruit\": \"name\", \"state\": \"fresh or rotten\"}"},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_img}"}}
-                        ]
-                    }
-                ],
-                max_tokens=300
-            )
-            print("OpenAI API response received")
-            
-            openai_text = response.choices[0].message.content.strip()
-            print(f"OpenAI response: {openai_text}")
+            current_app.logger.debug("image size: %d bytes", len(img_data))
+
+            # Call OpenAI API (or reuse the answer for an identical upload)
+            with stage('openai'):
+                result, openai_text = vision_fallback.classify(img_data)
             
-            json_match = re.search(r'\{.*\}', openai_text, re.DOTALL)
-            if json_match:
-                result = json.loads(json_match.group(0))
+            if result is not None:
                 result["source"] = "openai"
                 
                 # Enrich with database information
@@ -147,33 +199,55 @@ def classify_with_openai():
             else:
                 return jsonify({"error": "OpenAI response format not as expected", "raw_response": openai_text}), 400
         
+        except FallbackUnavailable as e:
+            current_app.logger.info(f"OpenAI call skipped: {e.reason}")
+            return jsonify({"error": str(e), "reason": e.reason}), 503
         except openai.OpenAIError as e:
-            print(f"OpenAI API error: {str(e)}")
+            current_app.logger.error(f"OpenAI API error: {str(e)}")
             return jsonify({"error": f"OpenAI API error: {str(e)}"}), 500
         except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {str(e)}")
+            current_app.logger.error(f"JSON parsing error: {str(e)}")
             return jsonify({"error": f"Failed to parse OpenAI response as JSON: {str(e)}"}), 500
         except Exception as e:
-            print(f"Unexpected error in OpenAI processing: {str(e)}")
+            current_app.logger.error(f"Unexpected error in OpenAI processing: {str(e)}")
             return jsonify({"error": f"Error processing OpenAI request: {str(e)}"}), 500
                 
     except Exception as e:
-        print(f"General error in classify_with_openai: {str(e)}")
+        current_app.logger.error(f"General error in classify_with_openai: {str(e)}")
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
 
+@bp.route("/classify/cache-stats", methods=["GET"])
+def classify_cache_stats():
+    """Hit/miss counters of the classification result cache, per source"""
+    return jsonify(result_cache.stats()), 200
+
+
+@bp.route("/classify/fallback-stats", methods=["GET"])
+def classify_fallback_stats():
+    """Call, skip and coalescing counters plus circuit state of the OpenAI fallback"""
+    return jsonify(vision_fallback.stats()), 200
+
+
+@bp.route("/classify/cascade-stats", methods=["GET"])
+def classify_cascade_stats():
+    """How often /classify was answered locally vs. by the fallback, and the budget left"""
+    return jsonify(get_cascade().stats()), 200
+
+
 # Keep the original combined endpoint for backward compatibility
 @bp.route("/classify", methods=["POST"])
 def classify():
     """Classify fruit using model with OpenAI fallback"""
-    print("Received request for classification with fallback")
-    print(request.files)
-    
+    with stage('upload'):
+        files = request.files
+    current_app.logger.debug("classification request with fallback: %s", files)
+
     # make sure 'image' is in the form data
-    if "image" not in request.files:
+    if "image" not in files:
         return jsonify({"error": "no image uploaded"}), 400
 
-    img = request.files["image"]
+    img = files["image"]
     try:
         # Get prediction from our model
         result = predict_fruit_state(img)
@@ -184,42 +258,24 @@ def classify():
             if db_info:
                 result['product_info'] = db_info
         
-        # Check if confidence is below threshold
-        confidence_threshold = 0.6  # Adjust as needed
-        if result.get('confidence', 1.0) < confidence_threshold:
+        # Ask OpenAI only when a head is unsure and the fallback budget allows it;
+        # an answer already cached for these bytes is used without spending the budget
+        cascade = get_cascade()
+        tier, cached = cascade.decide(result, cached=lambda: vision_fallback.cached(_upload_bytes(img)))
+        if tier == 'over_budget':
+            result["note"] = "Low confidence, OpenAI fallback skipped: budget"
+        elif tier == 'fallback':
             # Use OpenAI API for a secondary prediction
-            
-            # Reset file cursor
-            img.seek(0)
-            
-            # Create OpenAI client
-            client = openai.OpenAI(api_key= os.getenv("OPENAI_API_KEY"))
-            
-            # Read and encode image
-            img_data = img.read()
-            encoded_img = base64.b64encode(img_data).decode('utf-8')
-            
-            # Call OpenAI API
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": "Identify this fruit and tell me if it's fresh or rotten. Reply with JSON only: {\"fruit\": \"name\", \"state\": \"fresh or rotten\"}"},
-                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_img}"}}
-                        ]
-                    }
-                ],
-                max_tokens=300
-            )
-            
+            tier = 'fallback_failed'
+
             try:
-                openai_text = response.choices[0].message.content.strip()
-                json_match = re.search(r'\{.*\}', openai_text, re.DOTALL)
-                if json_match:
-                    openai_result = json.loads(json_match.group(0))
-                    
+                if cached is not None:
+                    openai_result = cached
+                else:
+                    # Call OpenAI API
+                    with stage('openai'):
+                        openai_result, _ = vision_fallback.classify(_upload_bytes(img), use_cache=False)
+                if openai_result is not None:
                     # Check if OpenAI result differs from our model's prediction
                     new_result = {
                         "fruit": openai_result.get("fruit", result.get("fruit")),
@@ -238,11 +294,17 @@ def classify():
                         new_result['product_info'] = result['product_info']
                     
                     result = new_result
+                    tier = 'fallback'
                 else:
                     result["note"] = "Low confidence, OpenAI response format not as expected"
+            except FallbackUnavailable as e:
+                # upstream slow/failing or out of time: answer with the local model
+                result["note"] = f"Low confidence, OpenAI fallback skipped: {e.reason}"
             except Exception as e:
                 result["note"] = f"Low confidence, OpenAI fallback failed: {str(e)}"
-                
+
+        cascade.record(tier)
+        record_classification(result)
         return jsonify(result), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
\ No newline at end of file
@@ -0,0 +1,76 @@
+# app/routes/expiring.py
+
+import os
+import numpy as np
+from flask import Blueprint, request, jsonify, current_app, abort
+from app.services.repository import get_repository
+
+bp = Blueprint('expiring', __name__)
+
+# ── tweak these for your deployment ─────────────────────────────
+EXPIRING_DEFAULT_DAYS  = int(os.getenv('LASTBITE_EXPIRING_DEFAULT_DAYS', 3))
+EXPIRING_DEFAULT_LIMIT = int(os.getenv('LASTBITE_EXPIRING_DEFAULT_LIMIT', 50))
+EXPIRING_MAX_LIMIT     = int(os.getenv('LASTBITE_EXPIRING_MAX_LIMIT', 500))
+# ----------------------------------------------------------------
+
+
+def _expiring(user_uid=None):
+    """
+    Items expiring within ?days= (default 3) of ?as_of= (default today), most
+    urgent first, paginated with ?offset= and ?limit=. ?include_expired=1
+    also returns items already past their expiry date.
+    """
+    try:
+        days = int(request.args.get('days', EXPIRING_DEFAULT_DAYS))
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', EXPIRING_DEFAULT_LIMIT))
+        as_of = np.datetime64(request.args.get('as_of') or 'today', 'D')
+    except ValueError:
+        return jsonify({"error": "days, offset and limit must be integers, as_of a YYYY-MM-DD date"}), 400
+    if days < 0 or offset < 0 or not 1 <= limit <= EXPIRING_MAX_LIMIT:
+        return jsonify({"error": f"days and offset must not be negative, limit between 1 and {EXPIRING_MAX_LIMIT}"}), 400
+    include_expired = request.args.get('include_expired', '0').lower() in ('1', 'true', 'yes')
+
+    repo = get_repository()
+    try:
+        total, page = repo.expiring(None if include_expired else as_of, as_of + days,
+                                    user_uid=user_uid, offset=offset, limit=limit)
+        products = repo.get_products(product_uid for _, product_uid, _, _ in page)
+    except Exception as e:
+        current_app.logger.error(f"Error reading links from {repo}: {e}")
+        abort(500, 'could not read link data')
+
+    items = []
+    for link_user, product_uid, quantity, expiry in page:
+        prod = products.get(product_uid) or {}
+        items.append({
+            'user_uid': link_user,
+            'product_uid': product_uid,
+            'item_name': prod.get('item_name'),
+            'category': prod.get('category'),
+            'quantity': quantity,
+            'expiry_date': str(expiry),
+            'days_until_expiry': int((expiry - as_of).astype(int)),
+        })
+
+    next_offset = offset + len(items) if offset + len(items) < total else None
+    return jsonify({
+        'user_uid': user_uid,
+        'as_of': str(as_of),
+        'days': days,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'next_offset': next_offset,
+        'items': items
+    }), 200
+
+
+@bp.route('/expiring', methods=['GET'])
+def expiring_all_users():
+    return _expiring()
+
+
+@bp.route('/expiring/<user_uid>', methods=['GET'])
+def expiring_for_user(user_uid):
+    return _expiring(user_uid)
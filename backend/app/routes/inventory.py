@@ -1,60 +1,155 @@
 # app/routes/inventory.py
 
 import os
-import csv
-from flask import Blueprint, current_app, jsonify, abort
+import json
+import base64
+import binascii
+from itertools import islice
+from flask import Blueprint, Response, current_app, jsonify, abort, request, stream_with_context
+from app.services.product_catalog import PRODUCT_FIELDS
+from app.services.repository import get_repository
 
 bp = Blueprint('inventory', __name__)
 
-PROJECT_ROOT = os.path.abspath(
-    os.path.join(os.path.dirname(__file__), '..', '..')
-)
-DATA_DIR      = os.path.join(PROJECT_ROOT, 'data')
-LINK_FILE     = os.path.join(DATA_DIR, 'user_product_link_table_v2.csv')
-PRODUCTS_FILE = os.path.join(DATA_DIR, 'products_table_v2.csv')
+# ── tweak these for your deployment ─────────────────────────────
+INVENTORY_MAX_LIMIT  = int(os.getenv('LASTBITE_INVENTORY_MAX_LIMIT', 1000))   # items per page
+INVENTORY_JOIN_CHUNK = int(os.getenv('LASTBITE_INVENTORY_JOIN_CHUNK', 500))   # links joined per product fetch
+# ----------------------------------------------------------------
+
+INVENTORY_FIELDS = PRODUCT_FIELDS + ['quantity']
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(str(position).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        return int(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def _joined(repo, user_uid, after, fields):
+    """
+    (position, item) for the user's links after `after`, joined with their
+    products a chunk at a time; item is None when the product is missing.
+    """
+    links = repo.iter_links(user_uid, after=after)
+    while True:
+        chunk = list(islice(links, INVENTORY_JOIN_CHUNK))
+        if not chunk:
+            return
+        products = repo.get_products(link['product_uid'] for _, link in chunk)
+        for position, link in chunk:
+            prod = products.get(link['product_uid'])
+            if prod is None:
+                current_app.logger.warning(f"Missing product {link['product_uid']}")
+                yield position, None
+                continue
+            item = {**prod, 'quantity': link['quantity']}
+            yield position, {f: item.get(f) for f in fields} if fields else item
+
+
+def _stream(joined, limit, mode, user_uid, paged):
+    """
+    Serialize items as they are joined: NDJSON lines, or one JSON document
+    in pieces. Written out a join chunk at a time, not per item. A paged
+    NDJSON stream ends with a {"next_cursor": ...} line.
+    """
+    # one encoder with the app's JSON settings; provider.dumps builds a new one per call
+    provider = current_app.json
+    dumps = json.JSONEncoder(sort_keys=provider.sort_keys, ensure_ascii=provider.ensure_ascii,
+                             default=provider.default).encode
+    count, last, parts = 0, None, []
+    if mode == 'json':
+        parts.append('{"user_uid": ' + dumps(user_uid) + ', "inventory": [')
+    try:
+        for position, item in joined:
+            if limit is not None and count == limit:
+                break
+            last = position
+            if item is None:
+                continue
+            if mode == 'json':
+                parts.append((',' if count else '') + dumps(item))
+            else:
+                parts.append(dumps(item) + '\n')
+            count += 1
+            if len(parts) >= INVENTORY_JOIN_CHUNK:
+                yield ''.join(parts)
+                parts = []
+        else:
+            last = None       # ran out of links: no next page
+    except Exception as e:
+        # headers are long gone; log and end the body early
+        current_app.logger.error(f"Inventory stream for {user_uid} failed: {e}")
+    next_cursor = dumps(encode_cursor(last) if last is not None else None)
+    if mode == 'json':
+        parts.append('], "next_cursor": ' + next_cursor + '}')
+    elif paged:
+        parts.append('{"next_cursor": ' + next_cursor + '}\n')
+    if parts:
+        yield ''.join(parts)
+
 
 @bp.route('/inventory/<user_uid>', methods=['GET'])
 def get_inventory(user_uid):
-    # Load user–product links for this user
-    links = []
+    """
+    A user's products joined with their quantities, oldest first.
+
+    ?fields=item_name,expiry_date returns only those fields. ?limit= pages
+    the result: the reply carries next_cursor, passed back as ?cursor= for
+    the next page. ?stream=ndjson (one item per line) or ?stream=json (the
+    usual document, sent in chunks) serializes items as they are joined
+    instead of building the whole list first; a paged NDJSON stream ends
+    with a {"next_cursor": ...} line after the items.
+    """
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()]
+    unknown = set(fields) - set(INVENTORY_FIELDS)
+    if unknown:
+        return jsonify({"error": f"unknown fields {sorted(unknown)}; choose from {INVENTORY_FIELDS}"}), 400
+
     try:
-        with open(LINK_FILE, newline='') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row.get('user_uid') == user_uid:
-                    # Safely parse quantity
-                    qty_str = row.get('quantity', '').strip()
-                    try:
-                        qty = int(qty_str)
-                    except (ValueError, TypeError):
-                        qty = 0
-                    links.append({
-                        'product_uid': row.get('product_uid'),
-                        'quantity': qty
-                    })
-    except Exception as e:
-        current_app.logger.error(f"Error reading {LINK_FILE}: {e}")
-        abort(500, 'could not read link data')
+        limit = request.args.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if limit is not None and not 1 <= limit <= INVENTORY_MAX_LIMIT:
+        return jsonify({"error": f"limit must be between 1 and {INVENTORY_MAX_LIMIT}"}), 400
 
-    # Load product details
-    products = {}
+    after = None
+    if request.args.get('cursor'):
+        after = decode_cursor(request.args['cursor'])
+        if after is None:
+            return jsonify({"error": "invalid cursor"}), 400
+
+    mode = request.args.get('stream')
+    if mode not in (None, 'ndjson', 'json'):
+        return jsonify({"error": "stream must be ndjson or json"}), 400
+
+    repo = get_repository()
+    joined = _joined(repo, user_uid, after, fields)
+    if mode is not None:
+        mimetype = 'application/x-ndjson' if mode == 'ndjson' else 'application/json'
+        paged = limit is not None or after is not None
+        return Response(stream_with_context(_stream(joined, limit, mode, user_uid, paged)), mimetype=mimetype)
+
+    # User–product links for this user, joined with product details
+    inventory, next_cursor, last = [], None, None
     try:
-        with open(PRODUCTS_FILE, newline='') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                products[row['product_uid']] = row
+        for position, item in joined:
+            if limit is not None and len(inventory) == limit:
+                next_cursor = encode_cursor(last)
+                break
+            last = position
+            if item is not None:
+                inventory.append(item)
     except Exception as e:
-        current_app.logger.error(f"Error reading {PRODUCTS_FILE}: {e}")
-        abort(500, 'could not read product data')
-
-    # Build joined inventory
-    inventory = []
-    for link in links:
-        prod = products.get(link['product_uid'])
-        if prod:
-            item = {**prod, 'quantity': link['quantity']}
-            inventory.append(item)
-        else:
-            current_app.logger.warning(f"Missing product {link['product_uid']}")
+        current_app.logger.error(f"Error reading inventory from {repo}: {e}")
+        abort(500, 'could not read inventory data')
 
-    return jsonify({'user_uid': user_uid, 'inventory': inventory})
\ No newline at end of file
+    body = {'user_uid': user_uid, 'inventory': inventory}
+    if limit is not None or after is not None:
+        body['next_cursor'] = next_cursor
+    return jsonify(body)
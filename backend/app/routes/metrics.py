@@ -0,0 +1,17 @@
+# app/routes/metrics.py
+
+from flask import Blueprint, Response
+from app.services.metrics import render
+
+bp = Blueprint('metrics', __name__)
+
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Request and per-stage latency histograms and counters, in the Prometheus
+    text format. Under serve.py they are summed over every worker, whichever
+    one answers the scrape (the others' values are at most
+    LASTBITE_METRICS_FLUSH_S old); under run.py they are this process's.
+    """
+    return Response(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,97 @@
+# app/routes/routing.py
+
+import os
+import math
+from flask import Blueprint, request, jsonify, current_app, abort
+from app.services.geo_index import parse_coordinates
+from app.services.repository import get_repository
+
+bp = Blueprint('routing', __name__)
+
+# ── tweak these for your deployment ─────────────────────────────
+ROUTING_DEFAULT_K = int(os.getenv('LASTBITE_ROUTING_DEFAULT_K', 5))
+ROUTING_MAX_K     = int(os.getenv('LASTBITE_ROUTING_MAX_K', 100))
+# ----------------------------------------------------------------
+
+
+def _read(query, *args, **kwargs):
+    try:
+        return query(*args, **kwargs)
+    except Exception as e:
+        current_app.logger.error(f"Error reading users from {get_repository()}: {e}")
+        abort(500, 'could not read location data')
+
+
+@bp.route('/routing/nearest', methods=['GET'])
+def nearest():
+    """
+    Nearest users to a point (?lat=&lng=) or to a user's location (?user_uid=).
+    ?k= caps the results; with ?radius_km= only users inside the radius are
+    returned. Distances are great-circle (haversine) km, closest first.
+    """
+    repo = get_repository()
+    user_uid = request.args.get('user_uid')
+    if user_uid:
+        origin = _read(repo.location_of, user_uid)
+        if origin is None:
+            return jsonify({"error": f"User {user_uid} not found or has no location"}), 404
+    else:
+        origin = parse_coordinates(request.args.get('lat'), request.args.get('lng'))
+        if origin is None:
+            return jsonify({"error": "Provide user_uid, or lat and lng in degrees"}), 400
+
+    try:
+        k = int(request.args.get('k', ROUTING_DEFAULT_K))
+        radius_km = request.args.get('radius_km')
+        radius_km = float(radius_km) if radius_km is not None else None
+    except ValueError:
+        return jsonify({"error": "k must be an integer and radius_km a number"}), 400
+    if not 1 <= k <= ROUTING_MAX_K:
+        return jsonify({"error": f"k must be between 1 and {ROUTING_MAX_K}"}), 400
+    # float() also takes 'nan' and 'inf', which no radius search can use
+    if radius_km is not None and not (math.isfinite(radius_km) and radius_km >= 0):
+        return jsonify({"error": "radius_km must be a finite, non-negative number"}), 400
+
+    if radius_km is None:
+        results = _read(repo.nearest_users, *origin, k=k, exclude_user=user_uid)
+    else:
+        results = _read(repo.users_within, *origin, radius_km, limit=k, exclude_user=user_uid)
+
+    return jsonify({
+        "origin": {"user_uid": user_uid, "location_lat": origin[0], "location_lng": origin[1]},
+        "radius_km": radius_km,
+        "results": results,
+        "count": len(results)
+    }), 200
+
+
+@bp.route('/routing/locations', methods=['POST'])
+def update_location():
+    """Record a user's current location; the spatial index picks it up without a rebuild"""
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "No JSON payload provided"}), 400
+
+    user_uid = data.get('user_uid')
+    coords = parse_coordinates(data.get('location_lat'), data.get('location_lng'))
+    if not user_uid or coords is None:
+        return jsonify({"error": "Missing user_uid, or location_lat/location_lng out of range"}), 400
+
+    # a move keeps the rest of the user's row
+    repo = get_repository()
+    known = _read(repo.get_user, user_uid) or {}
+    row = {
+        'user_uid': user_uid,
+        'user_id': data.get('user_id', known.get('user_id') or ''),
+        'user_name': data.get('user_name', known.get('user_name') or ''),
+        'location_lat': str(coords[0]),
+        'location_lng': str(coords[1]),
+        'points_awarded': str(data.get('points_awarded', known.get('points_awarded') or '')),
+    }
+    try:
+        repo.save_user(row)
+    except Exception as e:
+        current_app.logger.error(f"Failed to save location: {e}")
+        abort(500, "could not save location data")
+
+    return jsonify({**row, "status": "updated"}), 201
@@ -0,0 +1,206 @@
+# app/services/bulk_import.py
+
+import io
+import os
+import csv
+import json
+import time
+import uuid
+from datetime import date, timedelta
+
+from app.services.product_catalog import parse_date
+
+# ── tweak these for your deployment ─────────────────────────────
+IMPORT_BATCH_ROWS  = int(os.getenv('LASTBITE_IMPORT_BATCH_ROWS', 5000))    # rows per durable write
+IMPORT_MAX_ERRORS  = int(os.getenv('LASTBITE_IMPORT_MAX_ERRORS', 1000))    # errors listed in the report
+IMPORT_USER_CACHE  = int(os.getenv('LASTBITE_IMPORT_USER_CACHE', 100_000)) # user existence lookups remembered
+# ----------------------------------------------------------------
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_csv(stream):
+    """Rows of a CSV byte stream, decoded and parsed as they arrive"""
+    text = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8-sig', newline='')
+    yield from csv.DictReader(text)
+
+
+def read_ndjson(stream):
+    """One JSON object per line; a malformed line yields a RowError in its place"""
+    for line in io.BufferedReader(stream):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield RowError(f"invalid JSON: {e}")
+            continue
+        yield row if isinstance(row, dict) else RowError("expected a JSON object")
+
+
+class BulkImport:
+    """
+    Streams product and stock rows into the repository.
+
+    Each row names a product by `product_uid` (must exist) or by `barcode`
+    (matched against the catalog, or created from item_name/category/
+    expiry_date). With a `user_uid` it also becomes a stock line: the user
+    must exist, and a user–product link that already exists — in storage or
+    earlier in the same import — is skipped as a duplicate. Valid rows are
+    written IMPORT_BATCH_ROWS at a time, so memory stays bounded by the
+    batch, not the upload. Bad rows are reported and skipped.
+    """
+
+    def __init__(self, repo, shelf_life, batch_rows=IMPORT_BATCH_ROWS, max_errors=IMPORT_MAX_ERRORS):
+        self.repo = repo
+        self.shelf_life = shelf_life
+        self.batch_rows = batch_rows
+        self.max_errors = max_errors
+        self.today = date.today()
+        self._products = []           # batch: new product rows
+        self._new_barcodes = {}       # batch: barcode -> new product row
+        self._links = []              # batch: new link rows
+        self._new_links = set()       # batch: (user_uid, product_uid)
+        self._users = {}              # user_uid -> exists?
+        self.summary = {
+            'rows': 0, 'products_created': 0, 'links_created': 0, 'duplicate_links': 0,
+            'rejected': 0, 'batches': 0, 'errors': [], 'errors_truncated': False, 'aborted': None,
+        }
+
+    def run(self, rows):
+        """Import an iterable of row dicts (or RowErrors); returns the summary"""
+        t0 = time.perf_counter()
+        try:
+            for n, row in enumerate(rows, 1):
+                self.summary['rows'] = n
+                try:
+                    if isinstance(row, RowError):
+                        raise row
+                    self._stage(row)
+                except RowError as e:
+                    self._reject(n, str(e))
+                if len(self._products) + len(self._links) >= self.batch_rows:
+                    self.flush()
+        except (csv.Error, UnicodeDecodeError) as e:
+            # the body itself is broken: keep what was read so far, stop there
+            self.summary['aborted'] = f"unreadable input after row {self.summary['rows']}: {e}"
+        self.flush()
+        self.summary['elapsed_s'] = round(time.perf_counter() - t0, 3)
+        return self.summary
+
+    def _reject(self, n, error):
+        self.summary['rejected'] += 1
+        if len(self.summary['errors']) < self.max_errors:
+            self.summary['errors'].append({'row': n, 'error': error})
+        else:
+            self.summary['errors_truncated'] = True
+
+    def _field(self, row, name):
+        value = row.get(name)
+        return str(value).strip() if value is not None else ''
+
+    def _stage(self, row):
+        # every check runs before anything is staged: a rejected row creates nothing
+        product, new = self._resolve_product(row)
+        user_uid = self._field(row, 'user_uid') or self._field(row, 'user_id')
+        if not user_uid:
+            if new:
+                self._add_product(product)
+            return      # catalog-only row
+        quantity = self._field(row, 'quantity') or '1'
+        if not quantity.isdecimal():
+            raise RowError(f"quantity must be a non-negative integer, got {quantity!r}")
+        scan_date = self._field(row, 'scan_date')
+        if not scan_date:
+            scan_date = self.today.isoformat()
+        elif parse_date(scan_date) is None:
+            raise RowError(f"scan_date must be YYYY-MM-DD, got {scan_date!r}")
+        if not self._user_exists(user_uid):
+            raise RowError(f"user {user_uid} not found")
+
+        if new:
+            self._add_product(product)
+        product_uid = product['product_uid']
+        if (user_uid, product_uid) in self._new_links or self.repo.has_link(user_uid, product_uid):
+            self.summary['duplicate_links'] += 1
+            return
+        self._new_links.add((user_uid, product_uid))
+        self._links.append({'user_uid': user_uid, 'product_uid': product_uid,
+                            'scan_date': scan_date, 'quantity': quantity})
+
+    def _resolve_product(self, row):
+        """(product, new): the row's existing product, or one to create once the whole row is accepted"""
+        product_uid = self._field(row, 'product_uid')
+        if product_uid:
+            product = self.repo.get_product(product_uid)
+            if product is None:
+                raise RowError(f"product {product_uid} not found")
+            return product, False
+
+        barcode = self._field(row, 'barcode')
+        if not barcode:
+            raise RowError("product_uid or barcode required")
+        product = self._new_barcodes.get(barcode) or self.repo.product_by_barcode(barcode)
+        if product is not None:
+            return product, False
+
+        category = self._field(row, 'category')
+        if not category:
+            raise RowError(f"barcode {barcode} is not in the catalog and the row has no category")
+        expiry = self._field(row, 'expiry_date')
+        if expiry and parse_date(expiry) is None:
+            raise RowError(f"expiry_date must be YYYY-MM-DD, got {expiry!r}")
+        if not expiry:
+            expiry = (self.today + timedelta(days=self.shelf_life.get(category, 30))).isoformat()
+        uid = str(uuid.uuid4())
+        product = {
+            'product_uid': uid,
+            'product_id': self._field(row, 'product_id') or uid,
+            'barcode': barcode,
+            'item_name': self._field(row, 'item_name') or 'Unknown product',
+            'category': category,
+            'scanned_date': self.today.isoformat(),
+            'expiry_date': expiry,
+        }
+        return product, True
+
+    def _add_product(self, product):
+        self._products.append(product)
+        self._new_barcodes[product['barcode']] = product
+
+    def _user_exists(self, user_uid):
+        known = self._users.get(user_uid)
+        if known is None:
+            if len(self._users) >= IMPORT_USER_CACHE:
+                self._users.clear()
+            known = self._users[user_uid] = self.repo.get_user(user_uid) is not None
+        return known
+
+    def flush(self):
+        """
+        Write the staged batch: products first, so no link points at a missing
+        product. Both go through the atomic check-and-insert, since a confirm
+        or another import may have added the same barcode or link since the
+        row was staged; links to a product that lost that race move to the
+        one that won.
+        """
+        if self._products:
+            moved = {}
+            for staged, (product, created) in zip(self._products, self.repo.get_or_add_products(self._products)):
+                if created:
+                    self.summary['products_created'] += 1
+                else:
+                    moved[staged['product_uid']] = product['product_uid']
+            for link in self._links:
+                link['product_uid'] = moved.get(link['product_uid'], link['product_uid'])
+        if self._links:
+            added = sum(self.repo.add_links(self._links, unique=True))
+            self.summary['links_created'] += added
+            self.summary['duplicate_links'] += len(self._links) - added
+        if self._products or self._links:
+            self.summary['batches'] += 1
+        self._products, self._new_barcodes = [], {}
+        self._links, self._new_links = [], set()
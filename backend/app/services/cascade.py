@@ -0,0 +1,137 @@
+# app/services/cascade.py
+
+import os
+import time
+import threading
+import multiprocessing
+
+from app.services.metrics import Counter
+
+# ── tweak these for your deployment ─────────────────────────────
+# /classify asks the OpenAI fallback when a head's calibrated confidence is below its threshold
+CASCADE_FRUIT_THRESHOLD = float(os.getenv('LASTBITE_CASCADE_FRUIT_THRESHOLD', 0.6))
+CASCADE_STATE_THRESHOLD = float(os.getenv('LASTBITE_CASCADE_STATE_THRESHOLD', 0.6))
+# fallback calls per minute, shared by the workers serve.py forks (0 = never fall back, -1 = no cap)
+CASCADE_FALLBACK_PER_MIN = float(os.getenv('LASTBITE_CASCADE_FALLBACK_PER_MIN', 60))
+# ----------------------------------------------------------------
+
+# how a /classify request was answered
+#   local            the model was confident enough
+#   fallback         the model wasn't; OpenAI answered
+#   over_budget      the model wasn't, but the fallback budget was spent
+#   fallback_failed  the model wasn't, and the fallback was skipped or failed
+TIERS = ('local', 'fallback', 'over_budget', 'fallback_failed')
+
+CLASSIFY_TIER = Counter('lastbite_classify_tier_total', 'Which tier answered /classify', ('tier',))
+
+
+class FallbackBudget:
+    """
+    Token bucket of fallback calls: refills at `per_minute` a minute and
+    holds at most a minute's worth. Its state sits in shared memory
+    allocated when the bucket is created, so processes forked after that
+    (serve.py's workers, since the master imports the app) draw from one
+    budget; other servers get one budget per process.
+    """
+
+    def __init__(self, per_minute=CASCADE_FALLBACK_PER_MIN):
+        self.per_minute = per_minute
+        self._state = multiprocessing.RawArray('d', [max(per_minute, 0), time.monotonic()])   # tokens, last refill
+        self._lock = multiprocessing.Lock()
+
+    def _refilled(self, now):
+        tokens, last = self._state[0], self._state[1]
+        return min(self.per_minute, tokens + (now - last) * self.per_minute / 60)
+
+    def try_acquire(self):
+        """Take one call from the budget; False if it's spent"""
+        if self.per_minute < 0:
+            return True
+        if self.per_minute == 0:
+            return False
+        # a worker killed mid-update can't wedge the others: after the timeout, treat the budget as spent
+        if not self._lock.acquire(timeout=0.05):
+            return False
+        try:
+            now = time.monotonic()
+            tokens = self._refilled(now)
+            granted = tokens >= 1
+            self._state[0] = tokens - 1 if granted else tokens
+            self._state[1] = now
+            return granted
+        finally:
+            self._lock.release()
+
+    def available(self):
+        if self.per_minute < 0:
+            return None
+        return int(self._refilled(time.monotonic()))
+
+
+class CascadePolicy:
+    """
+    Decides which tier answers a /classify request: the local model when
+    every head's confidence reaches its threshold, else the OpenAI fallback
+    while the budget lasts. Counts, per process, how often each tier
+    answered and which heads were unsure.
+    """
+
+    def __init__(self, fruit_threshold=CASCADE_FRUIT_THRESHOLD, state_threshold=CASCADE_STATE_THRESHOLD,
+                 budget=None):
+        self.thresholds = {'fruit': fruit_threshold, 'state': state_threshold}
+        self.budget = budget if budget is not None else FallbackBudget()
+        self._answered = dict.fromkeys(TIERS, 0)
+        self._unsure = dict.fromkeys(self.thresholds, 0)
+        self._lock = threading.Lock()
+
+    def unsure_heads(self, result):
+        """Heads whose confidence is below their threshold; a result without confidences counts as sure"""
+        return [head for head, threshold in self.thresholds.items()
+                if result.get(f'{head}_confidence', 1.0) < threshold]
+
+    def decide(self, result, cached=None):
+        """
+        (tier, cached answer): 'local', 'fallback' or 'over_budget'. When a
+        head is unsure, `cached()` is asked first for the fallback's answer
+        from the result cache: a hit is a 'fallback' that returns it and
+        costs no budget; otherwise 'fallback' means a call has been taken.
+        """
+        unsure = self.unsure_heads(result)
+        if not unsure:
+            return 'local', None
+        with self._lock:
+            for head in unsure:
+                self._unsure[head] += 1
+        answer = cached() if cached is not None else None
+        if answer is not None:
+            return 'fallback', answer
+        return ('fallback' if self.budget.try_acquire() else 'over_budget'), None
+
+    def record(self, tier):
+        """Count the tier that finally answered"""
+        with self._lock:
+            self._answered[tier] += 1
+        CLASSIFY_TIER.inc(tier)
+
+    def stats(self):
+        with self._lock:
+            answered, unsure = dict(self._answered), dict(self._unsure)
+        total = sum(answered.values())
+        return {
+            'answered': answered,
+            'local_share': round(answered['local'] / total, 4) if total else None,
+            'unsure_heads': unsure,
+            'thresholds': self.thresholds,
+            'fallback_budget': {'per_minute': self.budget.per_minute, 'available': self.budget.available()},
+        }
+
+
+_cascade = CascadePolicy()
+
+def get_cascade():
+    return _cascade
+
+def set_cascade(policy):
+    """Swap the process-wide cascade policy (benchmarks, threshold sweeps)"""
+    global _cascade
+    _cascade = policy
@@ -1,37 +1,156 @@
 from PIL import Image
 import io
+import os
 import torch
-from torchvision import transforms
-from app.models.fruit_model import DualFruitCNN, load_model_checkpoint
+import logging
+import threading
+import contextvars
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from app.models.fruit_model import load_model_checkpoint, model_device, preprocess, INPUT_SIZE
+from app.models.calibration import calibration_path, load_temperatures
+from app.services.inference_batcher import InferenceBatcher
+from app.services.image_preprocess import open_reduced, to_model_input
+from app.services.metrics import stage
 
-# load once at import
-model, class_map = load_model_checkpoint('/Users/omprakashgunja/Documents/GitHub/lastbite-ai/backend/app/models/fruit_dual_cnn.pth')
-device = next(model.parameters()).device
+logger = logging.getLogger(__name__)
 
-preprocess = transforms.Compose([
-    transforms.Resize((128,128)),
-    transforms.ToTensor(),
-    transforms.Normalize([0.5]*3, [0.5]*3)
-])
+# reduced-resolution decode + NumPy normalize; set to 0 for the torchvision pipeline
+FAST_PREPROCESS = os.getenv('LASTBITE_FAST_PREPROCESS', '1') == '1'
 
-def predict_fruit_state(file_storage):
-    file_storage.stream.seek(0)
-    img_bytes = file_storage.read()
-    img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
+MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'models'))
+MODEL_PATH = os.getenv('LASTBITE_MODEL_PATH', os.path.join(MODELS_DIR, 'fruit_dual_cnn.pth'))
+# per-head softmax temperatures (python -m app.models.calibration writes them)
+CALIBRATION_PATH = os.getenv('LASTBITE_CALIBRATION_PATH', calibration_path(MODEL_PATH))
 
-    x = preprocess(img).unsqueeze(0).to(device)
-    print("Input tensor stats:", x.mean().item(), x.std().item())
+# loaded on first use (or by warm_up() at worker start), not at import
+model     = None
+class_map = None
+temperatures = None
+device    = None
+batcher   = None
+_load_lock = threading.Lock()
 
-    model.eval()
+def ensure_loaded():
+    global model, class_map, temperatures, device, batcher
+    if batcher is not None:
+        return
+    with _load_lock:
+        if batcher is not None:
+            return
+        model, class_map = load_model_checkpoint(MODEL_PATH)
+        temperatures = load_temperatures(CALIBRATION_PATH)
+        device = model_device(model)
+        # concurrent requests share forward passes (see LASTBITE_BATCH_* settings)
+        batcher = InferenceBatcher(model, device=device)
+
+def warm_up():
+    """
+    Load the model and run throwaway forward passes (single image through the
+    batcher, and a full batch) so the first real request doesn't pay for
+    weight loading, kernel selection or thread start-up.
+    """
+    ensure_loaded()
+    x = np.zeros((batcher.max_batch_size, 3, *INPUT_SIZE), dtype=np.float32)
+    batcher.infer(torch.from_numpy(x[0]))
     with torch.no_grad():
-        fruit_logits, state_logits = model(x)
-    print("Fruit logits:", fruit_logits.tolist())
-    print("State logits:", state_logits.tolist())
+        model(torch.from_numpy(x).to(device))
+
+# Pillow releases the GIL while decoding, so batch uploads decode in parallel
+DECODE_THREADS = int(os.getenv('LASTBITE_DECODE_THREADS', min(8, os.cpu_count() or 1)))
+_decode_pool = (None, None)     # (pid, executor): pool threads don't survive a fork either
 
-    fruit_idx = fruit_logits.argmax(dim=1).item()
-    state_idx = state_logits.argmax(dim=1).item()
+def decode_pool():
+    global _decode_pool
+    pid, pool = _decode_pool
+    if pid != os.getpid():
+        with _load_lock:
+            pid, pool = _decode_pool
+            if pid != os.getpid():
+                pool = ThreadPoolExecutor(max_workers=DECODE_THREADS, thread_name_prefix='decode')
+                _decode_pool = (os.getpid(), pool)
+    return pool
 
+def load_array(img_bytes, out=None):
+    """Decode raw upload bytes into a normalized 3×128×128 float32 array (written into `out` if given)"""
+    if FAST_PREPROCESS:
+        with stage('decode'):
+            img = open_reduced(img_bytes)
+        with stage('preprocess'):
+            return to_model_input(img, out)
+    with stage('decode'):
+        img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
+    with stage('preprocess'):
+        x = preprocess(img).numpy()
+        if out is None:
+            return x
+        out[...] = x
+        return out
+
+def load_tensor(img_bytes):
+    return torch.from_numpy(load_array(img_bytes))
+
+def to_labels(fruit_logits, state_logits):
+    """
+    Labels plus each head's temperature-scaled softmax confidence;
+    'confidence' is the lower of the two, the chance both labels are right
+    at best.
+    """
+    fruit_p = torch.softmax(fruit_logits.float() / temperatures['fruit'], dim=-1)
+    state_p = torch.softmax(state_logits.float() / temperatures['state'], dim=-1)
+    fruit, state = fruit_p.argmax().item(), state_p.argmax().item()
+    fruit_confidence = round(fruit_p[fruit].item(), 4)
+    state_confidence = round(state_p[state].item(), 4)
     return {
-        'fruit': class_map['fruit'][fruit_idx],
-        'state': class_map['state'][state_idx]
-    }
\ No newline at end of file
+        'fruit': class_map['fruit'][fruit],
+        'state': class_map['state'][state],
+        'fruit_confidence': fruit_confidence,
+        'state_confidence': state_confidence,
+        'confidence': min(fruit_confidence, state_confidence)
+    }
+
+def predict_fruit_state(file_storage):
+    file_storage.stream.seek(0)
+    return predict_image_bytes(file_storage.read())
+
+def predict_image_bytes(img_bytes):
+    ensure_loaded()
+    x = load_tensor(img_bytes)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("input tensor mean %.4f std %.4f", x.mean().item(), x.std().item())
+
+    # queueing for a batch slot plus the shared forward pass
+    with stage('inference'):
+        fruit_logits, state_logits = batcher.infer(x)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("fruit logits %s, state logits %s", fruit_logits.tolist(), state_logits.tolist())
+
+    return to_labels(fruit_logits, state_logits)
+
+def predict_fruit_states(images):
+    """
+    Classify many uploads at once: decode/preprocess in parallel, then one
+    forward pass over the stacked batch. Returns one entry per image, either
+    a to_labels() dict or the exception that image failed with.
+    """
+    ensure_loaded()
+    # every image is decoded straight into its slot of one preallocated batch buffer
+    buf = np.empty((len(images), 3, *INPUT_SIZE), dtype=np.float32)
+    # each decode runs in a copy of the request's context so its stage times land in the request's breakdown
+    pool = decode_pool()
+    decoded = [pool.submit(contextvars.copy_context().run, load_array, b, buf[i]) for i, b in enumerate(images)]
+    results, slots = [None] * len(images), []
+    for i, fut in enumerate(decoded):
+        try:
+            fut.result()
+            slots.append(i)
+        except Exception as e:
+            results[i] = e
+
+    if slots:
+        x = torch.from_numpy(buf if len(slots) == len(images) else buf[slots]).to(device)
+        with stage('inference'), torch.no_grad():
+            fruit_logits, state_logits = model(x)
+        for row, i in enumerate(slots):
+            results[i] = to_labels(fruit_logits[row], state_logits[row])
+    return results
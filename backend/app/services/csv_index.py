@@ -0,0 +1,192 @@
+# app/services/csv_index.py
+
+import os
+import csv
+import threading
+from app.services.journal import CsvJournal, JOURNAL_COMPACT_BYTES
+from app.services.group_commit import GroupCommit
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DATA_DIR     = os.getenv('LASTBITE_DATA_DIR', os.path.join(PROJECT_ROOT, 'data'))
+
+
+def file_signature(path):
+    """(mtime_ns, size) of a file, or None if it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class CsvIndex:
+    """
+    Resident index over one CSV table and its append-only journal.
+
+    The base file is parsed once and kept in memory. `refresh()` re-reads it
+    only when its mtime/size changes (e.g. after a compaction or a manual
+    edit); rows appended to the journal since the last refresh are applied
+    in place via `_add(row)`. Subclasses implement `_build(rows)`, returning
+    a new index state that `_apply(state)` swaps in whole so readers never
+    see a half-built index; one that keeps the base file in another form
+    overrides `_load()`. Subclasses that deduplicate writes implement
+    `_duplicate(key)`.
+    """
+
+    fieldnames = ()
+
+    def __init__(self, path):
+        self.path = path
+        self.journal = CsvJournal(path, self.fieldnames)
+        self._lock = threading.RLock()
+        self._signature = None
+        self._journal_offset = 0
+        self._loaded = False
+        self._compacting = False
+        self._committer = None
+
+    def _build(self, rows):
+        raise NotImplementedError
+
+    def _apply(self, state):
+        raise NotImplementedError
+
+    def _add(self, row):
+        raise NotImplementedError
+
+    def _duplicate(self, key):
+        """What a new row with this dedupe key would repeat (the stored row, or True), or None"""
+        raise NotImplementedError
+
+    def refresh(self):
+        if (self._loaded and file_signature(self.path) == self._signature
+                and self.journal.size() == self._journal_offset):
+            return
+        with self._lock:
+            sig = file_signature(self.path)
+            journal_size = self.journal.size()
+            if self._loaded and sig == self._signature and journal_size >= self._journal_offset:
+                rows, self._journal_offset = self.journal.read(self._journal_offset)
+                for row in rows:
+                    self._add(row)
+                return
+            self._reload()
+
+    def _reload(self):
+        # shared lock: a compaction can't swap the base out from under us mid-read
+        with self.journal.locked(shared=True):
+            sig = file_signature(self.path)
+            journal_rows, offset = self.journal.read(0)
+            self._apply(self._load(sig, journal_rows))
+            self._signature = sig
+            self._journal_offset = offset
+            self._loaded = True
+
+    def _load(self, sig, journal_rows):
+        """Index state for the base file (signature `sig`, None if missing) followed by `journal_rows`"""
+        if sig is None:
+            return self._build(iter(journal_rows))
+        with open(self.path, newline='') as f:
+            return self._build(_chain(csv.DictReader(f), journal_rows))
+
+    def read_rows(self):
+        """Every row of the table, base file then journal, as a consistent snapshot"""
+        base, _, journal_rows, _ = self.journal.snapshot()
+        if base is not None:
+            with base:
+                yield from csv.DictReader(base)
+        yield from journal_rows
+
+    def invalidate(self):
+        self._loaded = False
+
+    @property
+    def version(self):
+        """(base file signature, journal offset) as of the last refresh; changes whenever the rows do"""
+        return self._signature, self._journal_offset
+
+    def append_rows(self, rows):
+        """Durably append rows to the table's journal and index them"""
+        size = self.journal.append(rows)
+        self.refresh()
+        self._maybe_compact(size)
+
+    def append_new(self, entries):
+        """
+        Durably append a batch of (row, key) entries in one write, skipping
+        rows whose key is already in the table (see `_duplicate`) or earlier
+        in the batch; a key of None always appends. The check and the write
+        happen under the table's file lock after catching up on rows other
+        workers appended, so no concurrent writer can slip a duplicate in
+        between. Returns, per entry, None if it was appended or what it
+        duplicates.
+        """
+        while True:
+            self.refresh()
+            with self._lock, self.journal.locked():
+                if file_signature(self.path) != self._signature:
+                    continue        # compacted since the refresh: reload, outside the file lock
+                rows, self._journal_offset = self.journal.read(self._journal_offset)
+                for row in rows:
+                    self._add(row)
+                results, fresh, batch = [], [], {}
+                for row, key in entries:
+                    dup = None
+                    if key is not None:
+                        dup = batch.get(key) or self._duplicate(key)
+                        if dup is None:
+                            batch[key] = row
+                    if dup is None:
+                        fresh.append(row)
+                    results.append(dup)
+                size = self.journal.append_locked(fresh)
+                # index them as read back, the way refresh() would (all values strings)
+                rows, self._journal_offset = self.journal.read(self._journal_offset)
+                for row in rows:
+                    self._add(row)
+                break
+        self._maybe_compact(size)
+        return results
+
+    def commit(self, row, key=None, timeout=None):
+        """
+        append_new() for one row, through this index's group-commit queue:
+        rows that arrive while a write is in flight share the next one.
+        Returns None if the row was appended, else what it duplicates.
+        """
+        if self._committer is None:
+            with self._lock:
+                if self._committer is None:
+                    self._committer = GroupCommit(self.append_new)
+        return self._committer.submit(row, key).result(timeout)
+
+    def _maybe_compact(self, journal_size):
+        if journal_size > JOURNAL_COMPACT_BYTES and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self._background_compact, daemon=True).start()
+
+    def _background_compact(self):
+        try:
+            self.compact()
+        except Exception:
+            self.invalidate()
+        finally:
+            self._compacting = False
+
+    def compact(self):
+        """Fold the journal into the base CSV, keeping this index loaded"""
+        with self._lock:
+            self.refresh()
+            folded = self.journal.compact()
+            if folded and folded == self._journal_offset:
+                # everything folded was already indexed; only the files moved
+                self._signature = file_signature(self.path)
+                self._journal_offset = 0
+            elif folded:
+                self.invalidate()
+            return folded
+
+
+def _chain(rows, more):
+    yield from rows
+    yield from more
@@ -0,0 +1,325 @@
+# app/services/expiry_index.py
+
+import os
+import threading
+
+import numpy as np
+
+from app.services.csv_index import CsvIndex
+from app.services.inventory_index import LINKS_CSV, LINK_FIELDS, parse_quantity
+from app.services.product_catalog import get_product_catalog, parse_date, parse_dates
+
+# ── tweak these for your deployment ─────────────────────────────
+# links added since the last sort are filtered linearly until there are this many
+EXPIRY_PENDING_MAX = int(os.getenv('LASTBITE_EXPIRY_PENDING_MAX', 4096))
+# ----------------------------------------------------------------
+
+_NAT_DAYS = np.iinfo(np.int64).min      # NaT viewed as int64
+_LAST = np.iinfo(np.int64).max          # sort key for unknown expiry: after everything
+
+
+def expiry_keys(expiry):
+    """int64 sort keys for datetime64[D] values; NaT sorts last"""
+    days = expiry.view(np.int64)
+    return np.where(days == _NAT_DAYS, _LAST, days)
+
+
+class _Column:
+    """Append-only NumPy column; `values()` is a view of the filled part"""
+
+    def __init__(self, dtype, capacity=1024):
+        self._data = np.empty(capacity, dtype=dtype)
+        self._n = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._data.dtype)
+        end = self._n + len(values)
+        if end > len(self._data):
+            grown = np.empty(max(end, 2 * len(self._data)), dtype=self._data.dtype)
+            grown[:self._n] = self._data[:self._n]
+            self._data = grown
+        self._data[self._n:end] = values
+        self._n = end
+
+    def append(self, value):
+        self.extend([value])
+
+    def values(self):
+        return self._data[:self._n]
+
+    def __setitem__(self, index, value):
+        self._data[:self._n][index] = value
+
+    def __len__(self):
+        return self._n
+
+
+class _Sorted:
+    """Sort orders over the first `n` links: by expiry, and by (user, expiry)"""
+
+    def __init__(self, user, expiry, n):
+        keys = expiry_keys(expiry[:n])
+        self.n = n
+        self.by_expiry = np.argsort(keys, kind='stable').astype(np.int32)
+        self.expiry_keys = keys[self.by_expiry]
+        user_keys = (user[:n].astype(np.int64) << 32) | (np.clip(keys, -2**31, 2**31 - 1) + 2**31)
+        self.by_user = np.argsort(user_keys, kind='stable').astype(np.int32)
+        self.user_keys = user_keys[self.by_user]
+
+
+class ExpiryIndex(CsvIndex):
+    """
+    User–product links as NumPy columns joined to each product's parsed
+    expiry date, sorted by expiry (overall and per user) so "what expires in
+    the next N days" is a binary search plus a slice.
+
+    Links added through the journal are appended to the columns and
+    filtered linearly until EXPIRY_PENDING_MAX of them accumulate, then a
+    background re-sort folds them in. Product expiry dates (and the scan
+    dates and categories the waste-risk scoring needs) come from the
+    product catalog and are re-read when it changes.
+    """
+
+    fieldnames = LINK_FIELDS
+
+    def __init__(self, path=LINKS_CSV, catalog=None, pending_max=EXPIRY_PENDING_MAX):
+        super().__init__(path)
+        self.catalog = catalog
+        self.pending_max = pending_max
+        self._sort_lock = threading.Lock()
+        self._sorting = False
+        self._generation = 0
+        self._apply(self._build(()))
+
+    # ── building ────────────────────────────────────────────────
+    def _get_catalog(self):
+        if self.catalog is None:
+            return get_product_catalog()
+        self.catalog.refresh()
+        return self.catalog
+
+    def _build(self, rows):
+        user_code, product_code = {}, {}
+        users, products, quantities, scans = [], [], [], []
+        for row in rows:
+            users.append(user_code.setdefault(row.get('user_uid'), len(user_code)))
+            products.append(product_code.setdefault(row.get('product_uid'), len(product_code)))
+            quantities.append(parse_quantity(row.get('quantity')))
+            scans.append(row.get('scan_date'))
+        return self._columns_state(user_code, product_code, users, products, quantities, parse_dates(scans))
+
+    @staticmethod
+    def _columns_state(user_code, product_code, users, products, quantities, scans=None):
+        """Index state from uid -> code dicts and per-link code/quantity/scan date sequences"""
+        state = {
+            'users': list(user_code), 'user_code': user_code,
+            'products': list(product_code), 'product_code': product_code,
+            'user': _Column(np.int32), 'product': _Column(np.int32), 'quantity': _Column(np.int32),
+            'scan': _Column('datetime64[D]'),
+            'product_expiry': _Column('datetime64[D]'), 'product_scanned': _Column('datetime64[D]'),
+            'product_category': _Column(np.int32), 'categories': [], 'category_code': {},
+        }
+        state['user'].extend(users)
+        state['product'].extend(products)
+        state['quantity'].extend(quantities)
+        state['scan'].extend(np.full(len(state['user']), 'NaT', dtype='datetime64[D]') if scans is None else scans)
+        return state
+
+    def _apply(self, state):
+        self._users, self._user_code = state['users'], state['user_code']
+        self._products, self._product_code = state['products'], state['product_code']
+        self._user, self._product, self._quantity = state['user'], state['product'], state['quantity']
+        self._scan = state['scan']
+        self._product_expiry, self._product_scanned = state['product_expiry'], state['product_scanned']
+        self._product_category = state['product_category']
+        self._categories, self._category_code = state['categories'], state['category_code']
+        self._generation += 1
+        self._catalog_version = None
+        self._unresolved = set()
+        self._sorted = None
+
+    def _add(self, row):
+        user_code = self._user_code.get(row.get('user_uid'))
+        if user_code is None:
+            user_code = self._user_code[row.get('user_uid')] = len(self._users)
+            self._users.append(row.get('user_uid'))
+        product_code = self._product_code.get(row.get('product_uid'))
+        if product_code is None:
+            product_code = self._product_code[row.get('product_uid')] = len(self._products)
+            self._products.append(row.get('product_uid'))
+        self._user.append(user_code)
+        self._product.append(product_code)
+        self._quantity.append(parse_quantity(row.get('quantity')))
+        self._scan.append(np.datetime64(parse_date(row.get('scan_date')), 'D'))
+        if len(self._user) - (self._sorted.n if self._sorted else 0) >= self.pending_max and not self._sorting:
+            self._sorting = True
+            threading.Thread(target=self._background_sort, daemon=True).start()
+
+    def _category_codes(self, names):
+        codes = np.empty(len(names), dtype=np.int32)
+        for i, name in enumerate(names):
+            code = self._category_code.get(name)
+            if code is None:
+                code = self._category_code[name] = len(self._categories)
+                self._categories.append(name)
+            codes[i] = code
+        return codes
+
+    def _sync_catalog(self):
+        """
+        Pull catalog dates and categories for products the index hasn't
+        resolved yet; True if an expiry date changed. Any change to a
+        product already indexed bumps `generation`.
+        """
+        catalog = self._get_catalog()
+        version = catalog.version
+        if version == self._catalog_version and len(self._product_expiry) == len(self._products):
+            return False
+        with self._lock:
+            changed = False
+            known = len(self._product_expiry)
+            if self._catalog_version is None or version[0] != self._catalog_version[0]:
+                # base table replaced (or first use): re-read every product
+                codes = range(len(self._products))
+            else:
+                codes = sorted(self._unresolved) + list(range(known, len(self._products)))
+            scanned, expiry, category, found = catalog.columns([self._products[c] for c in codes])
+            category = self._category_codes(category)
+            for c, f in zip(codes, found.tolist()):
+                if f:
+                    self._unresolved.discard(c)
+                else:
+                    self._unresolved.add(c)
+            codes = np.fromiter(codes, dtype=np.int64, count=len(found))
+            fresh = codes >= known
+            if fresh.any():
+                self._product_expiry.extend(expiry[fresh])
+                self._product_scanned.extend(scanned[fresh])
+                self._product_category.extend(category[fresh])
+            old = ~fresh
+            if old.any():
+                at = codes[old]
+                changed = not np.array_equal(self._product_expiry.values()[at], expiry[old], equal_nan=True)
+                if (changed or not np.array_equal(self._product_scanned.values()[at], scanned[old], equal_nan=True)
+                        or not np.array_equal(self._product_category.values()[at], category[old])):
+                    self._generation += 1
+                self._product_expiry[at] = expiry[old]
+                self._product_scanned[at] = scanned[old]
+                self._product_category[at] = category[old]
+            self._catalog_version = version
+            return changed
+
+    def _background_sort(self):
+        try:
+            self._resort()
+        finally:
+            self._sorting = False
+
+    def _resort(self):
+        with self._sort_lock:
+            n = len(self._user)
+            self._sync_catalog()       # every product of links[:n] now has an expiry slot
+            user = self._user.values()[:n]
+            expiry = self._product_expiry.values()[self._product.values()[:n]]
+            self._sorted = _Sorted(user, expiry, n)
+
+    def _snapshot(self):
+        """(sort orders, number of links whose products all have an expiry slot)"""
+        self.refresh()
+        n = len(self._user)
+        if self._sync_catalog() or self._sorted is None:
+            self._resort()
+        return self._sorted, n
+
+    # ── queries ─────────────────────────────────────────────────
+    def expiring(self, start, end, user_uid=None, offset=0, limit=50):
+        """
+        Links whose product expires in [start, end] (datetime64[D]; start may
+        be None for "anything up to end"), most urgent first. Returns
+        (total, [(user_uid, product_uid, quantity, expiry_date)]) for the page.
+        """
+        srt, n = self._snapshot()
+        user_col, product_col = self._user.values()[:n], self._product.values()[:n]
+        product_expiry = self._product_expiry.values()
+        lo_key = _NAT_DAYS + 1 if start is None else int(np.datetime64(start, 'D').view(np.int64))
+        hi_key = int(np.datetime64(end, 'D').view(np.int64))
+
+        if user_uid is None:
+            lo = np.searchsorted(srt.expiry_keys, lo_key, side='left')
+            hi = np.searchsorted(srt.expiry_keys, hi_key, side='right')
+            main = srt.by_expiry
+            pending = np.arange(srt.n, n)
+        else:
+            code = self._user_code.get(user_uid)
+            if code is None:
+                return 0, []
+            base = np.int64(code) << 32
+            bounds = [base | (max(lo_key, -2**31) + 2**31), base | (min(hi_key, 2**31 - 1) + 2**31)]
+            lo = np.searchsorted(srt.user_keys, bounds[0], side='left')
+            hi = np.searchsorted(srt.user_keys, bounds[1], side='right')
+            main = srt.by_user
+            pending = np.arange(srt.n, n)
+            pending = pending[user_col[srt.n:n] == code]
+
+        # links added since the last sort
+        p_keys = expiry_keys(product_expiry[product_col[pending]])
+        pending = pending[(p_keys >= lo_key) & (p_keys <= hi_key)]
+        total = int(hi - lo) + len(pending)
+
+        # the page: first offset+limit from the sorted run merged with the pending matches
+        take = main[lo:min(hi, lo + offset + limit)]
+        if len(pending):
+            merged = np.concatenate([take, pending])
+            keys = expiry_keys(product_expiry[product_col[merged]])
+            take = merged[np.argsort(keys, kind='stable')]
+        page = take[offset:offset + limit]
+
+        expiry = product_expiry[product_col[page]]
+        quantity = self._quantity.values()[page]
+        return total, [(self._users[user_col[i]], self._products[product_col[i]], int(q), e)
+                       for i, q, e in zip(page.tolist(), quantity.tolist(), expiry)]
+
+    def days_until_expiry(self, today):
+        """Days until expiry for every link (float, NaN if unknown), in link order"""
+        _, n = self._snapshot()
+        expiry = self._product_expiry.values()[self._product.values()[:n]]
+        days = (expiry - np.datetime64(today, 'D')).astype('timedelta64[D]').astype(np.float64)
+        days[np.isnat(expiry)] = np.nan
+        return days
+
+    def link_columns(self):
+        """
+        Every link's columns for batch scoring, caught up with the journal
+        and the catalog: per link (first `n`) user and product codes,
+        quantity and scan date; per product code its expiry, scanned date
+        and category code; the uid and category lists the codes index; and
+        `generation`, which changes whenever links or products already
+        returned may have changed (appends don't change it).
+        """
+        self.refresh()
+        with self._lock:
+            n = len(self._user)
+            self._sync_catalog()
+            return {
+                'n': n, 'generation': self._generation,
+                'user': self._user.values()[:n], 'product': self._product.values()[:n],
+                'quantity': self._quantity.values()[:n], 'scan': self._scan.values()[:n],
+                'product_expiry': self._product_expiry.values(), 'product_scanned': self._product_scanned.values(),
+                'product_category': self._product_category.values(),
+                'users': self._users, 'user_code': self._user_code,
+                'products': self._products, 'product_code': self._product_code,
+                'categories': self._categories,
+            }
+
+    def __len__(self):
+        return len(self._user)
+
+
+_expiry = ExpiryIndex()
+
+def get_expiry_index():
+    _expiry.refresh()
+    return _expiry
+
+def invalidate_expiry_index():
+    _expiry.invalidate()
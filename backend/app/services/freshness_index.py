@@ -0,0 +1,76 @@
+# app/services/freshness_index.py
+
+import os
+
+import numpy as np
+
+from app.services.csv_index import CsvIndex, DATA_DIR
+from app.services.product_catalog import parse_date
+
+FRESHNESS_CSV    = os.path.join(DATA_DIR, 'freshness_table.csv')
+FRESHNESS_FIELDS = ['user_uid', 'product_uid', 'state', 'confidence', 'classified_date', 'source']
+STATES = ('fresh', 'rotten')
+
+
+class FreshnessIndex(CsvIndex):
+    """
+    Freshness classifications of the items users hold (a photo of a linked
+    product sent through /classify), latest per (user_uid, product_uid):
+    `latest` maps the pair to (state, classified date as datetime64[D]).
+    `changes` lists the pairs in the order they were classified, so a
+    consumer can catch up from the position it last saw; a reload starts a
+    new list. Rows with an unknown state or date are ignored.
+    """
+
+    fieldnames = FRESHNESS_FIELDS
+
+    def __init__(self, path=FRESHNESS_CSV):
+        super().__init__(path)
+        self.latest = {}
+        self.changes = []
+
+    @staticmethod
+    def _index_row(row, latest, changes):
+        state = (row.get('state') or '').strip().lower()
+        classified = parse_date(row.get('classified_date'))
+        if state not in STATES or classified is None:
+            return
+        key = (row.get('user_uid'), row.get('product_uid'))
+        latest[key] = (state, np.datetime64(classified, 'D'))
+        changes.append(key)
+
+    def _build(self, rows):
+        latest, changes = {}, []
+        for row in rows:
+            self._index_row(row, latest, changes)
+        return latest, changes
+
+    def _apply(self, state):
+        self.latest, self.changes = state
+
+    def _add(self, row):
+        self._index_row(row, self.latest, self.changes)
+
+    def get(self, user_uid, product_uid):
+        """(state, classified date) of the latest classification of a user's product, or None"""
+        return self.latest.get((user_uid, product_uid))
+
+    def log(self):
+        """(the change list, how many entries it holds now): catch up on changes[seen:count]"""
+        with self._lock:
+            return self.changes, len(self.changes)
+
+    def items(self):
+        """[((user_uid, product_uid), (state, classified date))] for every pair classified"""
+        with self._lock:
+            return list(self.latest.items())
+
+    def __len__(self):
+        return len(self.latest)
+
+
+_freshness = FreshnessIndex()
+
+def get_freshness_index():
+    _freshness.refresh()
+    return _freshness
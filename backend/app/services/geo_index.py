@@ -0,0 +1,469 @@
+# app/services/geo_index.py
+
+import os
+import math
+import threading
+
+import numpy as np
+
+from app.services.csv_index import CsvIndex, DATA_DIR
+
+USERS_CSV   = os.path.join(DATA_DIR, 'users_table_v2.csv')
+USER_FIELDS = ['user_uid', 'user_id', 'user_name', 'location_lat', 'location_lng', 'points_awarded']
+
+EARTH_RADIUS_KM = 6371.0088
+
+# ── tweak these for your deployment ─────────────────────────────
+# average points per grid cell the cell size is chosen for
+GEO_POINTS_PER_CELL = float(os.getenv('LASTBITE_GEO_POINTS_PER_CELL', 16))
+# points added since the last build are searched linearly until there are this many
+GEO_PENDING_MAX     = int(os.getenv('LASTBITE_GEO_PENDING_MAX', 2048))
+# ----------------------------------------------------------------
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km between points given in radians; broadcasts over arrays"""
+    a = (np.sin((lat2 - lat1) / 2) ** 2
+         + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def parse_coordinates(lat, lng):
+    """(lat, lng) as floats in degrees, or None if missing, not finite or out of range"""
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+    if not (math.isfinite(lat) and math.isfinite(lng) and -90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+class _Level:
+    """One equal-angle grid resolution: cell ids of all points, sorted, and their positions"""
+
+    def __init__(self, lat_deg, lng_deg, cell_deg, cells=None):
+        self.nrows = max(1, round(180 / cell_deg))
+        self.cell_deg = 180 / self.nrows              # divides 180 and 360 exactly
+        self.ncols = 2 * self.nrows
+        if cells is None:
+            cells = self.cell_of(lat_deg, lng_deg)
+        self.order = np.argsort(cells, kind='stable').astype(np.int32)
+        self.cells = cells[self.order]
+
+    def row_col(self, lat, lng):
+        row = np.clip(np.floor((np.asarray(lat) + 90) / self.cell_deg), 0, self.nrows - 1).astype(np.int64)
+        col = np.floor((np.asarray(lng) + 180) / self.cell_deg).astype(np.int64) % self.ncols
+        return row, col
+
+    def locate(self, lat, lng):
+        """row_col for one point, without NumPy overhead"""
+        row = min(max(int(math.floor((lat + 90) / self.cell_deg)), 0), self.nrows - 1)
+        return row, int(math.floor((lng + 180) / self.cell_deg)) % self.ncols
+
+    def cell_of(self, lat, lng):
+        row, col = self.row_col(lat, lng)
+        return row * self.ncols + col
+
+    def window(self, row0, col0, row_half, col_half):
+        """Positions (into the point arrays) of points in a block of cells around (row0, col0)"""
+        rows = np.arange(max(0, row0 - row_half), min(self.nrows - 1, row0 + row_half) + 1)
+        if 2 * col_half + 1 >= self.ncols:
+            lo, hi = rows * self.ncols, rows * self.ncols + self.ncols - 1
+        else:
+            c_lo, c_hi = (col0 - col_half) % self.ncols, (col0 + col_half) % self.ncols
+            if c_lo <= c_hi:
+                lo, hi = rows * self.ncols + c_lo, rows * self.ncols + c_hi
+            else:   # wraps across the antimeridian: two runs per row
+                base = rows * self.ncols
+                lo = np.concatenate([base + c_lo, base])
+                hi = np.concatenate([base + self.ncols - 1, base + c_hi])
+        starts = np.searchsorted(self.cells, lo, side='left')
+        ends = np.searchsorted(self.cells, hi, side='right')
+        keep = ends > starts
+        starts, ends = starts[keep], ends[keep]
+        if len(starts) == 0:
+            return np.empty(0, dtype=np.int64)
+        if len(starts) == 1:
+            return self.order[starts[0]:ends[0]]
+        # concatenated ranges without a Python loop
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        return self.order[np.arange(lengths.sum()) + offsets]
+
+    def covers_all(self, half):
+        return half >= self.nrows and 2 * half + 1 >= self.ncols
+
+
+class _Grid:
+    """
+    Immutable point set with a pyramid of grid levels, finest first, each
+    LEVEL_FACTOR times coarser, up to MAX_CELL_DEG cells. Dense areas are
+    searched on the fine level, sparse ones on a coarse level.
+    """
+
+    LEVEL_FACTOR = 8
+    MAX_CELL_DEG = 10.0
+
+    def __init__(self, ids, lat, lng, cell_deg):
+        fine = _Level(lat, lng, cell_deg)
+        # store points in fine-cell order so a block of cells is mostly contiguous memory
+        ids, lat, lng = ids[fine.order], lat[fine.order], lng[fine.order]
+        fine.order = np.arange(len(ids), dtype=np.int32)
+        self.ids = ids
+        self.lat = np.radians(lat)
+        self.lng = np.radians(lng)
+        self.levels = [fine]
+        while self.levels[-1].cell_deg * self.LEVEL_FACTOR <= self.MAX_CELL_DEG and len(ids):
+            self.levels.append(_Level(lat, lng, self.levels[-1].cell_deg * self.LEVEL_FACTOR))
+
+    @property
+    def cell_deg(self):
+        return self.levels[0].cell_deg
+
+    def __len__(self):
+        return len(self.ids)
+
+
+class GeoGrid:
+    """
+    Nearest-neighbour and radius queries over (lat, lng) points.
+
+    Points live in an equal-angle grid (a geohash-style bucketing) sized so
+    cells hold ~GEO_POINTS_PER_CELL points; each cell is a contiguous run of
+    a sorted array, so gathering a block of cells is a few `searchsorted`
+    calls. k-nearest grows the block around the query until the k-th best
+    haversine distance is below a lower bound on the distance to anything
+    outside it, so results are exact, poles and antimeridian included.
+
+    `add()` / `discard()` are incremental: new points are kept in a small
+    pending set that is searched linearly and folded into the grid by a
+    background rebuild once it reaches GEO_PENDING_MAX points; discarded ids
+    are masked out.
+    """
+
+    def __init__(self, points_per_cell=GEO_POINTS_PER_CELL, pending_max=GEO_PENDING_MAX):
+        self.points_per_cell = points_per_cell
+        self.pending_max = pending_max
+        self._grid = _Grid(np.empty(0, np.int64), np.empty(0), np.empty(0), 1.0)
+        self._alive = np.zeros(0, dtype=bool)
+        self._pending = ([], [], [])      # ids, lat, lng (degrees)
+        self._pending_arrays = None
+        self._live = 0
+        self._folding = False
+        self._lock = threading.Lock()
+
+    # ── building ────────────────────────────────────────────────
+    def build(self, ids, lat, lng):
+        """Replace the contents with these points (degrees); ids are non-negative ints"""
+        ids = np.asarray(ids, dtype=np.int64)
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        alive = np.zeros(int(ids.max()) + 1 if len(ids) else 0, dtype=bool)
+        alive[ids] = True
+        grid = _Grid(ids, lat, lng, self._cell_size(lat, lng))
+        with self._lock:
+            self._grid = grid
+            self._alive = alive
+            self._pending = ([], [], [])
+            self._pending_arrays = None
+            self._live = int(alive.sum())
+
+    def _cell_size(self, lat, lng, sample=50_000):
+        """
+        Largest cell size (halving from 10 degrees) at which the cell an
+        average point sits in holds <= points_per_cell points. Measured on a
+        sample, since users cluster in cities and the bounding box says little.
+        """
+        n = len(lat)
+        if n < 2:
+            return 1.0
+        if n > sample:
+            pick = np.random.default_rng(0).choice(n, sample, replace=False)
+            lat, lng = lat[pick], lng[pick]
+        scale = n / len(lat)
+        cell = 10.0
+        while cell > 1e-3:
+            nrows = round(180 / cell)
+            rows = np.clip(np.floor((lat + 90) * nrows / 180), 0, nrows - 1).astype(np.int64)
+            cols = np.floor((lng + 180) * nrows / 180).astype(np.int64) % (2 * nrows)
+            _, counts = np.unique(rows * 2 * nrows + cols, return_counts=True)
+            # points sharing a sampled point's cell, scaled up to the full set
+            if 1 + ((counts * counts).sum() / len(lat) - 1) * scale <= self.points_per_cell:
+                break
+            cell /= 2
+        return cell
+
+    def add(self, point_id, lat, lng):
+        with self._lock:
+            if point_id >= len(self._alive):
+                grown = np.zeros(max(2 * len(self._alive), point_id + 1, 1024), dtype=bool)
+                grown[:len(self._alive)] = self._alive
+                self._alive = grown
+            if not self._alive[point_id]:
+                self._live += 1
+            self._alive[point_id] = True
+            ids, lats, lngs = self._pending
+            ids.append(point_id)
+            lats.append(lat)
+            lngs.append(lng)
+            self._pending_arrays = None
+            fold = len(ids) >= self.pending_max and not self._folding
+            if fold:
+                self._folding = True
+        if fold:
+            threading.Thread(target=self._fold, daemon=True).start()
+
+    def discard(self, point_id):
+        with self._lock:
+            if point_id < len(self._alive) and self._alive[point_id]:
+                self._alive[point_id] = False
+                self._live -= 1
+
+    def _fold(self):
+        """Merge pending points into a rebuilt grid, dropping discarded ones"""
+        try:
+            while True:
+                self._rebuild_with_pending()
+                with self._lock:
+                    # adds that arrived during the rebuild may already call for another
+                    if len(self._pending[0]) < self.pending_max:
+                        self._folding = False
+                        return
+        except Exception:
+            self._folding = False
+            raise
+
+    def _rebuild_with_pending(self):
+        with self._lock:
+            grid, alive = self._grid, self._alive
+            p_ids, p_lat, p_lng = (list(p) for p in self._pending)
+        # rebuilt outside the lock so queries keep running on the old grid meanwhile
+        keep = alive[grid.ids]
+        ids = np.concatenate([grid.ids[keep], np.asarray(p_ids, dtype=np.int64)])
+        lat = np.concatenate([np.degrees(grid.lat[keep]), np.asarray(p_lat, dtype=np.float64)])
+        lng = np.concatenate([np.degrees(grid.lng[keep]), np.asarray(p_lng, dtype=np.float64)])
+        folded = _Grid(ids, lat, lng, self._cell_size(lat, lng))
+        with self._lock:
+            if self._grid is grid:
+                self._grid = folded
+                self._pending = tuple(p[len(p_ids):] for p in self._pending)
+                self._pending_arrays = None
+
+    def __len__(self):
+        return self._live
+
+    # ── queries ─────────────────────────────────────────────────
+    def _snapshot(self):
+        with self._lock:
+            pending = self._pending_arrays
+            if pending is None:
+                ids, lat, lng = self._pending
+                pending = self._pending_arrays = (np.asarray(ids, dtype=np.int64),
+                                                  np.radians(np.asarray(lat, dtype=np.float64)),
+                                                  np.radians(np.asarray(lng, dtype=np.float64)))
+            return self._grid, self._alive, pending
+
+    @staticmethod
+    def _candidates(grid, alive, pending, positions, qlat, qlng, exclude):
+        ids = grid.ids[positions]
+        dist = haversine_km(qlat, qlng, grid.lat[positions], grid.lng[positions])
+        if len(pending[0]):
+            ids = np.concatenate([ids, pending[0]])
+            dist = np.concatenate([dist, haversine_km(qlat, qlng, pending[1], pending[2])])
+        keep = alive[ids]
+        if exclude is not None:
+            keep &= ids != exclude
+        return ids[keep], dist[keep]
+
+    @staticmethod
+    def _circle(grid, lat, lng, radius_km):
+        """Positions of the points in a block of cells covering a circle around (lat, lng)"""
+        ang = radius_km / EARTH_RADIUS_KM
+        qlat = math.radians(lat)
+        # finest level on which the circle spans only a few cells
+        level = next((l for l in grid.levels if ang <= 4 * math.radians(l.cell_deg)), grid.levels[-1])
+        row0, col0 = level.locate(lat, lng)
+        c = math.radians(level.cell_deg)
+        row_half = int(ang / c) + 1
+        # widest longitude span of the circle; the whole ring if it reaches a pole
+        s = math.sin(min(ang, math.pi / 2)) / max(math.cos(qlat), 1e-12)
+        col_half = int(math.asin(s) / c) + 1 if s < 1 and abs(qlat) + ang < math.pi / 2 else level.ncols
+        return level.window(row0, col0, row_half, col_half)
+
+    def nearest(self, lat, lng, k=5, exclude=None):
+        """[(id, distance_km)] of the k nearest live points, closest first"""
+        grid, alive, pending = self._snapshot()
+        if k <= 0 or self._live == 0:
+            return []
+        lng = (lng + 180) % 360 - 180
+        qlat, qlng = math.radians(lat), math.radians(lng)
+
+        # 1. any k points near the query: the smallest 3x3 block of cells holding
+        #    k, from the finest level up; their k-th distance bounds the answer
+        ids = ()
+        for level in grid.levels:
+            row0, col0 = level.locate(lat, lng)
+            half = 1
+            while True:
+                positions = level.window(row0, col0, half, half)
+                if len(positions) >= k or level is not grid.levels[-1] or level.covers_all(half):
+                    break
+                half *= 2
+            if len(positions) >= k:
+                ids, dist = self._candidates(grid, alive, pending, positions, qlat, qlng, exclude)
+                if len(ids) >= k:
+                    break
+
+        # 2. everything within that distance, which contains the true k nearest
+        if len(ids) >= k:
+            radius = float(np.partition(dist, k - 1)[k - 1])
+            positions = self._circle(grid, lat, lng, radius)
+        else:
+            positions = np.arange(len(grid))       # fewer than k points anywhere near: all of them
+        ids, dist = self._candidates(grid, alive, pending, positions, qlat, qlng, exclude)
+        top = np.argpartition(dist, k - 1)[:k] if len(ids) > k else np.arange(len(ids))
+        top = top[np.argsort(dist[top], kind='stable')]
+        return list(zip(ids[top].tolist(), dist[top].tolist()))
+
+    def within(self, lat, lng, radius_km, limit=None, exclude=None):
+        """[(id, distance_km)] of live points within radius_km, closest first"""
+        grid, alive, pending = self._snapshot()
+        if radius_km < 0 or self._live == 0:
+            return []
+        lng = (lng + 180) % 360 - 180
+        positions = self._circle(grid, lat, lng, radius_km)
+        ids, dist = self._candidates(grid, alive, pending, positions, math.radians(lat), math.radians(lng), exclude)
+        hit = np.flatnonzero(dist <= radius_km)
+        hit = hit[np.argsort(dist[hit], kind='stable')]
+        if limit is not None:
+            hit = hit[:limit]
+        return list(zip(ids[hit].tolist(), dist[hit].tolist()))
+
+
+class UserLocations:
+    """
+    Users' current rows plus a GeoGrid over their locations. A user's last
+    row wins; a later row with a location moves them, one without keeps the
+    location they had.
+    """
+
+    def __init__(self, rows=()):
+        profiles, located = {}, {}
+        for row in rows:
+            uid = row.get('user_uid')
+            if not uid:
+                continue
+            profiles[uid] = self._profile(row)
+            coords = parse_coordinates(row.get('location_lat'), row.get('location_lng'))
+            if coords is not None:
+                located.pop(uid, None)      # keep insertion order = last seen
+                located[uid] = coords
+        self._profiles = profiles         # user_uid -> (uid, user_id, user_name, points)
+        self._points = [(*c, profiles[uid]) for uid, c in located.items()]   # point id -> (lat, lng, profile)
+        self._slot = {uid: i for i, uid in enumerate(located)}             # user_uid -> current point id
+        self._grid = GeoGrid()
+        n = len(self._points)
+        self._grid.build(np.arange(n),
+                         np.fromiter((p[0] for p in self._points), dtype=np.float64, count=n),
+                         np.fromiter((p[1] for p in self._points), dtype=np.float64, count=n))
+
+    @staticmethod
+    def _profile(row):
+        return (row['user_uid'], row.get('user_id'), row.get('user_name'), row.get('points_awarded'))
+
+    def upsert(self, row):
+        uid = row.get('user_uid')
+        if not uid:
+            return
+        profile = self._profiles[uid] = self._profile(row)
+        coords = parse_coordinates(row.get('location_lat'), row.get('location_lng'))
+        old = self._slot.get(uid)
+        if coords is None:
+            if old is not None:
+                self._points[old] = (*self._points[old][:2], profile)
+            return
+        if old is not None:
+            self._grid.discard(old)
+        point_id = len(self._points)
+        self._points.append((*coords, profile))
+        self._slot[uid] = point_id
+        self._grid.add(point_id, *coords)
+
+    def location_of(self, user_uid):
+        """(lat, lng) of a user's current location, or None"""
+        point_id = self._slot.get(user_uid)
+        return None if point_id is None else self._points[point_id][:2]
+
+    def user(self, user_uid):
+        """The user's latest row as a dict (location None if they have none), or None"""
+        profile = self._profiles.get(user_uid)
+        if profile is None:
+            return None
+        uid, user_id, user_name, points = profile
+        lat, lng = self.location_of(user_uid) or (None, None)
+        return {'user_uid': uid, 'user_id': user_id, 'user_name': user_name,
+                'location_lat': lat, 'location_lng': lng, 'points_awarded': points}
+
+    def _describe(self, hits):
+        return [{
+            'user_uid': self._points[i][2][0],
+            'user_name': self._points[i][2][2],
+            'location_lat': self._points[i][0],
+            'location_lng': self._points[i][1],
+            'distance_km': round(d, 3),
+        } for i, d in hits]
+
+    def nearest(self, lat, lng, k=5, exclude_user=None):
+        return self._describe(self._grid.nearest(lat, lng, k, exclude=self._slot.get(exclude_user)))
+
+    def within(self, lat, lng, radius_km, limit=None, exclude_user=None):
+        return self._describe(self._grid.within(lat, lng, radius_km, limit,
+                                                exclude=self._slot.get(exclude_user)))
+
+    def __len__(self):
+        return len(self._grid)
+
+
+class LocationIndex(CsvIndex):
+    """Spatial index over user locations from the users table (see UserLocations)"""
+
+    fieldnames = USER_FIELDS
+
+    def __init__(self, path=USERS_CSV):
+        super().__init__(path)
+        self._users = UserLocations()
+
+    def _build(self, rows):
+        return UserLocations(rows)
+
+    def _apply(self, state):
+        self._users = state
+
+    def _add(self, row):
+        self._users.upsert(row)
+
+    def location_of(self, user_uid):
+        return self._users.location_of(user_uid)
+
+    def user(self, user_uid):
+        return self._users.user(user_uid)
+
+    def nearest(self, lat, lng, k=5, exclude_user=None):
+        return self._users.nearest(lat, lng, k, exclude_user)
+
+    def within(self, lat, lng, radius_km, limit=None, exclude_user=None):
+        return self._users.within(lat, lng, radius_km, limit, exclude_user)
+
+    def __len__(self):
+        return len(self._users)
+
+
+_locations = LocationIndex()
+
+def get_location_index():
+    _locations.refresh()
+    return _locations
+
+def invalidate_location_index():
+    _locations.invalidate()
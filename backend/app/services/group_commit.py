@@ -0,0 +1,80 @@
+# app/services/group_commit.py
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+# ── tweak these for your deployment ─────────────────────────────
+COMMIT_MAX_BATCH   = int(os.getenv('LASTBITE_COMMIT_MAX_BATCH', 512))
+# extra wait for more rows; 0 = write whatever queued up during the previous write, no added delay
+COMMIT_MAX_WAIT_MS = float(os.getenv('LASTBITE_COMMIT_MAX_WAIT_MS', 0))
+# ----------------------------------------------------------------
+
+
+class GroupCommit:
+    """
+    Single-writer commit queue in front of a batched write.
+
+    Request threads `submit()` entries and wait on the returned Future. One
+    writer thread takes everything queued (up to `max_batch_size`), passes it
+    to `flush(entries)` as one batch and resolves each Future with that
+    entry's element of the returned list (or the batch's exception). Entries
+    that arrive while a write and its fsync are in flight make up the next
+    batch, so N concurrent writers cost about one write instead of N, and an
+    idle queue writes immediately.
+    """
+
+    def __init__(self, flush, max_batch_size=COMMIT_MAX_BATCH, max_wait_ms=COMMIT_MAX_WAIT_MS):
+        self.flush = flush
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            # one writer per process: a forked worker starts its own
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, args=(self._queue,), name='group-commit', daemon=True).start()
+                self._pid = os.getpid()
+
+    def submit(self, *entry):
+        """Queue one entry; the Future resolves to flush()'s result for it"""
+        self._ensure_started()
+        fut = Future()
+        self._queue.put((entry, fut))
+        return fut
+
+    def _collect(self, pending):
+        batch = [pending.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(pending.get_nowait())
+                else:
+                    batch.append(pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, pending):
+        while True:
+            batch = [(entry, fut) for entry, fut in self._collect(pending) if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.flush([entry for entry, _ in batch])
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for (_, fut), result in zip(batch, results):
+                fut.set_result(result)
@@ -0,0 +1,51 @@
+# app/services/image_preprocess.py
+
+import io
+import os
+import numpy as np
+from PIL import Image
+from app.models.fruit_model import INPUT_SIZE
+
+# ── tweak these for your deployment ─────────────────────────────
+# decode at >= this multiple of the model input size before the final resize
+DRAFT_OVERSAMPLE = int(os.getenv('LASTBITE_DRAFT_OVERSAMPLE', 2))
+# ----------------------------------------------------------------
+
+
+def open_reduced(img_bytes, size=INPUT_SIZE, oversample=DRAFT_OVERSAMPLE):
+    """
+    Decode an upload at roughly the size we need instead of full resolution.
+
+    JPEGs are decoded with libjpeg DCT scaling (`draft`, 1/2 to 1/8) so a
+    12MP phone photo never materializes at 12MP. Other formats have to be
+    fully decoded, but are box-reduced by an integer factor first so the
+    final resize works on a small image.
+    """
+    img = Image.open(io.BytesIO(img_bytes))
+    target = (size[1] * oversample, size[0] * oversample)  # PIL sizes are (w, h)
+    if img.format == 'JPEG':
+        img.draft('RGB', target)
+    img = img.convert('RGB')
+    factor = min(img.width // target[0], img.height // target[1])
+    if factor >= 2:
+        img = img.reduce(factor)
+    return img
+
+
+def to_model_input(img, out=None, size=INPUT_SIZE):
+    """
+    Resize to the model input and normalize to [-1, 1] in CHW layout, the
+    same as Resize + ToTensor + Normalize([0.5]*3, [0.5]*3), in one pass
+    into `out` (a float32 3×H×W array, e.g. one slot of a batch buffer).
+    """
+    if img.size != (size[1], size[0]):
+        img = img.resize((size[1], size[0]), Image.BILINEAR)
+    if out is None:
+        out = np.empty((3, size[0], size[1]), dtype=np.float32)
+    np.multiply(np.asarray(img, dtype=np.uint8).transpose(2, 0, 1), np.float32(2 / 255), out=out)
+    out -= 1.0
+    return out
+
+
+def fast_preprocess(img_bytes, out=None):
+    return to_model_input(open_reduced(img_bytes), out)
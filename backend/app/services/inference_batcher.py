@@ -0,0 +1,88 @@
+# app/services/inference_batcher.py
+
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
+
+import torch
+from app.models.fruit_model import model_device
+from app.services.metrics import stage
+
+# ── tweak these for your deployment ─────────────────────────────
+BATCH_MAX_SIZE    = int(os.getenv('LASTBITE_BATCH_MAX_SIZE', 32))
+BATCH_MAX_WAIT_MS = float(os.getenv('LASTBITE_BATCH_MAX_WAIT_MS', 5))
+# ----------------------------------------------------------------
+
+
+class InferenceBatcher:
+    """
+    Dynamic micro-batching in front of a two-headed model.
+
+    Request threads `submit()` single preprocessed images (C×H×W tensors).
+    One scheduler thread waits for the first request, keeps collecting until
+    `max_batch_size` requests are queued or `max_wait_ms` has passed, runs a
+    single forward pass over the stacked batch and fans the (fruit, state)
+    logit rows back out to each waiting request.
+    """
+
+    def __init__(self, model, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, device=None):
+        self.model = model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.device = device or model_device(model)
+        self._queue = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            # a thread doesn't survive a fork, so a forked worker starts its own (with its own queue)
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                threading.Thread(target=self._run, args=(self._queue,), name='inference-batcher',
+                                 daemon=True).start()
+                self._pid = os.getpid()
+
+    def submit(self, x):
+        """Queue one image tensor; the Future resolves to (fruit_logits, state_logits) for it"""
+        self._ensure_started()
+        fut = Future()
+        self._queue.put((x, fut))
+        return fut
+
+    def infer(self, x, timeout=None):
+        return self.submit(x).result(timeout=timeout)
+
+    def _collect(self, requests):
+        batch = [requests.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    batch.append(requests.get_nowait())
+                else:
+                    batch.append(requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, requests):
+        while True:
+            batch = [(x, fut) for x, fut in self._collect(requests) if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                x = torch.stack([x for x, _ in batch]).to(self.device)
+                # outside any request: the forward pass alone, against the callers' 'inference' stage
+                with stage('forward_pass'), torch.no_grad():
+                    fruit_logits, state_logits = self.model(x)
+                for i, (_, fut) in enumerate(batch):
+                    fut.set_result((fruit_logits[i], state_logits[i]))
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
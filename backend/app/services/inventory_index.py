@@ -0,0 +1,75 @@
+# app/services/inventory_index.py
+
+import os
+from collections import defaultdict
+from app.services.csv_index import CsvIndex, DATA_DIR
+
+LINKS_CSV   = os.path.join(DATA_DIR, 'user_product_link_table_v2.csv')
+LINK_FIELDS = ['user_uid', 'product_uid', 'scan_date', 'quantity']
+
+
+def parse_quantity(value):
+    """Quantity column is often blank in the data; treat anything unparsable as 0"""
+    try:
+        return int((value or '').strip())
+    except (ValueError, TypeError):
+        return 0
+
+
+class InventoryIndex(CsvIndex):
+    """User–product links grouped by user_uid"""
+
+    def __init__(self, path=LINKS_CSV):
+        super().__init__(path)
+        self._by_user = {}
+        self._linked = {}     # user_uid -> set of product_uids, built on first has_link
+
+    fieldnames = LINK_FIELDS
+
+    @staticmethod
+    def _link(row):
+        return {
+            'product_uid': row.get('product_uid'),
+            'quantity': parse_quantity(row.get('quantity')),
+        }
+
+    def _build(self, rows):
+        by_user = defaultdict(list)
+        for row in rows:
+            by_user[row.get('user_uid')].append(self._link(row))
+        return dict(by_user)
+
+    def _apply(self, state):
+        self._by_user = state
+        self._linked = {}
+
+    def _add(self, row):
+        self._by_user.setdefault(row.get('user_uid'), []).append(self._link(row))
+        linked = self._linked.get(row.get('user_uid'))
+        if linked is not None:
+            linked.add(row.get('product_uid'))
+
+    def _duplicate(self, key):
+        # key: (user_uid, product_uid)
+        return True if self.has_link(*key) else None
+
+    def has_link(self, user_uid, product_uid):
+        # a set per user who gets checked, so bulk imports into big accounts stay O(1) per row
+        linked = self._linked.get(user_uid)
+        if linked is None:
+            with self._lock:
+                linked = self._linked[user_uid] = {l['product_uid'] for l in self.links_for(user_uid)}
+        return product_uid in linked
+
+    def links_for(self, user_uid):
+        return self._by_user.get(user_uid, [])
+
+
+_index = InventoryIndex()
+
+def get_inventory_index():
+    _index.refresh()
+    return _index
+
+def invalidate_inventory_index():
+    _index.invalidate()
@@ -0,0 +1,246 @@
+# app/services/journal.py
+
+import io
+import os
+import csv
+import fcntl
+import shutil
+from contextlib import contextmanager
+
+# ── tweak these for your deployment ─────────────────────────────
+# compact a table once its journal grows past this many bytes
+JOURNAL_COMPACT_BYTES = int(os.getenv('LASTBITE_JOURNAL_COMPACT_BYTES', 4 * 1024 * 1024))
+# ----------------------------------------------------------------
+
+
+def _fsync_dir(path):
+    fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class CsvJournal:
+    """
+    Append-only write log next to a CSV table (`<table>.csv.journal`).
+
+    New rows are appended as headerless CSV lines and fsync'd, so a write
+    costs O(1) instead of rewriting the table. Readers merge the journal onto
+    the base CSV; `compact()` folds it back in. All writers serialize on an
+    flock'd `<table>.csv.lock`, which also works across worker processes.
+
+    Compaction is crash-safe:
+      1. base + journal are written to `<table>.csv.compact` and fsync'd
+      2. a `<table>.csv.compacting` marker is written
+      3. the temp file is renamed over the base (atomic)
+      4. the journal is truncated and the marker removed
+    `recover()` finishes or rolls back whichever step was interrupted, and
+    drops a torn last line left by a crash mid-append.
+    """
+
+    def __init__(self, table_path, fieldnames):
+        self.table_path = table_path
+        self.fieldnames = list(fieldnames)
+        self.path         = table_path + '.journal'
+        self.lock_path    = table_path + '.lock'
+        self.tmp_path     = table_path + '.compact'
+        self.marker_path  = table_path + '.compacting'
+        self._recovered = False
+
+    @contextmanager
+    def locked(self, shared=False):
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # the first lock taken in a process is exclusive so it can run recovery
+            exclusive = not shared or not self._recovered
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            if not self._recovered:
+                self._recover_locked()
+            yield
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def size(self):
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def _encode(self, rows):
+        buf = io.StringIO()
+        w = csv.DictWriter(buf, fieldnames=self.fieldnames, extrasaction='ignore', lineterminator='\n')
+        for row in rows:
+            # one record per line, so a torn tail can be found by the last newline
+            w.writerow({k: str(v).replace('\r', ' ').replace('\n', ' ') if v is not None else ''
+                        for k, v in row.items()})
+        return buf.getvalue().encode('utf-8')
+
+    def append(self, rows):
+        """Append rows and fsync; returns the journal size after the write"""
+        with self.locked():
+            return self.append_locked(rows)
+
+    def append_locked(self, rows):
+        """append() for a caller already holding locked()"""
+        data = self._encode(rows)
+        if not data:
+            return self.size()
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+            return os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+    def read(self, offset=0):
+        """
+        Complete rows appended at or after byte `offset`.
+        Returns (rows, end_offset); a partially written last line is left for later.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        end = data.rfind(b'\n') + 1
+        if not end:
+            return [], offset
+        text = data[:end].decode('utf-8')
+        rows = list(csv.DictReader(io.StringIO(text, newline=''), fieldnames=self.fieldnames))
+        return rows, offset + end
+
+    def recover(self):
+        with self.locked():
+            self._recover_locked()
+
+    def _recover_locked(self):
+        if os.path.exists(self.marker_path):
+            if os.path.exists(self.tmp_path):
+                # crashed before the rename: base is untouched, journal still authoritative
+                os.remove(self.tmp_path)
+            else:
+                # crashed after the rename: journal rows are already in the base
+                if os.path.exists(self.path):
+                    os.truncate(self.path, 0)
+            os.remove(self.marker_path)
+            _fsync_dir(self.table_path)
+        elif os.path.exists(self.tmp_path):
+            # crashed while writing the temp file
+            os.remove(self.tmp_path)
+
+        size = self.size()
+        if size:
+            # drop a torn last line (no trailing newline) left by a crash mid-append
+            with open(self.path, 'rb+') as f:
+                start = max(0, size - 64 * 1024)
+                f.seek(start)
+                cut = f.read().rfind(b'\n') + 1
+                if (cut or start == 0) and start + cut != size:
+                    f.truncate(start + cut)
+                    os.fsync(f.fileno())
+        self._recovered = True
+
+    def compact(self):
+        """Fold the journal into the base CSV; returns the number of journal bytes folded"""
+        with self.locked():
+            rows, folded = self.read(0)
+            if not rows:
+                return 0
+
+            header = None
+            if os.path.exists(self.table_path):
+                with open(self.table_path, newline='') as f:
+                    header = next(csv.reader(f), None)
+            header = header or self.fieldnames
+
+            with open(self.tmp_path, 'w', newline='') as out:
+                needs_newline = False
+                if os.path.exists(self.table_path) and os.path.getsize(self.table_path):
+                    with open(self.table_path, newline='') as base:
+                        shutil.copyfileobj(base, out, 1024 * 1024)
+                    with open(self.table_path, 'rb') as base:
+                        base.seek(-1, os.SEEK_END)
+                        needs_newline = base.read(1) not in (b'\n', b'\r')
+                else:
+                    csv.writer(out, lineterminator='\n').writerow(header)
+                if needs_newline:
+                    out.write('\n')
+                w = csv.DictWriter(out, fieldnames=header, extrasaction='ignore', lineterminator='\n')
+                w.writerows(rows)
+                out.flush()
+                os.fsync(out.fileno())
+
+            self._swap_in(folded)
+            return folded
+
+    def snapshot(self):
+        """
+        (open base file or None, its signature, journal rows, journal offset),
+        taken together under the lock. Compaction renames a new base into
+        place rather than editing it, so the open file keeps reading the old
+        one: the snapshot stays consistent without blocking writers while it
+        is consumed. The caller closes the file.
+        """
+        with self.locked(shared=True):
+            rows, offset = self.read(0)
+            try:
+                base = open(self.table_path, newline='')
+            except FileNotFoundError:
+                return None, None, rows, offset
+            st = os.fstat(base.fileno())
+            return base, (st.st_mtime_ns, st.st_size), rows, offset
+
+    def rewrite(self, new_base, signature, offset):
+        """
+        Swap in `new_base`, a rebuilt table (header included, same directory)
+        made from a snapshot() with this base `signature` and journal `offset`. Rows
+        appended since the snapshot are carried over; if the base itself
+        changed (a compaction ran), nothing is touched and RuntimeError is
+        raised. Crash-safe like compact(). Returns journal bytes folded.
+        """
+        with self.locked():
+            try:
+                st = os.stat(self.table_path)
+                current = (st.st_mtime_ns, st.st_size)
+            except FileNotFoundError:
+                current = None
+            if current != signature or self.size() < offset:
+                raise RuntimeError(f"{self.table_path} changed since the snapshot; run again")
+            newer, folded = self.read(offset)
+
+            os.replace(new_base, self.tmp_path)
+            with open(self.tmp_path, 'a', newline='') as out:
+                w = csv.DictWriter(out, fieldnames=self.fieldnames, extrasaction='ignore', lineterminator='\n')
+                w.writerows(newer)
+                out.flush()
+                os.fsync(out.fileno())
+            self._swap_in(folded)
+            return folded
+
+    def _swap_in(self, folded):
+        """Steps 2-4 of a compaction: rename the temp file over the base, then empty the journal"""
+        with open(self.marker_path, 'w') as m:
+            m.write(str(folded))
+            m.flush()
+            os.fsync(m.fileno())
+        _fsync_dir(self.table_path)
+
+        os.replace(self.tmp_path, self.table_path)
+        _fsync_dir(self.table_path)
+
+        if os.path.exists(self.path):
+            os.truncate(self.path, 0)
+        os.remove(self.marker_path)
+        _fsync_dir(self.table_path)
+
+
+if __name__ == '__main__':
+    # on-demand compaction: python -m app.services.journal
+    from app.services.inventory_index import get_inventory_index
+    from app.services.product_catalog import get_product_catalog
+    for index in (get_product_catalog(), get_inventory_index()):
+        print(f"{index.path}: folded {index.compact()} journal bytes")
@@ -0,0 +1,276 @@
+# app/services/metrics.py
+
+import os
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import g, request
+
+from app.services.profiler import profiler
+
+logger = logging.getLogger(__name__)
+
+# ── tweak these for your deployment ─────────────────────────────
+# requests slower than this log their per-stage breakdown at WARNING (0 = never)
+SLOW_REQUEST_MS = float(os.getenv('LASTBITE_SLOW_REQUEST_MS', 1000))
+# where worker processes leave their values so /metrics on any of them sums all (serve.py sets it)
+METRICS_DIR     = os.getenv('LASTBITE_METRICS_DIR', '')
+METRICS_FLUSH_S = float(os.getenv('LASTBITE_METRICS_FLUSH_S', 1))     # how often a worker writes them there
+# ----------------------------------------------------------------
+
+# seconds; spans a cached barcode hit (~0.3 ms) to an OpenAI call near its deadline
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REGISTRY = []
+
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Histogram:
+    """
+    Cumulative-bucket latency histogram, one series per label values,
+    rendered in the Prometheus text format. observe() is a bisect and a few
+    additions under a lock, about a microsecond.
+    """
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}       # label values -> [count per bucket..., count above the last, sum]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[i] += 1
+            series[-1] += value
+
+    def raw(self):
+        """{label values: [count per bucket..., count above the last, sum]}, a copy"""
+        with self._lock:
+            return {labels: list(series) for labels, series in self._series.items()}
+
+    @staticmethod
+    def merge(a, b):
+        return [x + y for x, y in zip(a, b)]
+
+    def snapshot(self, raw=None):
+        """{label values: (cumulative bucket counts incl. +Inf, sum)} of raw() (by default this process's)"""
+        out = {}
+        for labels, series in (self.raw() if raw is None else raw).items():
+            cumulative, total = [], 0
+            for n in series[:-1]:
+                total += n
+                cumulative.append(total)
+            out[labels] = (cumulative, series[-1])
+        return out
+
+    def render(self, raw=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (cumulative, total) in sorted(self.snapshot(raw).items()):
+            pairs = [f'{k}="{_label_value(v)}"' for k, v in zip(self.labelnames, labels)]
+            for le, count in zip([*map(repr, map(float, self.buckets)), '+Inf'], cumulative):
+                bucket = ','.join([*pairs, 'le="%s"' % le])
+                lines.append(f"{self.name}_bucket{{{bucket}}} {count}")
+            suffix = f"{{{','.join(pairs)}}}" if pairs else ''
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {cumulative[-1]}")
+        return '\n'.join(lines)
+
+
+class Counter:
+    """Monotonic count, one series per label values, rendered in the Prometheus text format"""
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def raw(self):
+        with self._lock:
+            return dict(self._series)
+
+    snapshot = raw
+
+    @staticmethod
+    def merge(a, b):
+        return a + b
+
+    def render(self, raw=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, count in sorted((self.raw() if raw is None else raw).items()):
+            pairs = ','.join(f'{k}="{_label_value(v)}"' for k, v in zip(self.labelnames, labels))
+            lines.append(f"{self.name}{{{pairs}}} {count}" if pairs else f"{self.name} {count}")
+        return '\n'.join(lines)
+
+
+def render():
+    """
+    Every registered metric in the Prometheus text exposition format (0.0.4).
+    With METRICS_DIR, summed over this process and the values every other
+    worker last wrote there, so a scrape answered by any worker gives the
+    same totals.
+    """
+    raws = {m.name: m.raw() for m in REGISTRY}
+    if METRICS_DIR:
+        by_name = {m.name: m for m in REGISTRY}
+        for values in _other_workers():
+            for name, series in values.items():
+                metric = by_name.get(name)
+                if metric is None:
+                    continue
+                mine = raws[name]
+                for labels, value in series:
+                    labels = tuple(labels)
+                    mine[labels] = metric.merge(mine[labels], value) if labels in mine else value
+    return '\n'.join(m.render(raws[m.name]) for m in REGISTRY) + '\n'
+
+
+def _other_workers():
+    """The values each other process wrote to METRICS_DIR, including workers that have since exited"""
+    mine = f'{os.getpid()}.json'
+    try:
+        entries = [e.path for e in os.scandir(METRICS_DIR) if e.name.endswith('.json') and e.name != mine]
+    except OSError:
+        return []
+    out = []
+    for path in entries:
+        try:
+            with open(path) as f:
+                out.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return out
+
+
+def flush():
+    """Write this process's values to METRICS_DIR/<pid>.json for the other workers' /metrics"""
+    if not METRICS_DIR:
+        return
+    path = os.path.join(METRICS_DIR, f'{os.getpid()}.json')
+    values = {m.name: [[list(labels), value] for labels, value in m.raw().items()] for m in REGISTRY}
+    with open(path + '.tmp', 'w') as f:
+        json.dump(values, f)
+    os.replace(path + '.tmp', path)     # readers see the old file or the new one, never half of it
+
+
+def reset():
+    """Forget this process's values: a forked worker starts from zero rather than from its parent's"""
+    for m in REGISTRY:
+        with m._lock:
+            m._series.clear()
+
+
+def start_flushing():
+    """flush() every METRICS_FLUSH_S from a daemon thread of this process (a worker calls it after the fork)"""
+    if not METRICS_DIR:
+        return
+
+    def run():
+        while True:
+            time.sleep(METRICS_FLUSH_S)
+            try:
+                flush()
+            except OSError as e:
+                logger.warning("could not write metrics to %s: %s", METRICS_DIR, e)
+
+    threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+
+REQUEST_SECONDS = Histogram('lastbite_request_seconds', 'Time to produce the response, by route',
+                            ('route', 'method', 'status'))
+STAGE_SECONDS   = Histogram('lastbite_stage_seconds', 'Time spent in one stage of a request, by route',
+                            ('route', 'stage'))
+
+
+class _Timings:
+    __slots__ = ('route', 'stages')
+
+    def __init__(self, route):
+        self.route = route
+        self.stages = []        # (stage, seconds) in the order they finished
+
+
+_current = ContextVar('lastbite_request_timings', default=None)
+
+
+@contextmanager
+def stage(name):
+    """
+    Time a block as one stage of the current request: recorded in
+    lastbite_stage_seconds and in the request's breakdown. Outside a request
+    (or in a thread the request's context wasn't copied to) the route label
+    is empty.
+    """
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - t0
+        timings = _current.get()
+        if timings is None:
+            STAGE_SECONDS.observe(elapsed, '', name)
+        else:
+            STAGE_SECONDS.observe(elapsed, timings.route, name)
+            timings.stages.append((name, elapsed))
+
+
+def breakdown(timings):
+    totals = {}
+    for name, seconds in timings.stages:
+        totals[name] = totals.get(name, 0.0) + seconds
+    return ', '.join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in totals.items())
+
+
+def init_app(app):
+    """Time every request by route, log slow ones, and profile them if the profiler is on"""
+
+    @app.before_request
+    def _start_timer():
+        rule = request.url_rule
+        timings = _Timings(rule.rule if rule is not None else '<unmatched>')
+        g._metrics = (time.perf_counter(), timings, _current.set(timings))
+        if profiler.enabled:
+            profiler.begin()
+
+    @app.after_request
+    def _record(response):
+        started = g.pop('_metrics', None)
+        if started is None:
+            return response
+        t0, timings, token = started
+        elapsed = time.perf_counter() - t0
+        REQUEST_SECONDS.observe(elapsed, timings.route, request.method, str(response.status_code))
+        if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+            logger.warning("slow request %s %s: %.0f ms (%s)", request.method, request.path, elapsed * 1000,
+                           breakdown(timings) or 'no stages recorded')
+        if profiler.enabled:
+            profiler.end(timings.route, elapsed)
+        _current.reset(token)
+        return response
+
+    @app.teardown_request
+    def _abandon(exc):
+        # after_request doesn't run when a view raises; don't leave a profile running
+        if g.pop('_metrics', None) is not None and profiler.enabled:
+            profiler.end(None, 0)
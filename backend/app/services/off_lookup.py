@@ -0,0 +1,239 @@
+# app/services/off_lookup.py
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.services.csv_index import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# ── tweak these for your deployment ─────────────────────────────
+OFF_BASE_URL     = os.getenv('LASTBITE_OFF_URL', 'https://world.openfoodfacts.org')
+OFF_TIMEOUT      = float(os.getenv('LASTBITE_OFF_TIMEOUT', 5))
+OFF_CACHE_PATH   = os.getenv('LASTBITE_OFF_CACHE_PATH', os.path.join(DATA_DIR, 'off_cache.sqlite'))
+OFF_CACHE_SIZE   = int(os.getenv('LASTBITE_OFF_CACHE_SIZE', 10000))
+OFF_TTL          = float(os.getenv('LASTBITE_OFF_TTL', 7 * 24 * 3600))   # known products
+OFF_NEGATIVE_TTL = float(os.getenv('LASTBITE_OFF_NEGATIVE_TTL', 3600))   # barcodes OFF doesn't know
+OFF_CACHE_POOL   = int(os.getenv('LASTBITE_OFF_CACHE_POOL', 4))          # idle SQLite connections per process
+# ----------------------------------------------------------------
+
+
+class LruTtlCache:
+    """Bounded in-memory cache; entries expire `ttl` seconds after being stored"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires < time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.capacity:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class OffLookup:
+    """
+    Barcode → product name lookups against OpenFoodFacts.
+
+    Tiers: an LRU+TTL memory cache, then a SQLite store that survives
+    restarts and is shared by every worker, then the network through one
+    pooled keep-alive session. Barcodes OFF doesn't know are cached too, with
+    a shorter TTL; network errors are not cached. Concurrent lookups of the
+    same barcode share a single upstream request.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, base_url=OFF_BASE_URL, cache_path=OFF_CACHE_PATH, capacity=OFF_CACHE_SIZE,
+                 ttl=OFF_TTL, negative_ttl=OFF_NEGATIVE_TTL, timeout=OFF_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+        self.memory = LruTtlCache(capacity)
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+        self.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=32))
+        self._pool = []
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            ('memory_hits', 'disk_hits', 'negative_hits', 'misses', 'coalesced',
+             'upstream_calls', 'upstream_errors'), 0)
+        self._upstream_seconds = 0.0
+        self._upstream_max = 0.0
+
+    # ── disk tier ───────────────────────────────────────────────
+    def _connect(self, schema=False):
+        conn = sqlite3.connect(self.cache_path, timeout=5, check_same_thread=False)
+        if schema:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS off_cache ('
+                         'barcode TEXT PRIMARY KEY, name TEXT, expires_at REAL NOT NULL)')
+        return conn
+
+    @contextmanager
+    def _db(self):
+        """A connection from this process's pool, for the length of the block (as SqliteRepository._db)"""
+        pid = os.getpid()
+        with self._pool_lock:
+            if self._pool_pid != pid:
+                # a connection must not cross a fork; the table is created once per process
+                self._pool, self._pool_pid = [], pid
+                self._pool.append(self._connect(schema=True))
+            conn = self._pool.pop() if self._pool else None
+        if conn is None:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            with self._pool_lock:
+                keep = self._pool_pid == pid and len(self._pool) < OFF_CACHE_POOL
+                if keep:
+                    self._pool.append(conn)
+            if not keep and os.getpid() == pid:
+                conn.close()
+
+    def _disk_get(self, barcode):
+        try:
+            with self._db() as conn:
+                row = conn.execute(
+                    'SELECT name, expires_at FROM off_cache WHERE barcode = ?', (barcode,)).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"OFF cache read failed: {e}")
+            return self._MISSING
+        if row is None or row[1] < time.time():
+            return self._MISSING
+        self.memory.put(barcode, row[0], row[1] - time.time())
+        return row[0]
+
+    def _disk_put(self, barcode, name, ttl):
+        try:
+            with self._db() as conn, conn:
+                conn.execute('INSERT OR REPLACE INTO off_cache VALUES (?, ?, ?)',
+                             (barcode, name, time.time() + ttl))
+        except sqlite3.Error as e:
+            logger.warning(f"OFF cache write failed: {e}")
+
+    # ── lookups ─────────────────────────────────────────────────
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _fetch(self, barcode):
+        """Returns the name, None if OFF doesn't know it; raises on network errors"""
+        self._count('upstream_calls')
+        t0 = time.perf_counter()
+        try:
+            r = self.session.get(f"{self.base_url}/api/v0/product/{barcode}.json", timeout=self.timeout)
+            j = r.json()
+        except Exception:
+            self._count('upstream_errors')
+            raise
+        finally:
+            elapsed = time.perf_counter() - t0
+            with self._stats_lock:
+                self._upstream_seconds += elapsed
+                self._upstream_max = max(self._upstream_max, elapsed)
+        if j.get('status') == 1:
+            return (j.get('product') or {}).get('product_name') or None
+        return None
+
+    def lookup(self, barcode):
+        """Product name for a barcode, or None if unknown or OFF is unreachable"""
+        name = self.memory.get(barcode, self._MISSING)
+        if name is not self._MISSING:
+            self._count('memory_hits' if name is not None else 'negative_hits')
+            return name
+        name = self._disk_get(barcode)
+        if name is not self._MISSING:
+            self._count('disk_hits' if name is not None else 'negative_hits')
+            return name
+
+        with self._inflight_lock:
+            fut = self._inflight.get(barcode)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[barcode] = Future()
+        if not leader:
+            self._count('coalesced')
+            try:
+                # the leader's request is bounded by a connect and a read timeout
+                return fut.result(timeout=2 * self.timeout + 5)
+            except Exception as e:
+                logger.warning(f"OFF error: shared lookup of {barcode} failed: {e!r}")
+                return None
+
+        self._count('misses')
+        try:
+            name = self._fetch(barcode)
+            ttl = self.ttl if name else self.negative_ttl
+            self.memory.put(barcode, name, ttl)
+            self._disk_put(barcode, name, ttl)
+        except Exception as e:
+            logger.warning(f"OFF error: {e}")
+            name = None
+        except BaseException as e:
+            # interrupted: fail the followers (as if OFF were unreachable) rather than leave them waiting
+            fut.set_exception(RuntimeError(f"lookup interrupted: {e!r}"))
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[barcode]
+        fut.set_result(name)
+        return name
+
+    def stats(self):
+        with self._stats_lock:
+            s = dict(self._stats)
+            upstream_s, upstream_max = self._upstream_seconds, self._upstream_max
+        served = s['memory_hits'] + s['disk_hits'] + s['negative_hits'] + s['coalesced']
+        total = served + s['misses']
+        s['hit_ratio'] = served / total if total else 0.0
+        s['upstream_avg_ms'] = upstream_s / s['upstream_calls'] * 1000 if s['upstream_calls'] else 0.0
+        s['upstream_max_ms'] = upstream_max * 1000
+        s['memory_entries'] = len(self.memory)
+        return s
+
+
+_lookup = None
+_lookup_lock = threading.Lock()
+
+def get_off_lookup():
+    global _lookup
+    if _lookup is None:
+        with _lookup_lock:
+            if _lookup is None:
+                _lookup = OffLookup()
+    return _lookup
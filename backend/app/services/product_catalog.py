@@ -0,0 +1,518 @@
+# app/services/product_catalog.py
+
+import os
+import re
+import csv
+import json
+import fcntl
+import shutil
+import hashlib
+import logging
+import itertools
+from datetime import date, datetime
+from collections import Counter
+
+import numpy as np
+
+from app.services.csv_index import CsvIndex, DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# ── tweak these for your deployment ─────────────────────────────
+# keep the base products table as a memory-mapped columnar snapshot (<table>.csv.snapshot/)
+# that every worker shares; 0 = index it in Python dicts, a private copy per process
+CATALOG_SNAPSHOT = os.getenv('LASTBITE_CATALOG_SNAPSHOT', '1') != '0'
+# ----------------------------------------------------------------
+
+PRODUCTS_CSV = os.path.join(DATA_DIR, 'products_table_v2.csv')
+PRODUCT_FIELDS = ['product_uid', 'product_id', 'barcode', 'item_name', 'category', 'scanned_date', 'expiry_date']
+
+NAT = np.datetime64('NaT', 'D')
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_name(name):
+    """Matching key for item names: casefolded, whitespace collapsed"""
+    return _WHITESPACE.sub(' ', str(name).casefold()).strip()
+
+
+def singular_forms(key):
+    """
+    Naive singulars of a normalized name, most likely first: "apples" ->
+    apple, "berries" -> berry/berrie, "cookies" -> cooky/cookie, "tomatoes"
+    -> tomato/tomatoe. Both sides of a lookup go through this, so a wrong
+    extra guess costs nothing as long as the right one is in the list.
+    """
+    if len(key) <= 3 or not key.endswith('s') or key.endswith(('ss', 'us')):
+        return ()
+    if key.endswith('ies'):
+        return (key[:-3] + 'y', key[:-1])
+    if key.endswith('es'):
+        return (key[:-2], key[:-1])
+    return (key[:-1],)
+
+
+def parse_date(value):
+    """YYYY-MM-DD string -> date, or None if empty/malformed"""
+    try:
+        if len(value) == 10 and value[4] == value[7] == '-':
+            return date.fromisoformat(value)      # the common case, ~20x faster than strptime
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_dates(values):
+    """YYYY-MM-DD strings -> datetime64[D] array, NaT where empty or malformed"""
+    values = [v or 'NaT' for v in values]
+    try:
+        return np.array(values, dtype='datetime64[D]')
+    except ValueError:
+        out = np.full(len(values), NAT)
+        for i, v in enumerate(values):
+            try:
+                out[i] = np.datetime64(v, 'D')
+            except ValueError:
+                pass
+        return out
+
+
+class _Strings:
+    """Read-only sequence of str kept as one UTF-8 buffer plus offsets"""
+
+    def __init__(self, data, offsets):
+        self._data = data
+        self._offsets = offsets
+
+    @staticmethod
+    def encode(strings):
+        """(buffer, offsets) arrays for a list of str"""
+        raw = [s.encode() for s in strings]
+        offsets = np.zeros(len(raw) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in raw], out=offsets[1:])
+        return np.frombuffer(b''.join(raw), dtype=np.uint8), offsets
+
+    def __getitem__(self, i):
+        return self._data[self._offsets[i]:self._offsets[i + 1]].tobytes().decode()
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+
+def _as_bytes(values):
+    """Fixed-width UTF-8 bytes array of str values"""
+    try:
+        return np.array(values, dtype='S')          # ASCII, converted in C
+    except UnicodeEncodeError:
+        return np.array([v.encode() for v in values], dtype='S')
+
+
+def _name_hash(key):
+    """Stable 64-bit hash of a normalized name (the same in every process, unlike hash())"""
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little')
+
+
+def _map(path):
+    # a plain ndarray over the mapping: np.memmap's Python-level indexing costs µs per element
+    return np.load(path, mmap_mode='r').view(np.ndarray)
+
+
+class CatalogSnapshot:
+    """
+    The base products CSV as read-only NumPy columns, memory-mapped from
+    `<table>.csv.snapshot/<mtime_ns>-<size>/`.
+
+    Row i is the i-th row of the CSV. product_uid, product_id and barcode
+    are fixed-width bytes; item_name and category are integer codes into a
+    dictionary of distinct values; scanned/expiry dates are datetime64[D]
+    (the odd value that doesn't survive that round trip is kept verbatim in
+    meta.json). Lookups binary-search sorted key arrays (uids, barcodes,
+    hashes of normalized names and their singulars) holding the row each
+    key resolves to, under the same rules as the dict index: last row wins
+    for a product_uid, first row for a barcode or a name.
+
+    The files are written once per version of the CSV and never modified,
+    so every worker maps the same page-cache pages: nothing is parsed at
+    start-up and nothing gets copied when a forked worker reads it. A new
+    version is built (under an flock, by one process) the first time the
+    CSV is seen with a different mtime/size, and older versions are removed.
+    """
+
+    FORMAT = 1
+    CHUNK = 100_000
+    _ARRAYS = ('product_uid', 'product_id', 'barcode', 'item_name', 'category', 'scanned_date', 'expiry_date',
+               'uid_keys', 'uid_rows', 'barcode_keys', 'barcode_rows',
+               'name_hashes', 'name_rows', 'singular_hashes', 'singular_rows')
+
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['format'] != self.FORMAT:
+            raise ValueError(f"{directory}: snapshot format {meta['format']}, expected {self.FORMAT}")
+        self.directory = directory
+        self.signature = tuple(meta['signature'])
+        self.categories = meta['categories']
+        self.raw = {col: {int(i): v for i, v in values.items()} for col, values in meta['raw'].items()}
+        for name in self._ARRAYS:
+            setattr(self, name, _map(os.path.join(directory, f'{name}.npy')))
+        self.names = _Strings(_map(os.path.join(directory, 'names.data.npy')),
+                              _map(os.path.join(directory, 'names.offsets.npy')))
+
+    # ── building ────────────────────────────────────────────────
+    @classmethod
+    def open(cls, path, signature):
+        """
+        The snapshot of the CSV at `path` as of `signature`, built first if
+        there isn't one; None if the table's columns aren't PRODUCT_FIELDS
+        """
+        root = path + '.snapshot'
+        directory = os.path.join(root, '%d-%d' % signature)
+        try:
+            return cls(directory)
+        except (OSError, ValueError, KeyError):
+            pass
+        os.makedirs(root, exist_ok=True)
+        fd = os.open(os.path.join(root, '.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                return cls(directory)       # another process built it while we waited
+            except (OSError, ValueError, KeyError):
+                shutil.rmtree(directory, ignore_errors=True)
+            with open(path, newline='') as f:
+                st = os.fstat(f.fileno())
+                directory = os.path.join(root, '%d-%d' % (st.st_mtime_ns, st.st_size))
+                tmp = os.path.join(root, f'.build-{os.getpid()}')
+                shutil.rmtree(tmp, ignore_errors=True)
+                os.makedirs(tmp)
+                if not cls._write(f, (st.st_mtime_ns, st.st_size), tmp):
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    return None
+            shutil.rmtree(directory, ignore_errors=True)
+            os.rename(tmp, directory)
+            for old in os.listdir(root):
+                # older versions and builds that crashed; processes still mapping
+                # an old version keep its pages until they reload
+                if old not in ('.lock', os.path.basename(directory)):
+                    shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+            return cls(directory)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    @classmethod
+    def _write(cls, f, signature, out):
+        """Write the snapshot of an open CSV into `out`; False if its header isn't PRODUCT_FIELDS"""
+        reader = csv.reader(f)
+        header = next(reader, None) or []
+        if sorted(header) != sorted(PRODUCT_FIELDS):
+            logger.info("%s has columns %s, not %s; indexing it without a snapshot", f.name, header, PRODUCT_FIELDS)
+            return False
+        take = [header.index(name) for name in PRODUCT_FIELDS]
+        width = len(header)
+
+        codes = {'item_name': {}, 'category': {}}
+        chunks = {name: [] for name in PRODUCT_FIELDS}
+        raw = {'scanned_date': {}, 'expiry_date': {}}
+        n = 0
+        while True:
+            rows = list(itertools.islice(reader, cls.CHUNK))
+            if not rows:
+                break
+            if not all(rows):
+                rows = [r for r in rows if r]       # blank lines, as DictReader skips them
+            if min(map(len, rows)) < width:
+                rows = [r + [''] * (width - len(r)) for r in rows]
+            cols = list(zip(*rows))
+            for name, i in zip(PRODUCT_FIELDS, take):
+                values = cols[i]
+                if name in codes:
+                    # dictionary-encode: the chunk's distinct values, then each row's index into them
+                    distinct, inverse = np.unique(np.array(values, dtype=str), return_inverse=True)
+                    lookup = np.array([codes[name].setdefault(v, len(codes[name])) for v in distinct.tolist()],
+                                      dtype=np.int32)
+                    chunks[name].append(lookup[inverse.reshape(-1)])
+                elif name in raw:
+                    parsed = parse_dates(values)
+                    mismatch = np.datetime_as_string(parsed) != np.array(values, dtype=str)
+                    for j in np.flatnonzero(mismatch).tolist():
+                        if values[j]:
+                            raw[name][n + j] = values[j]
+                    chunks[name].append(parsed)
+                else:
+                    chunks[name].append(_as_bytes(values))
+            n += len(rows)
+
+        empty = {'item_name': np.int32, 'category': np.int32, 'scanned_date': 'datetime64[D]',
+                 'expiry_date': 'datetime64[D]'}
+        cols = {name: np.concatenate(parts) if parts else np.zeros(0, dtype=empty.get(name, 'S1'))
+                for name, parts in chunks.items()}
+        cols['category'] = cols['category'].astype(np.int16 if len(codes['category']) < 2**15 else np.int32)
+
+        # product_uid: last row wins
+        uid = cols['product_uid']
+        order = np.argsort(uid, kind='stable')
+        keys = uid[order]
+        last = np.ones(len(keys), dtype=bool)
+        last[:-1] = keys[1:] != keys[:-1]
+        cols['uid_keys'], cols['uid_rows'] = keys[last], order[last].astype(np.int32)
+
+        # barcode: first row wins, blanks aren't indexed
+        barcode = cols['barcode']
+        order = np.flatnonzero(barcode != b'')
+        order = order[np.argsort(barcode[order], kind='stable')]
+        keys = barcode[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        cols['barcode_keys'], cols['barcode_rows'] = keys[first], order[first].astype(np.int32)
+
+        # names: the first row of each normalized name, then of each singular form, as the dict index does
+        names = list(codes['item_name'])
+        name_codes, first_rows = np.unique(cols['item_name'], return_index=True)
+        by_name, by_singular = {}, {}
+        for i in np.argsort(first_rows, kind='stable').tolist():
+            if not names[name_codes[i]]:
+                continue
+            key = normalize_name(names[name_codes[i]])
+            if key not in by_name:
+                by_name[key] = int(first_rows[i])
+                for form in singular_forms(key):
+                    by_singular.setdefault(form, by_name[key])
+        for prefix, index in (('name', by_name), ('singular', by_singular)):
+            hashes = np.array([_name_hash(k) for k in index], dtype=np.uint64)
+            order = np.argsort(hashes, kind='stable')
+            cols[f'{prefix}_hashes'] = hashes[order]
+            cols[f'{prefix}_rows'] = np.array(list(index.values()), dtype=np.int32)[order]
+
+        for name, values in cols.items():
+            np.save(os.path.join(out, f'{name}.npy'), values)
+        data, offsets = _Strings.encode(names)
+        np.save(os.path.join(out, 'names.data.npy'), data)
+        np.save(os.path.join(out, 'names.offsets.npy'), offsets)
+        # written last: a directory with meta.json is complete
+        with open(os.path.join(out, 'meta.json'), 'w') as m:
+            json.dump({'format': cls.FORMAT, 'signature': list(signature), 'rows': n,
+                       'categories': list(codes['category']), 'raw': raw}, m)
+        logger.info("built %s snapshot: %d rows, %d names, %d categories", f.name, n, len(names),
+                    len(codes['category']))
+        return True
+
+    # ── reading ─────────────────────────────────────────────────
+    def _date(self, column, i):
+        raw = self.raw[column].get(i)
+        if raw is not None:
+            return raw
+        value = getattr(self, column)[i]
+        return '' if np.isnat(value) else str(value)
+
+    def row(self, i):
+        """Row i as the dict csv.DictReader would give (a new one per call)"""
+        return {
+            'product_uid':  self.product_uid[i].decode(),
+            'product_id':   self.product_id[i].decode(),
+            'barcode':      self.barcode[i].decode(),
+            'item_name':    self.names[self.item_name[i]],
+            'category':     self.categories[self.category[i]],
+            'scanned_date': self._date('scanned_date', i),
+            'expiry_date':  self._date('expiry_date', i),
+        }
+
+    def expiry(self, i):
+        """Row i's expiry as a date, or None; what parse_date() makes of its expiry_date"""
+        raw = self.raw['expiry_date'].get(i)
+        if raw is not None:
+            return parse_date(raw)
+        value = self.expiry_date[i]
+        return None if np.isnat(value) else value.astype(object)
+
+    @staticmethod
+    def _find(keys, rows, key):
+        i = int(np.searchsorted(keys, key))
+        if i < len(keys) and keys[i] == key:
+            return int(rows[i])
+        return None
+
+    def get(self, product_uid):
+        i = self._find(self.uid_keys, self.uid_rows, str(product_uid).encode())
+        return None if i is None else self.row(i)
+
+    def by_barcode(self, barcode):
+        i = self._find(self.barcode_keys, self.barcode_rows, str(barcode).encode()) if barcode else None
+        return None if i is None else self.row(i)
+
+    def by_name(self, key, singular=False):
+        """(row, expiry date) of the first product whose normalized name (or, `singular`, one of its singulars) is `key`"""
+        hashes, rows = (self.singular_hashes, self.singular_rows) if singular else (self.name_hashes, self.name_rows)
+        h = np.uint64(_name_hash(key))
+        i = int(np.searchsorted(hashes, h))
+        while i < len(hashes) and hashes[i] == h:
+            row = int(rows[i])
+            name = normalize_name(self.names[self.item_name[row]])
+            if (key in singular_forms(name)) if singular else (name == key):
+                return self.row(row), self.expiry(row)
+            i += 1          # a hash collision
+        return None
+
+    def rows_of(self, product_uids):
+        """Row index of each uid (int64 array), -1 where it isn't in the snapshot"""
+        query = _as_bytes([str(u) if u is not None else '' for u in product_uids])
+        if not len(query) or not len(self.uid_keys):
+            return np.full(len(query), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.uid_keys, query), len(self.uid_keys) - 1)
+        return np.where(self.uid_keys[pos] == query, self.uid_rows[pos], -1).astype(np.int64)
+
+    def __len__(self):
+        """Distinct product_uids"""
+        return len(self.uid_keys)
+
+
+class ProductCatalog(CsvIndex):
+    """
+    Products keyed by product_uid, by barcode and by normalized item name,
+    plus the set of categories in use.
+
+    The base CSV is served from a shared CatalogSnapshot (unless
+    LASTBITE_CATALOG_SNAPSHOT=0 or it can't be snapshotted); the dicts then
+    hold only rows appended through the journal since it was built.
+    """
+
+    fieldnames = PRODUCT_FIELDS
+
+    def __init__(self, path=PRODUCTS_CSV):
+        super().__init__(path)
+        self._snapshot = None
+        self._by_uid = {}
+        self._by_barcode = {}
+        self._by_name = {}        # normalized name -> (row, expiry date)
+        self._by_singular = {}    # naive singulars of those names -> same
+        self._category_counts = Counter()
+        self._categories = ()
+
+    def _load(self, sig, journal_rows):
+        snapshot = CatalogSnapshot.open(self.path, sig) if CATALOG_SNAPSHOT and sig is not None else None
+        if snapshot is None:
+            return super()._load(sig, journal_rows)
+        return self._build(journal_rows, snapshot)
+
+    def _build(self, rows, snapshot=None):
+        by_uid, by_barcode, by_name, by_singular, cats = {}, {}, {}, {}, Counter()
+        for row in rows:
+            self._index_row(row, by_uid, by_barcode, by_name, by_singular, cats)
+        return snapshot, by_uid, by_barcode, by_name, by_singular, cats
+
+    def _apply(self, state):
+        self._snapshot, self._by_uid, self._by_barcode, self._by_name, self._by_singular, self._category_counts = state
+        self._categories = self._sorted_categories()
+
+    def _sorted_categories(self):
+        cats = set(self._category_counts)
+        if self._snapshot is not None:
+            cats.update(c for c in self._snapshot.categories if c)
+        return tuple(sorted(cats))
+
+    @staticmethod
+    def _index_row(row, by_uid, by_barcode, by_name, by_singular, cats):
+        by_uid[row['product_uid']] = row
+        # first row wins for duplicate barcodes/names, same as the old df[...].iloc[0]
+        if row.get('barcode'):
+            by_barcode.setdefault(row['barcode'], row)
+        if row.get('item_name'):
+            key = normalize_name(row['item_name'])
+            if key not in by_name:
+                entry = by_name[key] = (row, parse_date(row.get('expiry_date')))
+                for form in singular_forms(key):
+                    by_singular.setdefault(form, entry)
+        if row.get('category'):
+            cats[row['category']] += 1
+
+    def _add(self, row):
+        new_category = row.get('category') and row['category'] not in self._categories
+        self._index_row(row, self._by_uid, self._by_barcode, self._by_name, self._by_singular,
+                        self._category_counts)
+        if new_category:
+            self._categories = self._sorted_categories()
+
+    def _duplicate(self, key):
+        # key: barcode
+        return self.by_barcode(key)
+
+    def get(self, product_uid):
+        # journal rows come after the base table, so they win
+        row = self._by_uid.get(product_uid)
+        if row is None and self._snapshot is not None:
+            row = self._snapshot.get(product_uid)
+        return row
+
+    def by_barcode(self, barcode):
+        # ... and lose to it here
+        if self._snapshot is not None:
+            row = self._snapshot.by_barcode(barcode)
+            if row is not None:
+                return row
+        return self._by_barcode.get(barcode)
+
+    def by_name(self, item_name):
+        """
+        (row, expiry date or None) of the first product with this name, or
+        None. Exact (normalized) names win over singular/plural matches.
+        """
+        key = normalize_name(item_name)
+        forms = singular_forms(key)
+        snapshot = self._snapshot
+        for singular, index in ((False, self._by_name), (True, self._by_singular)):
+            for k in (key, *forms):
+                hit = snapshot.by_name(k, singular) if snapshot is not None else None
+                if hit is None:
+                    hit = index.get(k)
+                if hit is not None:
+                    return hit
+        return None
+
+    def columns(self, product_uids):
+        """
+        (scanned date, expiry date, category, found) arrays for a list of
+        product uids: datetime64[D] dates, NaT where the product isn't in the
+        catalog or has no valid date, and category names ('' if not found)
+        """
+        uids = list(product_uids)
+        scanned = np.full(len(uids), NAT)
+        expiry = np.full(len(uids), NAT)
+        category = np.full(len(uids), '', dtype=object)
+        found = np.zeros(len(uids), dtype=bool)
+        if self._snapshot is not None:
+            rows = self._snapshot.rows_of(uids)
+            found = rows >= 0
+            rows = rows[found]
+            scanned[found] = self._snapshot.scanned_date[rows]
+            expiry[found] = self._snapshot.expiry_date[rows]
+            category[found] = np.array(self._snapshot.categories, dtype=object)[self._snapshot.category[rows]]
+        if self._by_uid:
+            hits = [(i, row) for i, uid in enumerate(uids) if (row := self._by_uid.get(uid)) is not None]
+            if hits:
+                at = np.array([i for i, _ in hits], dtype=np.int64)
+                scanned[at] = parse_dates([row.get('scanned_date') for _, row in hits])
+                expiry[at] = parse_dates([row.get('expiry_date') for _, row in hits])
+                category[at] = [row.get('category') or '' for _, row in hits]
+                found[at] = True
+        return scanned, expiry, category, found
+
+    def categories(self):
+        """Sorted tuple of categories present in the catalog; same object until one is added"""
+        return self._categories
+
+    def __len__(self):
+        if self._snapshot is None:
+            return len(self._by_uid)
+        added = self._snapshot.rows_of(list(self._by_uid)) < 0
+        return len(self._snapshot) + int(added.sum())
+
+
+_catalog = ProductCatalog()
+
+def get_product_catalog():
+    _catalog.refresh()
+    return _catalog
+
+def invalidate_product_catalog():
+    _catalog.invalidate()
@@ -0,0 +1,103 @@
+# app/services/profiler.py
+
+import os
+import re
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+
+from app.services.csv_index import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# ── tweak these for your deployment ─────────────────────────────
+# keep a stack profile of requests slower than this (0 = profiler off)
+PROFILE_SLOW_MS     = float(os.getenv('LASTBITE_PROFILE_SLOW_MS', 0))
+PROFILE_INTERVAL_MS = float(os.getenv('LASTBITE_PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR         = os.getenv('LASTBITE_PROFILE_DIR', os.path.join(DATA_DIR, 'profiles'))
+# ----------------------------------------------------------------
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of threads serving requests every `interval_ms` from
+    one background thread (sys._current_frames), counting each distinct
+    stack per request. A request that ends slower than `slow_ms` has its
+    counts written to PROFILE_DIR in the folded format flamegraph.pl and
+    speedscope read; faster requests' samples are dropped. Nothing runs
+    while slow_ms is 0.
+    """
+
+    def __init__(self, slow_ms=PROFILE_SLOW_MS, interval_ms=PROFILE_INTERVAL_MS, out_dir=PROFILE_DIR):
+        self.slow_ms = slow_ms
+        self.interval = interval_ms / 1000
+        self.out_dir = out_dir
+        self._active = {}      # thread id -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self.slow_ms > 0
+
+    def begin(self):
+        """Start sampling the calling thread"""
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def end(self, route, elapsed_s):
+        """Stop sampling the calling thread; returns the profile's path if the request was slow enough"""
+        with self._lock:
+            stacks = self._active.pop(threading.get_ident(), None)
+        if not stacks or route is None or elapsed_s * 1000 < self.slow_ms:
+            return None
+        try:
+            return self._write(route, elapsed_s, stacks)
+        except OSError as e:
+            logger.warning("could not write profile: %s", e)
+            return None
+
+    def _write(self, route, elapsed_s, stacks):
+        os.makedirs(self.out_dir, exist_ok=True)
+        name = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+        path = os.path.join(self.out_dir, f"{datetime.now():%Y%m%d-%H%M%S-%f}-{name}-{elapsed_s * 1000:.0f}ms.folded")
+        with open(path, 'w') as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+        logger.warning("profiled slow request %s (%.0f ms, %d samples): %s",
+                       route, elapsed_s * 1000, sum(stacks.values()), path)
+        return path
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                idle = not self._active
+                if idle:
+                    self._wake.clear()
+            if idle:
+                self._wake.wait()
+                continue
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for tid, stacks in self._active.items():
+                    frame = frames.get(tid)
+                    if frame is None or tid == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                        frame = frame.f_back
+                    stacks[';'.join(reversed(stack))] += 1
+
+
+profiler = SamplingProfiler()
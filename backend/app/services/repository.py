@@ -0,0 +1,327 @@
+# app/services/repository.py
+
+import os
+import threading
+
+from app.services.csv_index import DATA_DIR
+from app.services.expiry_index import ExpiryIndex, get_expiry_index
+from app.services.freshness_index import FreshnessIndex, get_freshness_index, FRESHNESS_CSV
+from app.services.geo_index import LocationIndex, get_location_index, USERS_CSV
+from app.services.inventory_index import InventoryIndex, get_inventory_index, LINKS_CSV
+from app.services.product_catalog import ProductCatalog, get_product_catalog, PRODUCTS_CSV
+from app.services.waste_risk import WasteRiskIndex, get_waste_risk
+
+# ── tweak these for your deployment ─────────────────────────────
+# csv: the CSV tables under data/ (journaled appends, resident indexes)
+# sqlite: one SQLite database, see sqlite_repository (import it first)
+STORAGE = os.getenv('LASTBITE_STORAGE', 'csv')
+# ----------------------------------------------------------------
+
+
+class Repository:
+    """
+    What the routes need from storage: products, user–product links and
+    users, always keyed by product_uid/user_uid. Rows come back as dicts
+    with the CSV tables' column names.
+    """
+
+    name = None
+
+    # ── products ────────────────────────────────────────────────
+    def get_product(self, product_uid):
+        """Product row, or None"""
+        raise NotImplementedError
+
+    def get_products(self, product_uids):
+        """{product_uid: row} for the ones that exist"""
+        return {uid: row for uid in set(product_uids) if (row := self.get_product(uid)) is not None}
+
+    def product_by_barcode(self, barcode):
+        """First product with this barcode, or None"""
+        raise NotImplementedError
+
+    def product_by_name(self, item_name):
+        """
+        (row, expiry date or None) of the first product with this name, or
+        None. Exact normalized names win over singular/plural matches.
+        """
+        raise NotImplementedError
+
+    def categories(self):
+        """Sorted tuple of categories in use; the same object until one is added"""
+        raise NotImplementedError
+
+    def add_product(self, row):
+        raise NotImplementedError
+
+    def add_products(self, rows):
+        """Add many products in one durable write"""
+        for row in rows:
+            self.add_product(row)
+
+    def get_or_add_product(self, row):
+        """
+        (product, created): the first product with row's barcode, or `row`
+        once added. The check and the write are one atomic step, so
+        concurrent confirmations of a new barcode agree on one product.
+        """
+        raise NotImplementedError
+
+    def get_or_add_products(self, rows):
+        """[(product, created)] for each row as get_or_add_product, in one durable write"""
+        return [self.get_or_add_product(row) for row in rows]
+
+    # ── user–product links ──────────────────────────────────────
+    def links_for(self, user_uid):
+        """[{'product_uid', 'quantity'}] for a user, in the order they were added"""
+        raise NotImplementedError
+
+    def iter_links(self, user_uid, after=None):
+        """
+        (position, link) for a user's links after `after` (a position from
+        an earlier call), in links_for order. Positions are stable as links
+        are added, so they work as pagination cursors.
+        """
+        links = self.links_for(user_uid)
+        for i in range(0 if after is None else after + 1, len(links)):
+            yield i, links[i]
+
+    def has_link(self, user_uid, product_uid):
+        raise NotImplementedError
+
+    def add_link(self, row, unique=False):
+        """
+        Add one link; with unique, only if the user doesn't have that product
+        yet, checked atomically with the write. True if it was added.
+        """
+        raise NotImplementedError
+
+    def add_links(self, rows, unique=False):
+        """
+        Add many links in one durable write; with unique, as add_link (a
+        link an earlier row of the batch added counts too). [added] per row.
+        """
+        return [self.add_link(row, unique=unique) for row in rows]
+
+    def expiring(self, start, end, user_uid=None, offset=0, limit=50):
+        """
+        Links whose product expires in [start, end] (datetime64[D]; start may
+        be None), most urgent first: (total, [(user_uid, product_uid,
+        quantity, expiry_date)]) for the page.
+        """
+        raise NotImplementedError
+
+    # ── freshness and waste risk ────────────────────────────────
+    def add_classification(self, row):
+        """
+        Record a freshness classification (FRESHNESS_FIELDS) of a user's
+        product; the latest one per (user_uid, product_uid) counts.
+        """
+        raise NotImplementedError
+
+    def at_risk(self, user_uid, as_of, offset=0, limit=50, include_expired=False):
+        """
+        A user's items at risk of going to waste on `as_of`, most urgent
+        first: (summary, page) as WasteRiskIndex.at_risk returns them. Items
+        expired longer than RISK_EXPIRED_GRACE_DAYS are left out unless
+        include_expired.
+        """
+        raise NotImplementedError
+
+    def at_risk_users(self, as_of, offset=0, limit=50, include_expired=False):
+        """
+        Users with items at risk on `as_of`, the largest risk total first:
+        (total users, [(user_uid, items, quantity, risk_total)]) for the page.
+        """
+        raise NotImplementedError
+
+    # ── users ───────────────────────────────────────────────────
+    def get_user(self, user_uid):
+        """The user's current row (location None if they have none), or None"""
+        raise NotImplementedError
+
+    def location_of(self, user_uid):
+        """(lat, lng) of the user's current location, or None"""
+        raise NotImplementedError
+
+    def nearest_users(self, lat, lng, k=5, exclude_user=None):
+        raise NotImplementedError
+
+    def users_within(self, lat, lng, radius_km, limit=None, exclude_user=None):
+        raise NotImplementedError
+
+    def save_user(self, row):
+        """Insert or update a user; a row without a location keeps the current one"""
+        raise NotImplementedError
+
+    def preload(self):
+        """Load whatever this backend keeps in memory (the server's master does, so forked workers share it)"""
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name}>"
+
+
+class CsvRepository(Repository):
+    """
+    The CSV tables through their resident indexes. With no indexes given it
+    uses the process-wide ones the rest of the app shares.
+    """
+
+    name = 'csv'
+
+    def __init__(self, catalog=None, inventory=None, expiry=None, locations=None, freshness=None, risk=None):
+        self.catalog = catalog
+        self.inventory = inventory
+        self.expiry = expiry
+        self.locations = locations
+        self.freshness = freshness
+        self.risk = risk
+
+    @classmethod
+    def in_dir(cls, data_dir):
+        """Fresh indexes over the standard table files in another directory"""
+        catalog = ProductCatalog(os.path.join(data_dir, os.path.basename(PRODUCTS_CSV)))
+        links = os.path.join(data_dir, os.path.basename(LINKS_CSV))
+        expiry = ExpiryIndex(links, catalog=catalog)
+        freshness = FreshnessIndex(os.path.join(data_dir, os.path.basename(FRESHNESS_CSV)))
+        return cls(catalog=catalog,
+                   inventory=InventoryIndex(links),
+                   expiry=expiry,
+                   locations=LocationIndex(os.path.join(data_dir, os.path.basename(USERS_CSV))),
+                   freshness=freshness,
+                   risk=WasteRiskIndex(expiry=expiry, freshness=freshness))
+
+    @staticmethod
+    def _fresh(index, default):
+        if index is None:
+            return default()
+        index.refresh()
+        return index
+
+    def _catalog(self):
+        return self._fresh(self.catalog, get_product_catalog)
+
+    def _inventory(self):
+        return self._fresh(self.inventory, get_inventory_index)
+
+    def _locations(self):
+        return self._fresh(self.locations, get_location_index)
+
+    def _risk(self):
+        # catches up with the links and classifications itself on every query
+        return self.risk if self.risk is not None else get_waste_risk()
+
+    def get_product(self, product_uid):
+        return self._catalog().get(product_uid)
+
+    def get_products(self, product_uids):
+        catalog = self._catalog()
+        return {uid: row for uid in set(product_uids) if (row := catalog.get(uid)) is not None}
+
+    def product_by_barcode(self, barcode):
+        return self._catalog().by_barcode(barcode)
+
+    def product_by_name(self, item_name):
+        return self._catalog().by_name(item_name)
+
+    def categories(self):
+        return self._catalog().categories()
+
+    def add_product(self, row):
+        self._catalog().commit(row)
+
+    def add_products(self, rows):
+        self._catalog().append_rows(rows)
+
+    def get_or_add_product(self, row):
+        existing = self._catalog().commit(row, key=row.get('barcode') or None)
+        return (row, True) if existing is None else (existing, False)
+
+    def get_or_add_products(self, rows):
+        existing = self._catalog().append_new([(row, row.get('barcode') or None) for row in rows])
+        return [(row, True) if e is None else (e, False) for row, e in zip(rows, existing)]
+
+    def links_for(self, user_uid):
+        return self._inventory().links_for(user_uid)
+
+    def has_link(self, user_uid, product_uid):
+        return self._inventory().has_link(user_uid, product_uid)
+
+    def add_link(self, row, unique=False):
+        # group commit: links confirmed at the same moment share one locked, fsync'd write
+        key = (row.get('user_uid'), row.get('product_uid')) if unique else None
+        return self._inventory().commit(row, key=key) is None
+
+    def add_links(self, rows, unique=False):
+        if not unique:
+            self._inventory().append_rows(rows)
+            return [True] * len(rows)
+        existing = self._inventory().append_new([(row, (row.get('user_uid'), row.get('product_uid')))
+                                                 for row in rows])
+        return [e is None for e in existing]
+
+    def expiring(self, start, end, user_uid=None, offset=0, limit=50):
+        expiry = self._fresh(self.expiry, get_expiry_index)
+        return expiry.expiring(start, end, user_uid=user_uid, offset=offset, limit=limit)
+
+    def add_classification(self, row):
+        self._fresh(self.freshness, get_freshness_index).commit(row)
+
+    def at_risk(self, user_uid, as_of, offset=0, limit=50, include_expired=False):
+        return self._risk().at_risk(user_uid, as_of, offset=offset, limit=limit, include_expired=include_expired)
+
+    def at_risk_users(self, as_of, offset=0, limit=50, include_expired=False):
+        return self._risk().at_risk_users(as_of, offset=offset, limit=limit, include_expired=include_expired)
+
+    def get_user(self, user_uid):
+        return self._locations().user(user_uid)
+
+    def location_of(self, user_uid):
+        return self._locations().location_of(user_uid)
+
+    def nearest_users(self, lat, lng, k=5, exclude_user=None):
+        return self._locations().nearest(lat, lng, k, exclude_user)
+
+    def users_within(self, lat, lng, radius_km, limit=None, exclude_user=None):
+        return self._locations().within(lat, lng, radius_km, limit, exclude_user)
+
+    def save_user(self, row):
+        self._locations().append_rows([row])
+
+    def preload(self):
+        self._catalog()
+        self._inventory()
+        self._locations()
+        # the expiry index sorts on its first query, the waste-risk table scores every link on its first
+        self.expiring(None, '1970-01-01', limit=0)
+        self.at_risk_users('1970-01-01', limit=0)
+
+    def __repr__(self):
+        where = os.path.dirname(self.catalog.path) if self.catalog is not None else DATA_DIR
+        return f"<CsvRepository {where}>"
+
+
+def open_repository(kind=STORAGE):
+    if kind == 'csv':
+        return CsvRepository()
+    if kind == 'sqlite':
+        from app.services.sqlite_repository import SqliteRepository
+        return SqliteRepository()
+    raise ValueError(f"unknown storage backend {kind!r} (expected csv or sqlite)")
+
+
+_repository = None
+_repository_lock = threading.Lock()
+
+def get_repository():
+    global _repository
+    if _repository is None:
+        with _repository_lock:
+            if _repository is None:
+                _repository = open_repository()
+    return _repository
+
+def set_repository(repository):
+    """Swap the process-wide repository (benchmarks, one-off scripts)"""
+    global _repository
+    _repository = repository
@@ -0,0 +1,135 @@
+# app/services/result_cache.py
+
+import io
+import os
+import hashlib
+import threading
+from collections import OrderedDict, defaultdict
+
+from PIL import Image
+
+# ── tweak these for your deployment ─────────────────────────────
+RESULT_CACHE_SIZE = int(os.getenv('LASTBITE_RESULT_CACHE_SIZE', 4096))
+# also match near-duplicate photos (recompressed/resized) by perceptual hash
+RESULT_CACHE_PHASH = os.getenv('LASTBITE_RESULT_CACHE_PHASH', '0') == '1'
+# max Hamming distance between 64-bit dHashes that still counts as the same photo
+PHASH_MAX_DISTANCE = int(os.getenv('LASTBITE_PHASH_MAX_DISTANCE', 3))
+# ----------------------------------------------------------------
+
+
+def content_key(img_bytes):
+    return hashlib.blake2b(img_bytes, digest_size=16).digest()
+
+
+def dhash(img_bytes):
+    """64-bit difference hash of an image; None if it can't be decoded"""
+    try:
+        img = Image.open(io.BytesIO(img_bytes))
+        img.draft('L', (64, 64))
+        px = img.convert('L').resize((9, 8), Image.BILINEAR).tobytes()
+    except Exception:
+        return None
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (px[row * 9 + col] > px[row * 9 + col + 1])
+    return bits
+
+
+class ResultCache:
+    """
+    Classification results keyed by a hash of the uploaded bytes, in
+    per-source namespaces ('model', 'openai', ...), bounded to `capacity`
+    entries with LRU eviction.
+
+    With `use_phash`, misses fall back to a perceptual-hash match so a
+    re-encoded copy of the same photo also hits. dHashes are split into four
+    16-bit bands; any two hashes within 3 bits of each other share at least
+    one band exactly, so candidates come from four dict lookups.
+    """
+
+    BANDS = 4
+
+    def __init__(self, capacity=RESULT_CACHE_SIZE, use_phash=RESULT_CACHE_PHASH, max_distance=PHASH_MAX_DISTANCE):
+        self.capacity = capacity
+        self.use_phash = use_phash
+        self.max_distance = max_distance
+        self._entries = OrderedDict()          # (ns, key) -> (result, phash)
+        self._bands = defaultdict(set)         # (ns, band_no, band_value) -> {(ns, key)}
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: {'hits': 0, 'near_hits': 0, 'misses': 0})
+
+    def _band_keys(self, ns, h):
+        return [(ns, i, (h >> (16 * i)) & 0xFFFF) for i in range(self.BANDS)]
+
+    def _near(self, ns, h):
+        for band in self._band_keys(ns, h):
+            for entry_key in self._bands.get(band, ()):
+                result, other = self._entries[entry_key]
+                if bin(h ^ other).count('1') <= self.max_distance:
+                    return entry_key
+        return None
+
+    def get(self, ns, img_bytes):
+        """Cached result (a fresh copy) for these bytes, or None"""
+        key = (ns, content_key(img_bytes))
+        with self._lock:
+            hit = self._entries.get(key)
+            if hit is not None:
+                self._entries.move_to_end(key)
+                self._stats[ns]['hits'] += 1
+                return dict(hit[0])
+        if self.use_phash:
+            h = dhash(img_bytes)
+            if h is not None:
+                with self._lock:
+                    near = self._near(ns, h)
+                    if near is not None:
+                        self._entries.move_to_end(near)
+                        self._stats[ns]['near_hits'] += 1
+                        return dict(self._entries[near][0])
+        with self._lock:
+            self._stats[ns]['misses'] += 1
+        return None
+
+    def put(self, ns, img_bytes, result):
+        key = (ns, content_key(img_bytes))
+        h = dhash(img_bytes) if self.use_phash else None
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (dict(result), h)
+            if h is not None:
+                for band in self._band_keys(ns, h):
+                    self._bands[band].add(key)
+            while len(self._entries) > self.capacity:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        _, h = self._entries.pop(key)
+        if h is not None:
+            for band in self._band_keys(key[0], h):
+                members = self._bands.get(band)
+                if members is not None:
+                    members.discard(key)
+                    if not members:
+                        del self._bands[band]
+
+    def get_or_compute(self, ns, img_bytes, compute):
+        result = self.get(ns, img_bytes)
+        if result is None:
+            result = compute()
+            self.put(ns, img_bytes, result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            out = {ns: dict(s) for ns, s in self._stats.items()}
+            size = len(self._entries)
+        for s in out.values():
+            total = s['hits'] + s['near_hits'] + s['misses']
+            s['hit_ratio'] = (s['hits'] + s['near_hits']) / total if total else 0.0
+        return {'entries': size, 'capacity': self.capacity, 'namespaces': out}
+
+
+result_cache = ResultCache()
@@ -0,0 +1,498 @@
+# app/services/sqlite_repository.py
+
+import os
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from app.services.csv_index import DATA_DIR
+from app.services.freshness_index import FreshnessIndex, FRESHNESS_CSV, STATES
+from app.services.geo_index import LocationIndex, UserLocations, parse_coordinates, USERS_CSV, USER_FIELDS
+from app.services.inventory_index import InventoryIndex, LINKS_CSV, parse_quantity
+from app.services.product_catalog import (ProductCatalog, PRODUCTS_CSV, PRODUCT_FIELDS,
+                                          normalize_name, singular_forms, parse_date)
+from app.services.repository import Repository
+from app.services.waste_risk import row_expiries, risk_scores, risk_summary, at_risk_window
+
+# ── tweak these for your deployment ─────────────────────────────
+SQLITE_PATH    = os.getenv('LASTBITE_SQLITE_PATH', os.path.join(DATA_DIR, 'lastbite.sqlite'))
+SQLITE_TIMEOUT = float(os.getenv('LASTBITE_SQLITE_TIMEOUT', 10))   # seconds to wait on a writer
+SQLITE_POOL_SIZE = int(os.getenv('LASTBITE_SQLITE_POOL_SIZE', 8))  # idle connections kept per process
+# ----------------------------------------------------------------
+
+TABLES = '''
+CREATE TABLE IF NOT EXISTS products (
+    product_uid  TEXT PRIMARY KEY,
+    product_id   TEXT,
+    barcode      TEXT,
+    item_name    TEXT,
+    category     TEXT,
+    scanned_date TEXT,
+    expiry_date  TEXT                -- YYYY-MM-DD, NULL if missing or malformed
+);
+CREATE TABLE IF NOT EXISTS product_names (
+    key          TEXT NOT NULL,      -- normalized item name, or one of its singular forms
+    exact        INTEGER NOT NULL,
+    product_uid  TEXT NOT NULL,      -- the first product with that name
+    PRIMARY KEY (key, exact)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS links (
+    user_uid     TEXT NOT NULL,
+    product_uid  TEXT NOT NULL,
+    scan_date    TEXT,
+    quantity     INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS freshness (
+    user_uid        TEXT NOT NULL,
+    product_uid     TEXT NOT NULL,
+    state           TEXT NOT NULL,   -- fresh or rotten
+    confidence      REAL,
+    classified_date TEXT NOT NULL,   -- YYYY-MM-DD
+    source          TEXT,
+    PRIMARY KEY (user_uid, product_uid)   -- the latest classification only
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS users (
+    user_uid       TEXT PRIMARY KEY,
+    user_id        TEXT,
+    user_name      TEXT,
+    location_lat   REAL,
+    location_lng   REAL,
+    points_awarded TEXT,
+    version        INTEGER NOT NULL  -- bumped on every write, so workers can catch up incrementally
+);
+'''
+
+INDEXES = '''
+CREATE INDEX IF NOT EXISTS products_barcode   ON products (barcode);
+CREATE INDEX IF NOT EXISTS products_expiry    ON products (expiry_date);
+CREATE INDEX IF NOT EXISTS links_user         ON links (user_uid);
+CREATE INDEX IF NOT EXISTS links_user_product ON links (user_uid, product_uid);
+CREATE INDEX IF NOT EXISTS links_product      ON links (product_uid);
+CREATE INDEX IF NOT EXISTS users_version      ON users (version);
+'''
+
+# a row without a location keeps the user's current one
+_UPSERT_USER = (
+    'INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, {version}) ON CONFLICT (user_uid) DO UPDATE SET '
+    'user_id = excluded.user_id, user_name = excluded.user_name, '
+    'location_lat = COALESCE(excluded.location_lat, location_lat), '
+    'location_lng = COALESCE(excluded.location_lng, location_lng), '
+    'points_awarded = excluded.points_awarded, version = excluded.version')
+
+_UPSERT_PRODUCT = (
+    'INSERT INTO products VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (product_uid) DO UPDATE SET '
+    'product_id = excluded.product_id, barcode = excluded.barcode, '
+    'item_name = excluded.item_name, category = excluded.category, '
+    'scanned_date = excluded.scanned_date, expiry_date = excluded.expiry_date')
+
+_UPSERT_FRESHNESS = (
+    'INSERT INTO freshness VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (user_uid, product_uid) DO UPDATE SET '
+    'state = excluded.state, confidence = excluded.confidence, '
+    'classified_date = excluded.classified_date, source = excluded.source')
+
+_PRODUCT_COLUMNS = ', '.join(f'p.{c}' for c in PRODUCT_FIELDS)
+
+# what row_expiries scores, after the columns named before it
+_RISK_COLUMNS = ('l.scan_date, p.scanned_date, p.expiry_date, p.category, f.state, f.classified_date '
+                 'FROM links l LEFT JOIN products p USING (product_uid) '
+                 'LEFT JOIN freshness f ON f.user_uid = l.user_uid AND f.product_uid = l.product_uid')
+
+
+def connect(path, timeout=SQLITE_TIMEOUT, schema=False):
+    """
+    A connection any thread may use (one at a time). With schema, also
+    switch the file to WAL and create missing tables: both persist in the
+    database, so once per process is enough.
+    """
+    conn = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+    if schema:
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(TABLES + INDEXES)
+    # with WAL, NORMAL only risks the last commits on power loss, never corruption
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
+
+def _product_row(values):
+    return {c: ('' if v is None else v) for c, v in zip(PRODUCT_FIELDS, values)}
+
+
+def _product_values(row):
+    expiry = parse_date(row.get('expiry_date'))
+    return (row['product_uid'], row.get('product_id'), row.get('barcode'), row.get('item_name'),
+            row.get('category'), row.get('scanned_date'), expiry.isoformat() if expiry else None)
+
+
+def _name_keys(row):
+    if not row.get('item_name'):
+        return []
+    key = normalize_name(row['item_name'])
+    return [(key, 1, row['product_uid'])] + [(f, 0, row['product_uid']) for f in singular_forms(key)]
+
+
+def _link_values(row):
+    return (row.get('user_uid'), row.get('product_uid'), row.get('scan_date'),
+            parse_quantity(str(row.get('quantity', ''))))
+
+
+def _freshness_values(row):
+    """Row values for the freshness table, or None if the state or date is unusable (the CSV index skips those too)"""
+    state = (row.get('state') or '').strip().lower()
+    classified = parse_date(row.get('classified_date'))
+    if state not in STATES or classified is None:
+        return None
+    try:
+        confidence = float(row.get('confidence'))
+    except (TypeError, ValueError):
+        confidence = None
+    return (row.get('user_uid'), row.get('product_uid'), state, confidence, classified.isoformat(), row.get('source'))
+
+
+def _listed(expiry, as_of, include_expired):
+    """Which datetime64[D] effective expiries fall in the at-risk window on `as_of`"""
+    first, last = at_risk_window(as_of, include_expired)
+    days = expiry.view(np.int64)
+    listed = ~np.isnat(expiry) & (days <= last)
+    return listed if first is None else listed & (days >= first)
+
+
+def _user_values(row):
+    lat_lng = parse_coordinates(row.get('location_lat'), row.get('location_lng')) or (None, None)
+    return (row['user_uid'], row.get('user_id'), row.get('user_name'), *lat_lng, row.get('points_awarded'))
+
+
+class SqliteRepository(Repository):
+    """
+    Products, links, users and freshness classifications in one SQLite
+    database (WAL mode, so readers never wait on the writer), indexed on
+    barcode, user_uid, product_uid and expiry_date. Each worker process
+    keeps a small pool of connections that request threads borrow for one
+    call, since the threaded servers start a thread per request.
+
+    Nearest-user queries need a spatial index SQLite doesn't have, so each
+    process keeps a UserLocations grid and catches it up from the users
+    table's version column before answering.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._pool = []
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self._users_lock = threading.Lock()
+        self._users = None
+        self._users_version = 0
+        self._users_pid = None
+        self._categories = (None, ())
+
+    @contextmanager
+    def _db(self):
+        """A connection from this process's pool, for the length of the block"""
+        pid = os.getpid()
+        with self._pool_lock:
+            if self._pool_pid != pid:
+                # a connection must not cross a fork: the first use in a process starts its pool
+                self._pool, self._pool_pid = [connect(self.path, schema=True)], pid
+            conn = self._pool.pop() if self._pool else None
+        if conn is None:
+            conn = connect(self.path)
+        try:
+            yield conn
+        finally:
+            with self._pool_lock:
+                keep = self._pool_pid == pid and len(self._pool) < SQLITE_POOL_SIZE
+                if keep:
+                    self._pool.append(conn)
+            if not keep and os.getpid() == pid:
+                conn.close()
+
+    def _fetch(self, sql, params=(), one=False):
+        """Rows of one query (the first row, or None, with one) on a pooled connection"""
+        with self._db() as db:
+            cursor = db.execute(sql, params)
+            return cursor.fetchone() if one else cursor.fetchall()
+
+    @contextmanager
+    def _write(self):
+        """_db inside a transaction: committed at the end of the block, rolled back if it raises"""
+        with self._db() as db, db:
+            yield db
+
+    # ── products ────────────────────────────────────────────────
+    def get_product(self, product_uid):
+        row = self._fetch(f'SELECT {_PRODUCT_COLUMNS} FROM products p WHERE product_uid = ?',
+                          (product_uid,), one=True)
+        return _product_row(row) if row else None
+
+    def get_products(self, product_uids):
+        uids = list(set(product_uids))
+        out = {}
+        for i in range(0, len(uids), 500):      # stay under SQLite's bound-parameter limit
+            chunk = uids[i:i + 500]
+            rows = self._fetch(f'SELECT {_PRODUCT_COLUMNS} FROM products p WHERE product_uid IN '
+                               f'({", ".join("?" * len(chunk))})', chunk)
+            out.update((r[0], _product_row(r)) for r in rows)
+        return out
+
+    def product_by_barcode(self, barcode):
+        row = self._fetch(f'SELECT {_PRODUCT_COLUMNS} FROM products p WHERE barcode = ? '
+                          'ORDER BY rowid LIMIT 1', (barcode,), one=True)
+        return _product_row(row) if row else None
+
+    def product_by_name(self, item_name):
+        key = normalize_name(item_name)
+        keys = (key, *singular_forms(key))
+        marks = ', '.join('?' * len(keys))
+        rank = ' '.join(f'WHEN ? THEN {i}' for i in range(len(keys)))
+        row = self._fetch(
+            f'SELECT {_PRODUCT_COLUMNS} FROM product_names n JOIN products p USING (product_uid) '
+            f'WHERE n.key IN ({marks}) ORDER BY n.exact DESC, CASE n.key {rank} END LIMIT 1',
+            keys + keys, one=True)
+        if row is None:
+            return None
+        product = _product_row(row)
+        return product, parse_date(product['expiry_date'])
+
+    def categories(self):
+        version = self._fetch('SELECT MAX(rowid) FROM products', one=True)[0]
+        if self._categories[0] != version:
+            cats = tuple(r[0] for r in self._fetch(
+                "SELECT DISTINCT category FROM products WHERE category IS NOT NULL AND category != '' "
+                'ORDER BY category'))
+            # keep the old tuple when nothing changed: callers cache on its identity
+            self._categories = (version, self._categories[1] if cats == self._categories[1] else cats)
+        return self._categories[1]
+
+    def add_product(self, row):
+        self.add_products([row])
+
+    def get_or_add_product(self, row):
+        return self.get_or_add_products([row])[0]
+
+    def get_or_add_products(self, rows):
+        added = []
+        with self._write() as db:
+            for row in rows:
+                # one statement per row, so the barcode check can't race another writer (SQLite serializes writes)
+                if row.get('barcode'):
+                    n = db.execute('INSERT INTO products SELECT ?, ?, ?, ?, ?, ?, ? '
+                                   'WHERE NOT EXISTS (SELECT 1 FROM products WHERE barcode = ?)',
+                                   (*_product_values(row), row['barcode'])).rowcount
+                else:
+                    n = db.execute(_UPSERT_PRODUCT, _product_values(row)).rowcount
+                if n:
+                    db.executemany('INSERT OR IGNORE INTO product_names VALUES (?, ?, ?)', _name_keys(row))
+                added.append(n > 0)
+        return [(row, True) if new else (self.product_by_barcode(row['barcode']), False)
+                for row, new in zip(rows, added)]
+
+    def add_products(self, rows):
+        with self._write() as db:
+            db.executemany(_UPSERT_PRODUCT, [_product_values(r) for r in rows])
+            # first product with a name keeps it, same as the CSV catalog
+            db.executemany('INSERT OR IGNORE INTO product_names VALUES (?, ?, ?)',
+                           [k for r in rows for k in _name_keys(r)])
+
+    # ── user–product links ──────────────────────────────────────
+    def links_for(self, user_uid):
+        rows = self._fetch('SELECT product_uid, quantity FROM links WHERE user_uid = ? ORDER BY rowid',
+                           (user_uid,))
+        return [{'product_uid': p, 'quantity': q} for p, q in rows]
+
+    def iter_links(self, user_uid, after=None, chunk=1000):
+        # keyset pagination on rowid: each chunk is an index range scan, however deep
+        after = 0 if after is None else after
+        while True:
+            rows = self._fetch('SELECT rowid, product_uid, quantity FROM links WHERE user_uid = ? '
+                               'AND rowid > ? ORDER BY rowid LIMIT ?', (user_uid, after, chunk))
+            for rowid, product_uid, quantity in rows:
+                yield rowid, {'product_uid': product_uid, 'quantity': quantity}
+            if len(rows) < chunk:
+                return
+            after = rows[-1][0]
+
+    def has_link(self, user_uid, product_uid):
+        return self._fetch('SELECT 1 FROM links WHERE user_uid = ? AND product_uid = ? LIMIT 1',
+                           (user_uid, product_uid), one=True) is not None
+
+    def add_link(self, row, unique=False):
+        return self.add_links([row], unique=unique)[0]
+
+    def add_links(self, rows, unique=False):
+        with self._write() as db:
+            if not unique:
+                db.executemany('INSERT INTO links VALUES (?, ?, ?, ?)', [_link_values(r) for r in rows])
+                return [True] * len(rows)
+            # later rows see earlier ones: they're in the same transaction
+            return [db.execute('INSERT INTO links SELECT ?, ?, ?, ? WHERE NOT EXISTS '
+                               '(SELECT 1 FROM links WHERE user_uid = ? AND product_uid = ?)',
+                               (*_link_values(r), r.get('user_uid'), r.get('product_uid'))).rowcount > 0
+                    for r in rows]
+
+    def expiring(self, start, end, user_uid=None, offset=0, limit=50):
+        where = ['p.expiry_date BETWEEN ? AND ?']
+        params = ['0000-01-01' if start is None else str(np.datetime64(start, 'D')), str(np.datetime64(end, 'D'))]
+        if user_uid is not None:
+            where.append('l.user_uid = ?')
+            params.append(user_uid)
+        sql = f'FROM links l JOIN products p USING (product_uid) WHERE {" AND ".join(where)}'
+        with self._db() as db:
+            total = db.execute(f'SELECT COUNT(*) {sql}', params).fetchone()[0]
+            rows = db.execute(f'SELECT l.user_uid, l.product_uid, l.quantity, p.expiry_date {sql} '
+                              'ORDER BY p.expiry_date, l.rowid LIMIT ? OFFSET ?', params + [limit, offset]).fetchall()
+        return total, [(u, p, q, np.datetime64(e, 'D')) for u, p, q, e in rows]
+
+    # ── freshness and waste risk ────────────────────────────────
+    # Scored per query with the CSV backend's functions, not kept as a table:
+    # a user's links are one index range scan, the all-users digest a full scan.
+    def add_classification(self, row):
+        values = _freshness_values(row)
+        if values is not None:
+            with self._write() as db:
+                db.execute(_UPSERT_FRESHNESS, values)
+
+    def at_risk(self, user_uid, as_of, offset=0, limit=50, include_expired=False):
+        today = np.datetime64(as_of, 'D')
+        rows = self._fetch(f'SELECT l.product_uid, l.quantity, {_RISK_COLUMNS} WHERE l.user_uid = ? '
+                           'ORDER BY l.rowid', (user_uid,))
+        expiry = row_expiries([r[2:] for r in rows])
+        at = np.flatnonzero(_listed(expiry, as_of, include_expired))
+        at = at[np.argsort(expiry[at], kind='stable')]
+        risk = risk_scores((expiry[at] - today).astype(np.int64))
+        summary = risk_summary([rows[i][1] for i in at.tolist()], risk)
+        page = [(rows[i][0], rows[i][1], expiry[i], round(r, 3), rows[i][6])
+                for i, r in zip(at[offset:offset + limit].tolist(), risk[offset:offset + limit].tolist())]
+        return summary, page
+
+    def at_risk_users(self, as_of, offset=0, limit=50, include_expired=False, chunk=100_000):
+        today = np.datetime64(as_of, 'D')
+        totals = {}     # user_uid -> [items, quantity, risk_total], in the order users are met
+        after = 0
+        while True:
+            rows = self._fetch(f'SELECT l.rowid, l.user_uid, l.quantity, {_RISK_COLUMNS} WHERE l.rowid > ? '
+                               'ORDER BY l.rowid LIMIT ?', (after, chunk))
+            if not rows:
+                break
+            expiry = row_expiries([r[3:] for r in rows])
+            at = np.flatnonzero(_listed(expiry, as_of, include_expired))
+            for i, r in zip(at.tolist(), risk_scores((expiry[at] - today).astype(np.int64)).tolist()):
+                user = totals.setdefault(rows[i][1], [0, 0, 0.0])
+                user[0] += 1
+                user[1] += rows[i][2]
+                user[2] += r * max(rows[i][2], 1)
+            after = rows[-1][0]
+        ranked = sorted(totals.items(), key=lambda t: -t[1][2])
+        return len(ranked), [(u, items, quantity, round(risk, 3))
+                             for u, (items, quantity, risk) in ranked[offset:offset + limit]]
+
+    # ── users ───────────────────────────────────────────────────
+    def get_user(self, user_uid):
+        row = self._fetch(f'SELECT {", ".join(USER_FIELDS)} FROM users WHERE user_uid = ?',
+                          (user_uid,), one=True)
+        return dict(zip(USER_FIELDS, row)) if row else None
+
+    def location_of(self, user_uid):
+        row = self._fetch('SELECT location_lat, location_lng FROM users WHERE user_uid = ? '
+                          'AND location_lat IS NOT NULL', (user_uid,), one=True)
+        return tuple(row) if row else None
+
+    def _user_locations(self):
+        """This process's location grid, caught up with writes from every worker"""
+        with self._users_lock, self._db() as db:
+            if self._users is None or self._users_pid != os.getpid():
+                self._users, self._users_version, self._users_pid = UserLocations(), 0, os.getpid()
+            rows = db.execute(f'SELECT {", ".join(USER_FIELDS)}, version FROM users WHERE version > ? '
+                              'ORDER BY version', (self._users_version,)).fetchall()
+            if len(rows) > len(self._users) // 4:
+                # mostly new: rebuild the grid in one go rather than point by point
+                if self._users_version:
+                    rows = db.execute(f'SELECT {", ".join(USER_FIELDS)}, version FROM users '
+                                      'ORDER BY version').fetchall()
+                self._users = UserLocations(dict(zip(USER_FIELDS, r)) for r in rows)
+            else:
+                for r in rows:
+                    self._users.upsert(dict(zip(USER_FIELDS, r)))
+            if rows:
+                self._users_version = rows[-1][-1]
+            return self._users
+
+    def nearest_users(self, lat, lng, k=5, exclude_user=None):
+        return self._user_locations().nearest(lat, lng, k, exclude_user)
+
+    def users_within(self, lat, lng, radius_km, limit=None, exclude_user=None):
+        return self._user_locations().within(lat, lng, radius_km, limit, exclude_user)
+
+    def save_user(self, row):
+        with self._write() as db:
+            db.execute(_UPSERT_USER.format(version='(SELECT COALESCE(MAX(version), 0) + 1 FROM users)'),
+                       _user_values(row))
+
+    def __repr__(self):
+        return f"<SqliteRepository {self.path}>"
+
+
+def import_csv(path=SQLITE_PATH, products_csv=PRODUCTS_CSV, links_csv=LINKS_CSV, users_csv=USERS_CSV,
+               freshness_csv=FRESHNESS_CSV):
+    """
+    One-shot load of the CSV tables (journals included) into a fresh
+    database at `path`, replacing any existing one. It is built next to the
+    target and swapped in when complete, so a failed import leaves the old
+    database intact; stop the workers first, they keep the old file open.
+    Rows are streamed. Returns {table: rows imported}.
+    """
+    tmp = path + '.importing'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    conn.execute('PRAGMA journal_mode=OFF')      # nothing to protect until the swap
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.executescript(TABLES)
+    # duplicated product_uids / users: the last row wins, as in the CSV indexes
+    conn.executemany('INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     (_product_values(r) for r in ProductCatalog(products_csv).read_rows()
+                      if r.get('product_uid')))
+    conn.executemany('INSERT OR IGNORE INTO product_names VALUES (?, ?, ?)',
+                     (k for r in ProductCatalog(products_csv).read_rows()
+                      if r.get('product_uid') for k in _name_keys(r)))
+    conn.executemany('INSERT INTO links VALUES (?, ?, ?, ?)',
+                     (_link_values(r) for r in InventoryIndex(links_csv).read_rows()))
+    users = (r for r in LocationIndex(users_csv).read_rows() if r.get('user_uid'))
+    conn.executemany(_UPSERT_USER.format(version='?'),
+                     ((*_user_values(r), version) for version, r in enumerate(users, 1)))
+    # classifications in journal order, so the latest per pair wins
+    conn.executemany(_UPSERT_FRESHNESS, (v for r in FreshnessIndex(freshness_csv).read_rows()
+                                         if (v := _freshness_values(r)) is not None))
+    conn.commit()
+
+    conn.executescript(INDEXES)
+    conn.execute('ANALYZE')
+    conn.commit()
+    counts = {t: conn.execute(f'SELECT COUNT(*) FROM {t}').fetchone()[0] for t in ('products', 'links', 'users', 'freshness')}
+    conn.close()
+    for stale in (path + '-wal', path + '-shm'):
+        if os.path.exists(stale):
+            os.remove(stale)
+    os.replace(tmp, path)
+    connect(path, schema=True).close()      # switch the new file to WAL
+    return counts
+
+
+if __name__ == '__main__':
+    # one-shot import: python -m app.services.sqlite_repository [--db data/lastbite.sqlite]
+    ap = argparse.ArgumentParser(description='Import the CSV tables into a SQLite database')
+    ap.add_argument('--db', default=SQLITE_PATH)
+    ap.add_argument('--products', default=PRODUCTS_CSV)
+    ap.add_argument('--links', default=LINKS_CSV)
+    ap.add_argument('--users', default=USERS_CSV)
+    ap.add_argument('--freshness', default=FRESHNESS_CSV)
+    args = ap.parse_args()
+    t0 = time.perf_counter()
+    counts = import_csv(args.db, args.products, args.links, args.users, args.freshness)
+    print(f"{args.db}: " + ', '.join(f"{n} {table}" for table, n in counts.items())
+          + f" imported in {time.perf_counter() - t0:.1f}s")
@@ -0,0 +1,242 @@
+# app/services/vision_fallback.py
+
+import os
+import re
+import json
+import time
+import base64
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+import openai
+
+from app.services.result_cache import result_cache, content_key
+
+logger = logging.getLogger(__name__)
+
+# ── tweak these for your deployment ─────────────────────────────
+OPENAI_MODEL           = os.getenv('LASTBITE_OPENAI_MODEL', 'gpt-4o-mini')
+OPENAI_DEADLINE_S      = float(os.getenv('LASTBITE_OPENAI_DEADLINE_S', 8))     # per request, end to end
+OPENAI_MAX_CONCURRENCY = int(os.getenv('LASTBITE_OPENAI_MAX_CONCURRENCY', 4))  # upstream calls in flight
+# circuit breaker: open when, over the last BREAKER_WINDOW calls (at least
+# BREAKER_MIN_CALLS), more than BREAKER_FAILURE_RATE failed or took longer
+# than BREAKER_SLOW_S; stay open for BREAKER_COOLDOWN_S, then let one probe through
+BREAKER_WINDOW       = int(os.getenv('LASTBITE_BREAKER_WINDOW', 20))
+BREAKER_MIN_CALLS    = int(os.getenv('LASTBITE_BREAKER_MIN_CALLS', 5))
+BREAKER_FAILURE_RATE = float(os.getenv('LASTBITE_BREAKER_FAILURE_RATE', 0.5))
+BREAKER_SLOW_S       = float(os.getenv('LASTBITE_BREAKER_SLOW_S', 5))
+BREAKER_COOLDOWN_S   = float(os.getenv('LASTBITE_BREAKER_COOLDOWN_S', 30))
+# ----------------------------------------------------------------
+
+VISION_PROMPT = "Identify this fruit and tell me if it's fresh or rotten. Reply with JSON only: {\"fruit\": \"name\", \"state\": \"fresh or rotten\"}"
+
+
+class FallbackUnavailable(Exception):
+    """The remote classifier was skipped: circuit open, too busy, or out of time"""
+
+    def __init__(self, reason):
+        super().__init__(f"vision fallback unavailable: {reason}")
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """Rolling-window breaker over call outcomes (True = failed or too slow)"""
+
+    def __init__(self, window=BREAKER_WINDOW, min_calls=BREAKER_MIN_CALLS, failure_rate=BREAKER_FAILURE_RATE,
+                 slow_s=BREAKER_SLOW_S, cooldown_s=BREAKER_COOLDOWN_S):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_s = slow_s
+        self.cooldown_s = cooldown_s
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            return 'half_open' if time.monotonic() - self._opened_at >= self.cooldown_s else 'open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown_s or self._probing:
+                return False
+            self._probing = True     # half-open: exactly one probe call
+            return True
+
+    def record(self, failed, elapsed):
+        bad = failed or elapsed > self.slow_s
+        with self._lock:
+            if self._probing:
+                self._probing = False
+                if bad:
+                    self._opened_at = time.monotonic()
+                    return
+                self._opened_at = None
+                self._outcomes.clear()
+            self._outcomes.append(bad)
+            n = len(self._outcomes)
+            if (self._opened_at is None and n >= self.min_calls
+                    and sum(self._outcomes) / n > self.failure_rate):
+                self._opened_at = time.monotonic()
+                logger.warning(f"vision fallback circuit opened ({sum(self._outcomes)}/{n} bad calls)")
+
+
+class VisionFallback:
+    """
+    Shared client for the OpenAI vision classifier.
+
+    One openai.OpenAI client (and its connection pool) serves every request.
+    Each call gets an end-to-end deadline, at most `max_concurrency` calls
+    are in flight upstream, concurrent requests for identical image bytes
+    share one call, and a circuit breaker skips the upstream entirely while
+    it is failing or slow. Parsed answers go into the result cache.
+    """
+
+    def __init__(self, model=OPENAI_MODEL, deadline_s=OPENAI_DEADLINE_S, max_concurrency=OPENAI_MAX_CONCURRENCY,
+                 breaker=None, client=None):
+        self.model = model
+        self.deadline_s = deadline_s
+        self.breaker = breaker or CircuitBreaker()
+        self._client = client
+        self._client_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = dict.fromkeys(('calls', 'errors', 'coalesced', 'cache_hits', 'skipped_open',
+                                     'skipped_busy', 'deadline_exceeded'), 0)
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    # retries would blow through the deadline; the breaker handles flakiness
+                    self._client = openai.OpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        return self._client
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def cached(self, img_data):
+        """The parsed answer for these bytes from the result cache, or None"""
+        cached = result_cache.get('openai', img_data)
+        if cached is not None:
+            self._count('cache_hits')
+        return cached
+
+    def classify(self, img_data, deadline_s=None, use_cache=True):
+        """
+        Returns (parsed, raw_text) like the old inline call: parsed is the JSON
+        object from the reply, or None if there wasn't one. Raises
+        FallbackUnavailable when skipped, or the upstream error. Without
+        use_cache the caller has already looked in the result cache.
+        """
+        cached = self.cached(img_data) if use_cache else None
+        if cached is not None:
+            return cached, None
+
+        deadline = time.monotonic() + (deadline_s if deadline_s is not None else self.deadline_s)
+        key = content_key(img_data)
+        with self._inflight_lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+        if not leader:
+            self._count('coalesced')
+            try:
+                parsed, openai_text = fut.result(timeout=max(0.0, deadline - time.monotonic()))
+                # callers decorate the dict, so each gets its own copy
+                return (dict(parsed) if parsed is not None else None), openai_text
+            except FutureTimeout:
+                self._count('deadline_exceeded')
+                raise FallbackUnavailable('deadline') from None
+
+        try:
+            parsed, openai_text = self._call(img_data, deadline)
+            # followers copy from a pristine dict, not the one this caller decorates
+            fut.set_result((dict(parsed) if parsed is not None else None, openai_text))
+            return parsed, openai_text
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                del self._inflight[key]
+
+    def _call(self, img_data, deadline):
+        if self.breaker.state == 'open':
+            self._count('skipped_open')
+            raise FallbackUnavailable('circuit_open')
+        if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            self._count('skipped_busy')
+            raise FallbackUnavailable('busy')
+        try:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._count('deadline_exceeded')
+                raise FallbackUnavailable('deadline')
+            if not self.breaker.allow():
+                self._count('skipped_open')
+                raise FallbackUnavailable('circuit_open')
+            response = self._request(img_data, remaining)
+        finally:
+            self._slots.release()
+
+        openai_text = response.choices[0].message.content.strip()
+        json_match = re.search(r'\{.*\}', openai_text, re.DOTALL)
+        if not json_match:
+            return None, openai_text
+        parsed = json.loads(json_match.group(0))
+        result_cache.put('openai', img_data, parsed)
+        return parsed, openai_text
+
+    def _request(self, img_data, timeout):
+        self._count('calls')
+        encoded_img = base64.b64encode(img_data).decode('utf-8')
+        t0 = time.monotonic()
+        failed = True
+        try:
+            response = self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": VISION_PROMPT},
+                            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{encoded_img}"}}
+                        ]
+                    }
+                ],
+                max_tokens=300,
+                timeout=timeout,
+            )
+            failed = False
+            return response
+        except openai.APITimeoutError:
+            self._count('deadline_exceeded')
+            raise FallbackUnavailable('deadline') from None
+        except Exception:
+            self._count('errors')
+            raise
+        finally:
+            self.breaker.record(failed, time.monotonic() - t0)
+
+    def stats(self):
+        with self._stats_lock:
+            s = dict(self._stats)
+        s['circuit'] = self.breaker.state
+        return s
+
+
+vision_fallback = VisionFallback()
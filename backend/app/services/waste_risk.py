@@ -0,0 +1,384 @@
+# app/services/waste_risk.py
+
+import os
+import math
+import threading
+
+import numpy as np
+
+from app.services.expiry_index import _Column, expiry_keys, get_expiry_index
+from app.services.freshness_index import get_freshness_index
+from app.services.product_catalog import parse_dates
+
+# ── tweak these for your project ────────────────────────────────
+# shelf life in days by category, counted from the day an item is scanned
+DEFAULT_SHELF_LIFE = {
+    "Dairy": 7, "Meat": 3, "Produce": 5, "Bakery": 2,
+    "Frozen": 180, "Canned Goods": 365, "Snacks": 120, "Beverages": 90,
+}
+DEFAULT_SHELF_LIFE_DAYS = 30      # any other category
+# ----------------------------------------------------------------
+
+# ── tweak these for your deployment ─────────────────────────────
+# an item's waste risk is 1 once it expires and halves for every this many days it has left
+RISK_HALF_LIFE_DAYS = float(os.getenv('LASTBITE_RISK_HALF_LIFE_DAYS', 2))
+# items scoring at least this are "at risk" (with the defaults: 4 days or less left)
+RISK_MIN_SCORE = float(os.getenv('LASTBITE_RISK_MIN_SCORE', 0.25))
+# expired items stay listed this many days, then count as waste that already happened
+# (include_expired lists them all)
+RISK_EXPIRED_GRACE_DAYS = int(os.getenv('LASTBITE_RISK_EXPIRED_GRACE_DAYS', 2))
+# links re-scored since the last sort are merged into reads until there are this many
+RISK_PENDING_MAX = int(os.getenv('LASTBITE_RISK_PENDING_MAX', 4096))
+# ----------------------------------------------------------------
+
+# freshness state codes in the scoring arrays
+NO_STATE, FRESH, ROTTEN = 0, 1, 2
+STATE_CODES = {'fresh': FRESH, 'rotten': ROTTEN}
+
+
+def shelf_life_days(category):
+    return DEFAULT_SHELF_LIFE.get(category, DEFAULT_SHELF_LIFE_DAYS)
+
+
+def effective_expiry(scan, product_scanned, product_expiry, default_days, state=None, classified=None):
+    """
+    When each item runs out, as datetime64[D] arrays (NaT if unknown): the
+    product's shelf life (its catalog expiry minus its catalog scan date,
+    else `default_days` for its category) counted from the day the user
+    scanned it, or the catalog expiry itself if the link has no scan date.
+    A freshness classification (`state` codes, `classified` dates)
+    overrides that: rotten means it went off the day before, as /classify
+    shows a rotten match; fresh that it keeps at least through that day.
+    """
+    shelf = product_expiry - product_scanned
+    shelf = np.where(shelf >= np.timedelta64(0, 'D'), shelf, default_days.astype('timedelta64[D]'))
+    expiry = np.where(np.isnat(scan), product_expiry, scan + shelf)
+    # no catalog expiry either: the catalog scan date plus the category default
+    expiry = np.where(np.isnat(expiry), product_scanned + shelf, expiry)
+    if state is not None:
+        went_off = classified - np.timedelta64(1, 'D')
+        rotten = (state == ROTTEN) & (np.isnat(expiry) | (expiry > went_off))
+        fresh = (state == FRESH) & (expiry < classified)
+        expiry = np.where(rotten, went_off, np.where(fresh, classified, expiry))
+    return expiry
+
+
+def row_expiries(rows):
+    """
+    effective_expiry for rows of (scan_date, product scanned_date, product
+    expiry_date, category, freshness state, classified_date) as text, the
+    way SQL returns them (None where missing)
+    """
+    if not rows:
+        return np.empty(0, dtype='datetime64[D]')
+    scan, scanned, expiry, category, state, classified = zip(*rows)
+    return effective_expiry(parse_dates(scan), parse_dates(scanned), parse_dates(expiry),
+                            np.array([shelf_life_days(c) for c in category], dtype=np.int64),
+                            np.array([STATE_CODES.get(v, NO_STATE) for v in state], dtype=np.int8),
+                            parse_dates(classified))
+
+
+def risk_scores(days_left, half_life=RISK_HALF_LIFE_DAYS):
+    """Waste risk in [0, 1] for days of shelf life left: 1 at or past expiry, halving every `half_life` days before"""
+    return np.exp2(-np.maximum(np.asarray(days_left, dtype=np.float64), 0) / half_life)
+
+
+def risk_summary(quantity, risk):
+    """{'items', 'quantity', 'risk_total'} of at-risk items; risk_total weighs each by quantity, a blank one counting as one"""
+    quantity = np.asarray(quantity, dtype=np.int64)
+    return {'items': len(quantity), 'quantity': int(quantity.sum()),
+            'risk_total': round(float((risk * np.maximum(quantity, 1)).sum()), 3)}
+
+
+def at_risk_days(min_score=RISK_MIN_SCORE, half_life=RISK_HALF_LIFE_DAYS):
+    """The most days an item can have left and still score `min_score`"""
+    if min_score >= 1:
+        return 0
+    return math.floor(half_life * math.log2(1 / max(min_score, 1e-9)) + 1e-9)
+
+
+def at_risk_window(as_of, include_expired=False, grace_days=RISK_EXPIRED_GRACE_DAYS, horizon=None):
+    """(first, last) effective expiry, as day numbers, of items listed as at risk on `as_of`; first is None with include_expired"""
+    today = int(np.datetime64(as_of, 'D').view(np.int64))
+    last = today + (at_risk_days() if horizon is None else horizon)
+    return (None if include_expired else today - grace_days), last
+
+
+def _maybe_in(keys, probes):
+    """
+    False where an int64 probe is certainly not among `keys`: Fibonacci
+    hashing into a bitmap 16x the size of `keys` (~6% false positives)
+    """
+    bits = max(16, (16 * len(keys)).bit_length())
+    multiplier, shift = np.uint64(0x9E3779B97F4A7C15), np.uint64(64 - bits)
+    table = np.zeros(1 << bits, dtype=bool)
+    table[(keys.view(np.uint64) * multiplier) >> shift] = True
+    return table[(probes.view(np.uint64) * multiplier) >> shift]
+
+
+class _Sorted:
+    """Links [0, n) ordered by (user, effective expiry): the per-user at-risk table"""
+
+    def __init__(self, user, keys, n):
+        self.n = n
+        user_keys = (user[:n].astype(np.int64) << 32) | (np.clip(keys[:n], -2**31, 2**31 - 1) + 2**31)
+        # ties are one user's items expiring the same day, in no particular order
+        self.by_user = np.argsort(user_keys).astype(np.int32)
+        self.user_keys = user_keys[self.by_user]
+        self.stale = np.zeros(n, dtype=bool)    # re-scored since the sort: their place here is out of date
+
+
+class WasteRiskIndex:
+    """
+    Remaining shelf life and waste risk of every user–product link, kept as
+    a per-user table so "what is this user about to throw away" is a binary
+    search plus a slice.
+
+    Each link gets an effective expiry (see effective_expiry) from its scan
+    date, its product's catalog dates and category, and the latest
+    freshness classification of that user's product. Risk follows from the
+    days left on the day asked about, so the table doesn't go stale
+    overnight. The first read scores every link in one vectorized pass and
+    sorts them by (user, effective expiry). After that only what changed is
+    re-scored: links added since, and the links of newly classified (user,
+    product) pairs. They are merged into reads until RISK_PENDING_MAX
+    accumulate, then a background re-sort folds them in. A reload of the
+    links table or an edit to products already scored rebuilds it all.
+    """
+
+    def __init__(self, expiry=None, freshness=None, half_life=RISK_HALF_LIFE_DAYS, min_score=RISK_MIN_SCORE,
+                 grace_days=RISK_EXPIRED_GRACE_DAYS, pending_max=RISK_PENDING_MAX):
+        self.expiry = expiry
+        self.freshness = freshness
+        self.half_life = half_life
+        self.horizon = at_risk_days(min_score, half_life)
+        self.grace_days = grace_days
+        self.pending_max = pending_max
+        self._lock = threading.RLock()
+        self._sort_lock = threading.Lock()
+        self._sorting = False
+        self._cols = None           # the links' columns as of the last catch-up
+        self._keys = None           # per link: effective expiry as expiry_keys() (unknown sorts last)
+        self._source = None         # (links generation, freshness change list) the scores derive from
+        self._seen = 0              # freshness changes applied
+        self._sorted = None
+        self._rescored = set()      # links < sorted.n re-scored since the sort
+        self._rescore_log = []      # arrays of links re-scored while a sort is in flight
+        self._version = 0           # bumped on every change; keys the cached users ranking
+        self._ranking = None
+
+    # ── scoring ─────────────────────────────────────────────────
+    def _sources(self):
+        expiry = self.expiry if self.expiry is not None else get_expiry_index()
+        freshness = self.freshness if self.freshness is not None else get_freshness_index()
+        if self.freshness is not None:
+            freshness.refresh()
+        return expiry.link_columns(), freshness
+
+    def _classifications(self, cols, links, freshness):
+        """(state code, classified date) arrays for links; (None, None) if nothing is classified"""
+        if not len(freshness):
+            return None, None
+        state = np.zeros(len(links), dtype=np.int8)
+        classified = np.full(len(links), 'NaT', dtype='datetime64[D]')
+        users, products = cols['users'], cols['products']
+        if len(links) < len(freshness):
+            for i, (u, p) in enumerate(zip(cols['user'][links].tolist(), cols['product'][links].tolist())):
+                hit = freshness.get(users[u], products[p])
+                if hit is not None:
+                    state[i], classified[i] = STATE_CODES[hit[0]], hit[1]
+            return state, classified
+
+        # many links: join on (user code << 32 | product code) instead
+        items = freshness.items()
+        user_code, product_code = cols['user_code'], cols['product_code']
+        users = np.array([user_code.get(u, -1) for (u, _), _ in items], dtype=np.int64)
+        products = np.array([product_code.get(p, -1) for (_, p), _ in items], dtype=np.int64)
+        known = (users >= 0) & (products >= 0)
+        if not known.any():
+            return state, classified
+        keys = ((users << 32) | products)[known]
+        order = np.argsort(keys)
+        keys = keys[order]
+        link_keys = (cols['user'][links].astype(np.int64) << 32) | cols['product'][links]
+        # most links have no classification: rule them out with a hash bitmap before the binary search
+        maybe = np.flatnonzero(_maybe_in(keys, link_keys))
+        pos = np.minimum(np.searchsorted(keys, link_keys[maybe]), len(keys) - 1)
+        hit = keys[pos] == link_keys[maybe]
+        at = order[pos[hit]]
+        hit = maybe[hit]
+        state[hit] = np.array([STATE_CODES[s] for _, (s, _) in items], dtype=np.int8)[known][at]
+        classified[hit] = np.array([d for _, (_, d) in items], dtype='datetime64[D]')[known][at]
+        return state, classified
+
+    def _score(self, cols, links, freshness):
+        """Effective-expiry keys for an int array of link indices"""
+        product = cols['product'][links]
+        default_days = np.array([shelf_life_days(c) for c in cols['categories']] or [0], dtype=np.int64)
+        state, classified = self._classifications(cols, links, freshness)
+        expiry = effective_expiry(cols['scan'][links], cols['product_scanned'][product],
+                                  cols['product_expiry'][product], default_days[cols['product_category'][product]],
+                                  state, classified)
+        return expiry_keys(expiry)
+
+    def _links_of(self, cols, pairs):
+        """Indices of the scored links holding any of these (user_uid, product_uid) pairs"""
+        srt, found = self._sorted, []
+        newer = np.arange(srt.n, len(self._keys))
+        for user_uid, product_uid in set(pairs):
+            u, p = cols['user_code'].get(user_uid), cols['product_code'].get(product_uid)
+            if u is None or p is None:
+                continue
+            lo, hi = np.searchsorted(srt.user_keys, [u << 32, (u + 1) << 32])
+            links = srt.by_user[lo:hi]
+            found.append(links[cols['product'][links] == p])
+            found.append(newer[(cols['user'][newer] == u) & (cols['product'][newer] == p)])
+        return np.unique(np.concatenate(found)).astype(np.int64) if found else np.empty(0, dtype=np.int64)
+
+    # ── keeping up ──────────────────────────────────────────────
+    def _catch_up(self):
+        with self._lock:
+            cols, freshness = self._sources()
+            changes, logged = freshness.log()
+            if self._sorted is None or self._source[0] != cols['generation'] or self._source[1] is not changes:
+                self._rebuild(cols, freshness, changes, logged)
+                return
+            n, scored = cols['n'], len(self._keys)
+            if n == scored and logged == self._seen:
+                return
+            if n > scored:
+                self._keys.extend(self._score(cols, np.arange(scored, n), freshness))
+            self._cols = cols
+            if logged > self._seen:
+                links = self._links_of(cols, changes[self._seen:logged])
+                if len(links):
+                    self._keys[links] = self._score(cols, links, freshness)
+                    old = links[links < self._sorted.n]
+                    self._sorted.stale[old] = True
+                    self._rescored.update(old.tolist())
+                    if self._sorting:
+                        self._rescore_log.append(old)
+                self._seen = logged
+            self._version += 1
+            pending = len(self._rescored) + len(self._keys) - self._sorted.n
+            if pending >= self.pending_max and not self._sorting:
+                self._sorting = True
+                threading.Thread(target=self._background_sort, daemon=True).start()
+
+    def _rebuild(self, cols, freshness, changes, logged):
+        """Score every link and sort them (under the lock)"""
+        n = cols['n']
+        keys = _Column(np.int64, capacity=max(n, 1024))
+        keys.extend(self._score(cols, np.arange(n), freshness))
+        self._cols, self._keys = cols, keys
+        self._sorted = _Sorted(cols['user'], keys.values(), n)
+        self._rescored, self._rescore_log = set(), []
+        self._source, self._seen = (cols['generation'], changes), logged
+        self._version += 1
+
+    def _background_sort(self):
+        try:
+            with self._sort_lock:
+                with self._lock:
+                    column, keys, user = self._keys, self._keys.values(), self._cols['user']
+                    self._rescore_log = []
+                srt = _Sorted(user, keys, len(user))
+            with self._lock:
+                if self._keys is column:
+                    # links re-scored while this sort ran are out of place in it too
+                    late = [links[links < srt.n] for links in self._rescore_log]
+                    late = np.concatenate(late) if late else np.empty(0, dtype=np.int64)
+                    srt.stale[late] = True
+                    self._sorted, self._rescored, self._rescore_log = srt, set(late.tolist()), []
+                    self._version += 1
+        finally:
+            self._sorting = False
+
+    def _pending(self):
+        """Links whose place in the sorted table is missing or out of date"""
+        return np.concatenate([np.fromiter(self._rescored, dtype=np.int64, count=len(self._rescored)),
+                               np.arange(self._sorted.n, len(self._keys))])
+
+    # ── queries ─────────────────────────────────────────────────
+    def at_risk(self, user_uid, as_of, offset=0, limit=50, include_expired=False):
+        """
+        One user's items at risk of going to waste on `as_of`, most urgent
+        first: (summary, page). summary is risk_summary over all of them;
+        page is [(product_uid, quantity, expiry_date, risk, freshness state
+        or None)]. Items expired more than grace_days ago are left out
+        unless include_expired.
+        """
+        today = int(np.datetime64(as_of, 'D').view(np.int64))
+        first, bound = at_risk_window(as_of, include_expired, self.grace_days, self.horizon)
+        first = -2**31 if first is None else max(first, -2**31)
+        self._catch_up()
+        freshness = self.freshness if self.freshness is not None else get_freshness_index()
+        with self._lock:
+            cols, srt, keys = self._cols, self._sorted, self._keys.values()
+            code = cols['user_code'].get(user_uid)
+            if code is None:
+                return {'items': 0, 'quantity': 0, 'risk_total': 0.0}, []
+            base = np.int64(code) << 32
+            lo = np.searchsorted(srt.user_keys, base | (first + 2**31), side='left')
+            hi = np.searchsorted(srt.user_keys, base | (min(bound, 2**31 - 1) + 2**31), side='right')
+            links = srt.by_user[lo:hi]
+            links = links[~srt.stale[links]]
+            pending = self._pending()
+            pending = pending[(cols['user'][pending] == code) & (keys[pending] >= first) & (keys[pending] <= bound)]
+            if len(pending):
+                links = np.concatenate([links, pending])
+                links = links[np.argsort(keys[links], kind='stable')]
+            expiry = keys[links]
+            product = cols['product'][links]
+            quantity = cols['quantity'][links]
+            products = cols['products']
+
+        risk = risk_scores(expiry - today, self.half_life)
+        summary = risk_summary(quantity, risk)
+        page = []
+        for p, q, e, r in zip(product[offset:offset + limit].tolist(), quantity[offset:offset + limit].tolist(),
+                              expiry[offset:offset + limit].tolist(), risk[offset:offset + limit].tolist()):
+            state = freshness.get(user_uid, products[p])
+            page.append((products[p], q, np.datetime64(e, 'D'), round(r, 3), state[0] if state else None))
+        return summary, page
+
+    def at_risk_users(self, as_of, offset=0, limit=50, include_expired=False):
+        """
+        Users with items at risk on `as_of` (as at_risk lists them), the
+        largest risk total first: (total users, [(user_uid, items, quantity,
+        risk_total)]) for the page. The ranking is kept until something
+        changes or another day is asked for.
+        """
+        today = int(np.datetime64(as_of, 'D').view(np.int64))
+        first, last = at_risk_window(as_of, include_expired, self.grace_days, self.horizon)
+        self._catch_up()
+        with self._lock:
+            cols = self._cols
+            if self._ranking is None or self._ranking[0] != (today, include_expired, self._version):
+                keys = self._keys.values()
+                listed = keys <= last
+                if first is not None:
+                    listed &= keys >= first
+                links = np.flatnonzero(listed)
+                user, quantity = cols['user'][links], cols['quantity'][links]
+                risk = risk_scores(keys[links] - today, self.half_life) * np.maximum(quantity, 1)
+                size = len(cols['users'])
+                items = np.bincount(user, minlength=size)
+                totals = (np.bincount(user, weights=quantity, minlength=size),
+                          np.bincount(user, weights=risk, minlength=size))
+                ranked = np.flatnonzero(items)
+                ranked = ranked[np.argsort(-totals[1][ranked], kind='stable')]
+                self._ranking = ((today, include_expired, self._version), ranked, items, *totals)
+            _, ranked, items, quantity, risk = self._ranking
+        users = cols['users']
+        return len(ranked), [(users[u], int(items[u]), int(quantity[u]), round(float(risk[u]), 3))
+                             for u in ranked[offset:offset + limit].tolist()]
+
+    def __len__(self):
+        return 0 if self._keys is None else len(self._keys)
+
+
+_risk = WasteRiskIndex()
+
+def get_waste_risk():
+    return _risk
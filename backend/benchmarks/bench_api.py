@@ -0,0 +1,305 @@
+# benchmarks/bench_api.py
+"""
+End-to-end benchmark of every /api route through the Flask app, on
+generated tables (benchmarks.generate) at any scale, with the OpenFoodFacts
+and OpenAI APIs replaced by local stubs and synthetic photos for the
+classification routes. Reports throughput and p50/p90/p99 per route and
+saves the results as JSON; --compare flags routes that got slower than an
+earlier run.
+
+Reads run before writes, so every read sees the same generated state. With
+no --checkpoint the classifier gets random weights: the forward pass costs
+the same, only the labels are meaningless.
+
+    cd backend && python -m benchmarks.bench_api --links 1m [--backend sqlite] [--concurrency 4] [--stages]
+    cd backend && python -m benchmarks.bench_api --data /tmp/lastbite-10m --compare benchmarks/results/api-....json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import CITIES, product_uid, user_uid, percentiles
+from benchmarks.generate import generate, barcode, parse_count, TABLE_FILES
+from benchmarks.bench_preprocess import synthetic_photo
+from benchmarks.stubs import StubServer, off_handler, openai_handler
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+IMPORT_FIELDS = ['barcode', 'item_name', 'category', 'expiry_date', 'user_uid', 'quantity']
+
+
+def write_random_checkpoint(path):
+    import torch
+    from app.models.fruit_model import DualFruitCNN
+    torch.manual_seed(0)
+    torch.save({'model_state_dict': DualFruitCNN().state_dict()}, path)
+
+
+def photos(n, seed):
+    """n distinct 640x480 JPEGs (a phone upload after client-side resizing)"""
+    return [synthetic_photo(640, 480, 'JPEG', seed=seed + i) for i in range(n)]
+
+
+def multipart(field, images):
+    return {field: [(io.BytesIO(img), f"{i}.jpg") for i, img in enumerate(images)]}
+
+
+def import_body(rng, rows, counts):
+    buf = io.StringIO()
+    buf.write(','.join(IMPORT_FIELDS) + '\n')
+    for _ in range(rows):
+        if rng.random() < 0.8:
+            row = [barcode(rng.randrange(counts['products'])), '', '', '']
+        else:
+            row = [str(900000000000 + rng.randrange(10**11)), 'Juice', 'Beverages', '2025-09-01']
+        buf.write(','.join(row + [user_uid(rng.randrange(counts['users'])), str(rng.randint(1, 3))]) + '\n')
+    return buf.getvalue().encode()
+
+
+def routes(args, counts, rng):
+    """
+    (label, calls, expected statuses) per route, reads first. A call is a
+    function of the test client, so request bodies are built before timing.
+    """
+    n, heavy = args.requests, args.heavy_requests
+    users = lambda k: [user_uid(rng.randrange(counts['users'])) for _ in range(k)]
+    known = lambda k: [barcode(rng.randrange(counts['products'])) for _ in range(k)]
+    points = lambda k: [(lat + rng.gauss(0, .1), lng + rng.gauss(0, .1)) for lat, lng in rng.choices(CITIES, k=k)]
+    unknown = [str(800000000000 + i) for i in range(n)]          # not in the catalog: goes to OFF
+    new_images, batch_images = photos(heavy, seed=1000), photos(args.batch_size, seed=5000)
+    repeat_image = new_images[0]
+
+    get = lambda url: lambda c: c.get(url)
+    post = lambda url, **kw: lambda c: c.post(url, **kw)
+    upload = lambda url, field, imgs: lambda c: c.post(url, data=multipart(field, imgs),
+                                                       content_type='multipart/form-data')
+    as_of = '2025-02-01'
+    return [
+        ('GET inventory/<user>', [get(f'/api/inventory/{u}') for u in users(n)], {200}),
+        ('GET inventory/<heaviest user>', [get(f'/api/inventory/{user_uid(0)}')] * heavy, {200}),
+        ('GET inventory ?limit=100', [get(f'/api/inventory/{user_uid(0)}?limit=100')] * n, {200}),
+        ('GET inventory ?stream=ndjson', [get(f'/api/inventory/{u}?stream=ndjson') for u in users(n)], {200}),
+        ('GET expiring (3 days)', [get(f'/api/expiring?days=3&as_of={as_of}&offset={o}')
+                                   for o in rng.choices((0, 50, 1000), k=n)], {200}),
+        ('GET expiring/<user>', [get(f'/api/expiring/{u}?days=30&as_of={as_of}') for u in users(n)], {200}),
+        ('GET routing/nearest user', [get(f'/api/routing/nearest?user_uid={u}&k=10') for u in users(n)], {200}),
+        ('GET routing/nearest point', [get(f'/api/routing/nearest?lat={lat}&lng={lng}&radius_km=5&k=50')
+                                       for lat, lng in points(n)], {200}),
+        ('POST barcode/scan (in catalog)', [post('/api/barcode/scan', json={'barcode': b}) for b in known(n)], {200}),
+        ('POST barcode/scan (OFF lookup)', [post('/api/barcode/scan', json={'barcode': b}) for b in unknown], {200}),
+        ('POST barcode/scan (OFF cached)', [post('/api/barcode/scan', json={'barcode': b}) for b in unknown], {200}),
+        ('GET barcode/off-stats', [get('/api/barcode/off-stats')] * n, {200}),
+        ('POST classify/model (new image)', [upload('/api/classify/model', 'image', [img]) for img in new_images],
+         {200}),
+        ('POST classify/model (repeat)', [upload('/api/classify/model', 'image', [repeat_image])] * n, {200}),
+        ('POST classify', [upload('/api/classify', 'image', [img]) for img in photos(heavy, seed=2000)], {200}),
+        (f'POST classify/batch ({args.batch_size} images)',
+         [upload('/api/classify/batch', 'images', batch_images[i:] + batch_images[:i]) for i in range(heavy)], {200}),
+        ('POST classify/openai', [upload('/api/classify/openai', 'image', [img])
+                                  for img in photos(heavy, seed=3000)], {200}),
+        ('GET classify/cache-stats', [get('/api/classify/cache-stats')] * n, {200}),
+        ('GET classify/fallback-stats', [get('/api/classify/fallback-stats')] * n, {200}),
+        ('GET classify/cascade-stats', [get('/api/classify/cascade-stats')] * n, {200}),
+        # writes
+        ('POST barcode/confirm', [post('/api/barcode/confirm', json={'barcode': b, 'category': 'Dairy',
+                                                                     'user_id': u, 'quantity': 1})
+                                  for b, u in zip(known(n), users(n))], {201}),
+        ('POST confirm-product', [post('/api/confirm-product', json={
+            'user_uid': u, 'product_uid': product_uid(rng.randrange(counts['products']))}) for u in users(n)],
+         {200, 201}),
+        ('POST routing/locations', [post('/api/routing/locations', json={'user_uid': u, 'location_lat': lat,
+                                                                         'location_lng': lng})
+                                    for u, (lat, lng) in zip(users(n), points(n))], {201}),
+        (f'POST import ({args.import_rows} rows)',
+         [post('/api/import', data=import_body(rng, args.import_rows, counts), content_type='text/csv')
+          for _ in range(heavy)], {200}),
+    ]
+
+
+def run_route(client, calls, expected, concurrency, warmup):
+    """
+    Latencies (s), wall time (s), unexpected-status count and the statuses
+    seen for one route; the first `warmup` calls are made but not timed.
+    """
+    def timed(call):
+        t0 = time.perf_counter()
+        r = call(client)
+        elapsed = time.perf_counter() - t0
+        r.close()
+        return elapsed, r.status_code
+
+    for call in calls[:warmup]:
+        timed(call)
+    calls = calls[warmup:]
+    t0 = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(concurrency) as pool:
+            out = list(pool.map(timed, calls))
+    else:
+        out = [timed(call) for call in calls]
+    wall = time.perf_counter() - t0
+    statuses = [s for _, s in out]
+    return [t for t, _ in out], wall, sum(s not in expected for s in statuses), sorted(set(statuses))
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def stage_means():
+    """{route rule: {stage: {calls, mean_ms}}} from the app's lastbite_stage_seconds histogram"""
+    from app.services.metrics import STAGE_SECONDS
+    out = {}
+    for (route, name), (cumulative, total) in sorted(STAGE_SECONDS.snapshot().items()):
+        out.setdefault(route or '<no request>', {})[name] = {
+            'calls': cumulative[-1], 'mean_ms': round(total * 1000 / cumulative[-1], 3)}
+    return out
+
+
+def compare(old, new, tolerance):
+    """Print old vs new per route; returns the routes whose p50 or p99 got worse by more than `tolerance`"""
+    print(f"\nvs. {old['meta']['saved_at']} ({old['meta'].get('revision')}):")
+    print(f"{'route':<36}| {'p50 ms':>17} | {'p99 ms':>17} | {'req/s':>15}")
+    regressions = []
+    for label, r in new['routes'].items():
+        o = old['routes'].get(label)
+        if o is None:
+            continue
+        change = {k: (r[k] - o[k]) / o[k] if o[k] else 0.0 for k in ('p50_ms', 'p99_ms', 'throughput_rps')}
+        worse = change['p50_ms'] > tolerance or change['p99_ms'] > tolerance
+        if worse:
+            regressions.append(label)
+        print(f"{label:<36}| {o['p50_ms']:7.2f} {change['p50_ms']:+8.0%} | {o['p99_ms']:7.2f} "
+              f"{change['p99_ms']:+8.0%} | {o['throughput_rps']:6.0f} {change['throughput_rps']:+7.0%}"
+              f"{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--links', type=parse_count, default=parse_count('100k'), help="generate this many links")
+    ap.add_argument('--data', help="use tables from benchmarks.generate in this directory instead (copied)")
+    ap.add_argument('--backend', choices=('csv', 'sqlite'), default='csv')
+    ap.add_argument('--requests', type=int, default=300, help="calls per route")
+    ap.add_argument('--heavy-requests', type=int, default=40, help="calls per classification/import route")
+    ap.add_argument('--concurrency', type=int, default=1)
+    ap.add_argument('--warmup', type=int, default=3, help="untimed calls per route")
+    ap.add_argument('--batch-size', type=int, default=8)
+    ap.add_argument('--import-rows', type=int, default=500)
+    ap.add_argument('--off-latency-ms', type=float, default=20)
+    ap.add_argument('--openai-latency-ms', type=float, default=200)
+    ap.add_argument('--checkpoint', help="model weights; random weights if omitted")
+    ap.add_argument('--stages', action='store_true', help="also print the mean time per stage of each route")
+    ap.add_argument('--only', help="run only routes whose label contains this")
+    ap.add_argument('--out', help=f"results file (default: {RESULTS_DIR}/api-<time>.json)")
+    ap.add_argument('--compare', help="earlier results file to compare against")
+    ap.add_argument('--tolerance', type=float, default=0.2, help="slowdown flagged as a regression")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='lastbite-api-') as tmp, \
+            StubServer(off_handler({}, latency_s=args.off_latency_ms / 1000)) as off, \
+            StubServer(openai_handler(latency_s=args.openai_latency_ms / 1000)) as openai_stub:
+        t0 = time.perf_counter()
+        if args.data:
+            for f in TABLE_FILES:
+                shutil.copyfile(os.path.join(args.data, f), os.path.join(tmp, f))
+            with open(os.path.join(tmp, TABLE_FILES[0])) as f:
+                counts = {'products': sum(1 for _ in f) - 1}
+            with open(os.path.join(tmp, TABLE_FILES[1])) as f:
+                counts['links'] = sum(1 for _ in f) - 1
+            with open(os.path.join(tmp, TABLE_FILES[2])) as f:
+                counts['users'] = len({line.split(',', 1)[0] for line in f}) - 1
+        else:
+            counts = generate(tmp, args.links)
+        print(f"tables: {counts} ({time.perf_counter() - t0:.1f}s)")
+
+        checkpoint = args.checkpoint
+        if not checkpoint:
+            checkpoint = os.path.join(tmp, 'random.pth')
+            write_random_checkpoint(checkpoint)
+        # read when the app modules are imported, so set before importing them
+        os.environ.update({
+            'LASTBITE_OFF_URL': off.url,
+            'LASTBITE_OFF_CACHE_PATH': os.path.join(tmp, 'off_cache.sqlite'),
+            'OPENAI_BASE_URL': openai_stub.url + '/v1',
+            'OPENAI_API_KEY': 'stub',
+            'LASTBITE_MODEL_PATH': os.path.abspath(checkpoint),
+        })
+        os.environ.setdefault('LASTBITE_LOG_LEVEL', 'WARNING')
+        from run import create_app
+        from app.services.repository import CsvRepository, set_repository
+        from app.services.sqlite_repository import SqliteRepository, import_csv
+
+        if args.backend == 'sqlite':
+            db = os.path.join(tmp, 'lastbite.sqlite')
+            import_csv(db, *(os.path.join(tmp, f) for f in TABLE_FILES))
+            set_repository(SqliteRepository(db))
+        else:
+            set_repository(CsvRepository.in_dir(tmp))
+        client = create_app(classifier='warm').test_client()
+        t0 = time.perf_counter()
+        client.get(f'/api/inventory/{user_uid(0)}?limit=1')
+        client.get('/api/expiring?days=1')
+        client.get(f'/api/routing/nearest?user_uid={user_uid(0)}')
+        client.post('/api/barcode/scan', json={'barcode': barcode(0)})
+        print(f"first requests (index load / database open): {time.perf_counter() - t0:.1f}s")
+
+        results = {}
+        print(f"{'route':<36}| {'req/s':>8} | {'p50 ms':>8} | {'p90 ms':>8} | {'p99 ms':>8} | errors")
+        for label, calls, expected in routes(args, counts, random.Random(7)):
+            if args.only and args.only not in label:
+                continue
+            samples, wall, errors, statuses = run_route(client, calls, expected, args.concurrency, args.warmup)
+            p = percentiles(samples, (50, 90, 99))
+            results[label] = {'requests': len(samples), 'throughput_rps': round(len(samples) / wall, 2),
+                              'p50_ms': round(p['p50'], 3), 'p90_ms': round(p['p90'], 3),
+                              'p99_ms': round(p['p99'], 3), 'max_ms': round(max(samples) * 1000, 3),
+                              'errors': errors, 'statuses': statuses}
+            print(f"{label:<36}| {len(samples) / wall:8.1f} | {p['p50']:8.2f} | {p['p90']:8.2f} | "
+                  f"{p['p99']:8.2f} | {errors or ''}{'' if not errors else f' (statuses {statuses})'}")
+        print(f"stub upstream calls: OFF {off.requests}, OpenAI {openai_stub.requests}")
+        stages = stage_means()
+        if args.stages:
+            print(f"\n{'route':<36}| {'stage':<16}| {'calls':>7} | {'mean ms':>8}")
+            for route, by_stage in stages.items():
+                for name, s in by_stage.items():
+                    print(f"{route:<36}| {name:<16}| {s['calls']:7d} | {s['mean_ms']:8.2f}")
+
+    saved = {
+        'meta': {'saved_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                 'revision': git_revision(), 'tables': counts, 'args': vars(args),
+                 'python': platform.python_version(), 'platform': platform.platform(),
+                 'cpus': os.cpu_count()},
+        'routes': results,
+        'stages': stages,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"api-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(saved, f, indent=2)
+    print(f"saved {out}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), saved, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} route(s) slower than {args.compare} by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/bench_backends.py
+"""
+Accuracy parity, latency, throughput and resident memory of each
+DualFruitCNN inference backend against the fp32 checkpoint. Each backend
+runs in its own process so RSS numbers don't bleed into each other.
+
+    cd backend && python -m benchmarks.bench_backends --checkpoint app/models/fruit_dual_cnn.pth \
+        [--images path/to/eval/images] [--backends eager torchscript traced dynamic_int8 static_int8]
+"""
+
+import time
+import argparse
+import multiprocessing as mp
+
+import torch
+
+from app.models.fruit_model import (
+    BACKENDS, DualFruitCNN, build_backend, backend_parity, calibration_batches, load_model_checkpoint,
+)
+from benchmarks.common import percentiles
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return float('nan')
+
+
+def measure(checkpoint, backend, images, iters, batch):
+    torch.set_num_threads(1)
+    base_rss = rss_mb()
+    if checkpoint:
+        reference, _ = load_model_checkpoint(checkpoint, device=torch.device('cpu'), backend='eager')
+    else:
+        torch.manual_seed(0)
+        reference = DualFruitCNN().eval()
+    if images:
+        inputs = calibration_batches(images, batch_size=batch)
+    else:
+        torch.manual_seed(0)
+        inputs = list(torch.randn(8, batch, 3, 128, 128).clamp(-1, 1))
+    # static_int8 calibrates on the same inputs it is compared on
+    model = build_backend(reference, backend, calibration=inputs if backend == 'static_int8' else None)
+    parity = backend_parity(reference, model, inputs)
+    if backend != 'eager':
+        del reference
+
+    one, many = torch.randn(1, 3, 128, 128), torch.randn(batch, 3, 128, 128)
+    with torch.no_grad():
+        for _ in range(10):
+            model(one)
+        samples = []
+        for _ in range(iters):
+            t0 = time.perf_counter()
+            model(one)
+            samples.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        for _ in range(max(1, iters // 10)):
+            model(many)
+        throughput = batch * max(1, iters // 10) / (time.perf_counter() - t0)
+    return {'backend': backend, **parity, **percentiles(samples), 'images_per_s': throughput,
+            'rss_mb': rss_mb() - base_rss}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--checkpoint', help='fp32 checkpoint; random weights if omitted')
+    ap.add_argument('--images', help='directory of evaluation images; random inputs if omitted')
+    ap.add_argument('--backends', nargs='+', default=list(BACKENDS))
+    ap.add_argument('--iters', type=int, default=200)
+    ap.add_argument('--batch', type=int, default=32)
+    args = ap.parse_args()
+
+    ctx = mp.get_context('spawn')
+    for backend in args.backends:
+        with ctx.Pool(1) as pool:
+            r = pool.apply(measure, (args.checkpoint, backend, args.images, args.iters, args.batch))
+        print(f"{r['backend']:>12} | agree fruit {r['fruit_agreement']:6.1%} state {r['state_agreement']:6.1%}"
+              f" max|dlogit| {r['max_logit_diff']:.4f} | p50 {r['p50']:6.2f} ms  p99 {r['p99']:6.2f} ms"
+              f" | {r['images_per_s']:7.1f} img/s @ batch {args.batch} | +{r['rss_mb']:6.1f} MB RSS")
+
+
+if __name__ == '__main__':
+    main()
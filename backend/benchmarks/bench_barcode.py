@@ -0,0 +1,61 @@
+# benchmarks/bench_barcode.py
+"""
+/api/barcode/scan lookup: pandas re-parse + boolean mask vs. resident barcode index.
+
+    cd backend && python -m benchmarks.bench_barcode [--sizes 10000 100000 1000000]
+"""
+
+import os
+import random
+import argparse
+import tempfile
+
+import pandas as pd
+
+from app.services.product_catalog import ProductCatalog
+from benchmarks.common import write_products, percentiles, time_calls
+
+
+def pandas_scan(products_csv, barcode):
+    """The original scan_barcode path: parse the CSV, mask, then list categories"""
+    df = pd.read_csv(products_csv, dtype=str)
+    existing = df[df['barcode'] == barcode]
+    cats = sorted(df['category'].dropna().unique().tolist())
+    return existing, cats
+
+
+def indexed(catalog, barcode):
+    catalog.refresh()
+    return catalog.by_barcode(barcode), catalog.categories()
+
+
+def run(n, scan_iters, index_iters):
+    with tempfile.TemporaryDirectory() as tmp:
+        products_csv = os.path.join(tmp, 'products.csv')
+        write_products(products_csv, n)
+        rng = random.Random(1)
+        # half hits, half misses
+        codes = [str(100000000000 + rng.randrange(2 * n)) for _ in range(max(scan_iters, index_iters))]
+
+        scan = time_calls(lambda b: pandas_scan(products_csv, b), [(b,) for b in codes[:scan_iters]])
+        catalog = ProductCatalog(products_csv)
+        catalog.refresh()
+        idx = time_calls(lambda b: indexed(catalog, b), [(b,) for b in codes[:index_iters]])
+
+    s, i = percentiles(scan), percentiles(idx)
+    print(f"{n:>9} products | pandas p50 {s['p50']:9.3f} ms  p99 {s['p99']:9.3f} ms"
+          f" | index p50 {i['p50'] * 1000:6.2f} us  p99 {i['p99'] * 1000:6.2f} us")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    ap.add_argument('--scan-iters', type=int, default=10)
+    ap.add_argument('--index-iters', type=int, default=20000)
+    args = ap.parse_args()
+    for n in args.sizes:
+        run(n, args.scan_iters, args.index_iters)
+
+
+if __name__ == '__main__':
+    main()
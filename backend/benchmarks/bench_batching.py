@@ -0,0 +1,63 @@
+# benchmarks/bench_batching.py
+"""
+Load test of the micro-batching inference queue on CPU: images/sec and tail
+latency with concurrent clients, for a few max batch sizes.
+
+    cd backend && python -m benchmarks.bench_batching [--batch-sizes 1 8 32] [--clients 32]
+"""
+
+import time
+import argparse
+import threading
+
+import torch
+
+from app.models.fruit_model import DualFruitCNN
+from app.services.inference_batcher import InferenceBatcher
+from benchmarks.common import percentiles
+
+
+def run(max_batch, clients, per_client, max_wait_ms):
+    model = DualFruitCNN().eval()
+    batcher = InferenceBatcher(model, max_batch_size=max_batch, max_wait_ms=max_wait_ms)
+    x = torch.randn(3, 128, 128)
+    batcher.infer(x)  # warm up the scheduler thread and the kernels
+
+    samples, lock = [], threading.Lock()
+
+    def client():
+        local = []
+        for _ in range(per_client):
+            t0 = time.perf_counter()
+            batcher.infer(x)
+            local.append(time.perf_counter() - t0)
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    p = percentiles(samples, (50, 95, 99))
+    print(f"max batch {max_batch:>3} | {len(samples) / elapsed:8.1f} images/s"
+          f" | p50 {p['p50']:7.2f} ms  p95 {p['p95']:7.2f} ms  p99 {p['p99']:7.2f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    ap.add_argument('--clients', type=int, default=32)
+    ap.add_argument('--requests-per-client', type=int, default=20)
+    ap.add_argument('--max-wait-ms', type=float, default=5)
+    args = ap.parse_args()
+    print(f"{args.clients} concurrent clients, torch threads={torch.get_num_threads()}")
+    for b in args.batch_sizes:
+        run(b, args.clients, args.requests_per_client, args.max_wait_ms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+# benchmarks/bench_bulk_import.py
+"""
+POST /api/import: a partner-store upload streamed from disk through the
+Flask test client on both storage backends: rows/s, peak RSS growth, and
+the same rows sent one /api/barcode/confirm call at a time (extrapolated).
+
+The upload mixes stock for barcodes already in the catalog, new products,
+repeated rows (deduped) and bad rows (reported).
+
+    cd backend && python -m benchmarks.bench_bulk_import [--rows 1000000]
+"""
+
+import os
+import csv
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+
+from run import create_app
+from app.services.repository import CsvRepository, set_repository
+from app.services.sqlite_repository import SqliteRepository, import_csv
+from benchmarks.common import write_products, write_users, write_links, ITEMS, user_uid
+
+FIELDS = ['barcode', 'item_name', 'category', 'expiry_date', 'user_uid', 'quantity']
+
+
+def write_upload(path, n, n_users, n_products, seed=0):
+    """70% stock of known barcodes, 20% new products, 5% repeats, 5% bad rows"""
+    rng = random.Random(seed)
+    recent = []
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(FIELDS)
+        for i in range(n):
+            r = rng.random()
+            if r < 0.70:
+                row = [str(100000000000 + rng.randrange(n_products)), '', '', '', user_uid(rng.randrange(n_users)),
+                       str(rng.randint(1, 5))]
+            elif r < 0.90:
+                name, cat = rng.choice(ITEMS)
+                row = [str(900000000000 + i), name, cat, f"2025-{rng.randint(6, 12):02d}-15",
+                       user_uid(rng.randrange(n_users)), '1']
+            elif r < 0.95 and recent:
+                row = rng.choice(recent)
+            else:
+                row = [str(100000000000 + rng.randrange(n_products)), '', '', '',
+                       rng.choice(['USR_unknown', user_uid(0)]), rng.choice(['x', '-1'])]
+            w.writerow(row)
+            if len(recent) < 1000:
+                recent.append(row)
+            else:
+                recent[rng.randrange(1000)] = row
+
+
+def peak_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rows', type=int, default=1_000_000)
+    ap.add_argument('--products', type=int, default=100_000)
+    ap.add_argument('--users', type=int, default=10_000)
+    ap.add_argument('--per-item', type=int, default=2000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tables = {name: os.path.join(tmp, name) for name in (
+            'products_table_v2.csv', 'user_product_link_table_v2.csv', 'users_table_v2.csv')}
+        write_products(tables['products_table_v2.csv'], args.products)
+        write_users(tables['users_table_v2.csv'], args.users)
+        write_links(tables['user_product_link_table_v2.csv'], args.products, args.users, args.products)
+        db = os.path.join(tmp, 'lastbite.sqlite')
+        import_csv(db, *tables.values())
+        upload = os.path.join(tmp, 'upload.csv')
+        write_upload(upload, args.rows, args.users, args.products)
+        print(f"upload: {args.rows} rows, {os.path.getsize(upload) / 2**20:.0f} MiB")
+
+        client = create_app(classifier='off').test_client()
+        for name, repo in (('sqlite', SqliteRepository(db)), ('csv', CsvRepository.in_dir(tmp))):
+            set_repository(repo)
+            client.get(f'/api/inventory/{user_uid(0)}')       # load indexes before measuring
+            repo.product_by_barcode('0')
+
+            # the per-item path, one request per row
+            rng = random.Random(1)
+            t0 = time.perf_counter()
+            for _ in range(args.per_item):
+                client.post('/api/barcode/confirm', json={
+                    'barcode': str(100000000000 + rng.randrange(args.products)), 'category': 'Dairy',
+                    'user_id': user_uid(rng.randrange(args.users)), 'quantity': 1})
+            per_item = (time.perf_counter() - t0) / args.per_item
+
+            rss = peak_rss_mib()
+            with open(upload, 'rb') as f:
+                t0 = time.perf_counter()
+                r = client.post('/api/import', input_stream=f, content_length=os.path.getsize(upload),
+                                content_type='text/csv')
+                elapsed = time.perf_counter() - t0
+            s = r.get_json()
+            assert r.status_code == 200, (r.status_code, s)
+            print(f"{name:>6} | {s['rows'] / elapsed:8.0f} rows/s ({elapsed:.1f}s) | "
+                  f"{s['products_created']} products, {s['links_created']} links, "
+                  f"{s['duplicate_links']} duplicates, {s['rejected']} rejected, {s['batches']} batches | "
+                  f"peak RSS +{peak_rss_mib() - rss:.0f} MiB | "
+                  f"per-item /barcode/confirm {per_item * 1000:.2f} ms/row -> "
+                  f"~{per_item * args.rows / 60:.0f} min for the same rows")
+            print(f"         first errors: {json.dumps(s['errors'][:2])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+# benchmarks/bench_cascade.py
+"""
+The /classify cascade: calibrated local confidences decide which uploads
+pay for an OpenAI call.
+
+The repo ships no training data, so this draws its own labelled photos
+(a fruit-coloured blob on a noisy background; rotten ones darker and
+spotted), a share of them ambiguous: colours blended towards another fruit,
+rot half-developed. It trains DualFruitCNN on --train of them until it is
+over-confident, fits per-head temperatures on --held-out others with
+`python -m app.models.calibration`, and reports NLL and expected
+calibration error on the --test set before and after.
+
+It then sends the test set to /api/classify with a stub OpenAI that answers
+with the true labels after --openai-latency-ms, once per cascade setting:
+uncalibrated vs. calibrated, several thresholds, a small fallback budget.
+Reported per setting: which tier answered, accuracy (both labels right)
+and latency.
+
+    cd backend && python -m benchmarks.bench_cascade [--train 1000] [--test 400] [--openai-latency-ms 200]
+"""
+
+import io
+import os
+import re
+import sys
+import json
+import time
+import base64
+import random
+import argparse
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+from benchmarks.common import percentiles
+from benchmarks.stubs import StubServer, openai_handler
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+FRUITS = ('apple', 'banana', 'orange')
+STATES = ('fresh', 'rotten')
+COLOURS = {'apple': (190, 35, 40), 'banana': (225, 200, 60), 'orange': (235, 135, 30)}
+
+
+def fruit_photo(rng, fruit, state, hard):
+    """128x128 JPEG; `hard` ones blend towards another fruit's colour and sit between fresh and rotten"""
+    other = COLOURS[rng.choice([f for f in FRUITS if f != fruit])]
+    blend = rng.uniform(0.25, 0.55) if hard else rng.uniform(0, 0.15)
+    rot = rng.uniform(0.35, 0.65) if hard else rng.uniform(0, 0.2)
+    if state == 'rotten':
+        rot = 1 - rot
+    colour = [(1 - blend) * c + blend * o for c, o in zip(COLOURS[fruit], other)]
+    colour = tuple(int(c * (1 - 0.55 * rot)) for c in colour)
+
+    img = Image.fromarray(np.random.default_rng(rng.getrandbits(32)).integers(170, 235, (128, 128, 3), dtype=np.uint8))
+    draw = ImageDraw.Draw(img)
+    cx, cy, r = rng.randint(44, 84), rng.randint(44, 84), rng.randint(28, 40)
+    draw.ellipse((cx - r, cy - r, cx + r, cy + r), fill=colour)
+    for _ in range(int(12 * rot)):
+        sx, sy, sr = cx + rng.randint(-r // 2, r // 2), cy + rng.randint(-r // 2, r // 2), rng.randint(3, 8)
+        draw.ellipse((sx - sr, sy - sr, sx + sr, sy + sr), fill=(70, 45, 25))
+    buf = io.BytesIO()
+    img.filter(ImageFilter.GaussianBlur(1)).save(buf, 'JPEG', quality=90)
+    return buf.getvalue()
+
+
+def dataset(n, seed, hard_share):
+    """[(jpeg bytes, fruit index, state index)]"""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        f, s = rng.randrange(len(FRUITS)), rng.randrange(len(STATES))
+        out.append((fruit_photo(rng, FRUITS[f], STATES[s], rng.random() < hard_share), f, s))
+    return out
+
+
+def to_batch(items):
+    from app.services.classification_service import load_array
+    from app.models.fruit_model import INPUT_SIZE
+    x = np.empty((len(items), 3, *INPUT_SIZE), dtype=np.float32)
+    for row, (img, _, _) in enumerate(items):
+        load_array(img, x[row])
+    return x
+
+
+def train(items, epochs, seed):
+    """DualFruitCNN trained on `items` long enough to be over-confident on unseen ones"""
+    import torch
+    import torch.nn.functional as F
+    from app.models.fruit_model import DualFruitCNN
+    torch.manual_seed(seed)
+    x = torch.from_numpy(to_batch(items))
+    fruit = torch.tensor([f for _, f, _ in items])
+    state = torch.tensor([s for _, _, s in items])
+    model = DualFruitCNN()
+    opt = torch.optim.Adam(model.parameters(), lr=1e-3)
+    for _ in range(epochs):
+        order = torch.randperm(len(items))
+        for i in range(0, len(items), 32):
+            idx = order[i:i + 32]
+            f_logits, s_logits = model(x[idx])
+            loss = F.cross_entropy(f_logits, fruit[idx]) + F.cross_entropy(s_logits, state[idx])
+            opt.zero_grad()
+            loss.backward()
+            opt.step()
+    return model.eval()
+
+
+def write_dir(root, items):
+    """Held-out images in <state>_<fruit>/ folders, the layout app.models.calibration reads"""
+    for i, (img, f, s) in enumerate(items):
+        folder = os.path.join(root, f'{STATES[s]}_{FRUITS[f]}')
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f'{i}.jpg'), 'wb') as out:
+            out.write(img)
+
+
+def run_cascade(client, items, concurrency):
+    """({tier: requests it answered}, per request whether both labels were right, per request latency s)"""
+    from app.services.cascade import get_cascade
+
+    def one(item):
+        img, f, s = item
+        t0 = time.perf_counter()
+        r = client.post('/api/classify', data={'image': (io.BytesIO(img), 'photo.jpg')},
+                        content_type='multipart/form-data')
+        elapsed = time.perf_counter() - t0
+        body = r.get_json()
+        assert r.status_code == 200, body
+        return body.get('fruit') == FRUITS[f] and body.get('state') == STATES[s], elapsed
+
+    before = get_cascade().stats()['answered']
+    with ThreadPoolExecutor(concurrency) as pool:
+        out = list(pool.map(one, items))
+    after = get_cascade().stats()['answered']
+    tiers = {t: after[t] - before[t] for t in after}
+    return tiers, [ok for ok, _ in out], [t for _, t in out]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--train', type=int, default=1000)
+    ap.add_argument('--held-out', type=int, default=600, help="images the temperatures are fitted on")
+    ap.add_argument('--test', type=int, default=400)
+    ap.add_argument('--hard-share', type=float, default=0.3, help="share of ambiguous photos")
+    ap.add_argument('--epochs', type=int, default=15)
+    ap.add_argument('--openai-latency-ms', type=float, default=200)
+    ap.add_argument('--concurrency', type=int, default=4)
+    ap.add_argument('--budget', type=float, default=30, help="fallback calls per minute for the budget run")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    train_set = dataset(args.train, 1, args.hard_share)
+    held_out = dataset(args.held_out, 2, args.hard_share)
+    test_set = dataset(args.test, 3, args.hard_share)
+    labels = {base64.b64encode(img).decode(): (FRUITS[f], STATES[s]) for img, f, s in test_set}
+    print(f"{args.train} train / {args.held_out} held-out / {args.test} test photos, "
+          f"{args.hard_share:.0%} ambiguous ({time.perf_counter() - t0:.1f}s)")
+
+    def reply(body):
+        url = body['messages'][0]['content'][1]['image_url']['url']
+        fruit, state = labels[re.sub(r'^data:[^,]*,', '', url)]
+        return json.dumps({'fruit': fruit, 'state': state})
+
+    with tempfile.TemporaryDirectory(prefix='lastbite-cascade-') as tmp, \
+            StubServer(openai_handler(reply, latency_s=args.openai_latency_ms / 1000)) as openai_stub:
+        checkpoint = os.path.join(tmp, 'fruit_dual_cnn.pth')
+        os.environ.update({
+            'LASTBITE_MODEL_PATH': checkpoint,
+            'LASTBITE_RESULT_CACHE_SIZE': '0',      # every request reaches the model (and the fallback)
+            'OPENAI_BASE_URL': openai_stub.url + '/v1',
+            'OPENAI_API_KEY': 'stub',
+        })
+        os.environ.setdefault('LASTBITE_LOG_LEVEL', 'WARNING')
+        import torch
+
+        t0 = time.perf_counter()
+        model = train(train_set, args.epochs, seed=0)
+        torch.save({'model_state_dict': model.state_dict()}, checkpoint)
+        print(f"trained {args.epochs} epochs ({time.perf_counter() - t0:.1f}s)")
+
+        held_dir = os.path.join(tmp, 'held_out')
+        write_dir(held_dir, held_out)
+        proc = subprocess.run([sys.executable, '-m', 'app.models.calibration', '--data', held_dir,
+                               '--checkpoint', checkpoint], cwd=BACKEND_DIR, capture_output=True, text=True)
+        if proc.returncode:
+            raise RuntimeError(proc.stderr)
+        print(proc.stdout.rstrip())
+
+        from app.models import calibration
+        from app.services import classification_service
+        from app.services.cascade import CascadePolicy, FallbackBudget, set_cascade
+        from run import create_app
+
+        temperatures = calibration.load_temperatures(calibration.calibration_path(checkpoint))
+        with torch.no_grad():
+            f_logits, s_logits = model(torch.from_numpy(to_batch(test_set)))
+        f_true = torch.tensor([f for _, f, _ in test_set])
+        s_true = torch.tensor([s for _, _, s in test_set])
+        print(f"\ntest set {'head':<5} | {'NLL raw':>7} | {'NLL cal':>7} | {'ECE raw':>7} | {'ECE cal':>7}")
+        for head, logits, true in (('fruit', f_logits, f_true), ('state', s_logits, s_true)):
+            t = temperatures[head]
+            print(f"         {head:<5} | {calibration.nll(logits, true):7.3f} | {calibration.nll(logits, true, t):7.3f} | "
+                  f"{calibration.expected_calibration_error(logits, true):7.3f} | "
+                  f"{calibration.expected_calibration_error(logits, true, t):7.3f}")
+
+        client = create_app(classifier='warm').test_client()
+        uncalibrated = dict.fromkeys(calibration.HEADS, 1.0)
+        settings = [
+            ('never fall back', temperatures, 0.6, 0),
+            ('raw softmax, 0.6', uncalibrated, 0.6, -1),
+            ('calibrated, 0.6', temperatures, 0.6, -1),
+            ('calibrated, 0.8', temperatures, 0.8, -1),
+            ('calibrated, 0.9', temperatures, 0.9, -1),
+            (f'calibrated, 0.9, {args.budget:g}/min', temperatures, 0.9, args.budget),
+            ('always fall back', temperatures, 1.01, -1),
+        ]
+        print(f"\n/api/classify, {args.test} photos, concurrency {args.concurrency}, "
+              f"OpenAI stub {args.openai_latency_ms:g} ms")
+        print(f"{'setting':<26} | {'local':>6} | {'openai':>6} | {'over budget':>11} | {'accuracy':>8} | "
+              f"{'mean ms':>7} | {'p50 ms':>7} | {'p99 ms':>7}")
+        for label, temps, threshold, per_minute in settings:
+            classification_service.temperatures = temps
+            set_cascade(CascadePolicy(threshold, threshold, FallbackBudget(per_minute)))
+            tiers, correct, latency = run_cascade(client, test_set, args.concurrency)
+            assert tiers['fallback_failed'] == 0, tiers
+            pct = percentiles(latency)
+            n = len(latency)
+            print(f"{label:<26} | {tiers['local'] / n:6.1%} | {tiers['fallback'] / n:6.1%} | "
+                  f"{tiers['over_budget'] / n:11.1%} | {sum(correct) / n:8.1%} | "
+                  f"{1000 * sum(latency) / n:7.1f} | {pct['p50']:7.1f} | {pct['p99']:7.1f}")
+
+
+if __name__ == '__main__':
+    main()
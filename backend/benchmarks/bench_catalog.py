@@ -0,0 +1,123 @@
+# benchmarks/bench_catalog.py
+"""
+Product catalog at 1M products: the dict index parsed from the CSV against
+the memory-mapped columnar snapshot, first when the snapshot has to be
+built and then when it's already on disk (every later start).
+
+Each mode runs in a fresh interpreter that loads the catalog, freezes the
+heap as serve.py's master does and forks --workers processes. Each worker
+makes --lookups random get / by_barcode / by_name calls. Reported: load time,
+the master's RSS growth, and per worker (mean) the private dirty memory
+those reads caused plus its PSS. Private dirty is what each worker copies
+of the shared catalog: dict rows get copied because reading them writes
+their refcounts, snapshot pages are read-only page cache.
+
+    cd backend && python -m benchmarks.bench_catalog [--products 1m] [--workers 4] [--lookups 100000]
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from benchmarks.generate import generate, parse_count, TABLE_FILES
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = r'''
+import gc, os, sys, json, time, random
+import multiprocessing as mp
+path, n, workers, lookups = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4])
+from app.services.product_catalog import ProductCatalog
+from benchmarks.common import product_uid
+from benchmarks.generate import barcode, CATALOG
+from benchmarks.bench_serve import memory
+
+def dirty(pid):
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        return sum(int(l.split()[1]) for l in f if l.startswith('Private_Dirty')) / 1024
+
+rss0 = memory(os.getpid())[0]
+t0 = time.perf_counter()
+catalog = ProductCatalog(path)
+catalog.refresh()
+load = time.perf_counter() - t0
+rss1 = memory(os.getpid())[0]
+gc.collect()
+gc.freeze()
+names = [name for _, _, items, _ in CATALOG.values() for name in items]
+
+def worker(i, out, turn, done):
+    rng = random.Random(i)
+    before = dirty(os.getpid())
+    ids = [rng.randrange(n) for _ in range(lookups)]
+    timings = {}
+    with turn:      # one worker at a time, so the timings aren't shares of a busy core
+        for label, fn, args in (('get', catalog.get, [product_uid(j) for j in ids]),
+                                ('by_barcode', catalog.by_barcode, [barcode(j) for j in ids]),
+                                ('by_name', catalog.by_name, [rng.choice(names) for _ in ids])):
+            t0 = time.perf_counter()
+            for a in args:
+                assert fn(a) is not None
+            timings[label] = (time.perf_counter() - t0) / len(args)
+    del ids
+    gc.collect()
+    own = dirty(os.getpid()) - before
+    done.wait()     # PSS with every worker still mapping the catalog
+    out.put({'dirty': own, 'pss': memory(os.getpid())[1], **timings})
+
+ctx = mp.get_context('fork')
+out, turn, done = ctx.Queue(), ctx.Lock(), ctx.Barrier(workers)
+procs = [ctx.Process(target=worker, args=(i, out, turn, done)) for i in range(workers)]
+for p in procs:
+    p.start()
+results = [out.get() for _ in procs]
+for p in procs:
+    p.join()
+mean = {k: sum(r[k] for r in results) / len(results) for k in results[0]}
+print(json.dumps({'load_s': load, 'rss_mib': rss1 - rss0, 'snapshot': catalog._snapshot is not None, **mean}))
+'''
+
+
+def run(path, n, workers, lookups, snapshot):
+    env = dict(os.environ, LASTBITE_CATALOG_SNAPSHOT='1' if snapshot else '0', LASTBITE_LOG_LEVEL='WARNING')
+    proc = subprocess.run([sys.executable, '-c', CHILD, path, str(n), str(workers), str(lookups)], cwd=BACKEND_DIR,
+                          env=env, capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--products', type=parse_count, default=parse_count('1m'))
+    ap.add_argument('--workers', type=int, default=4)
+    ap.add_argument('--lookups', type=int, default=100_000, help="per worker and kind of lookup")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='lastbite-catalog-') as tmp:
+        generate(tmp, links=1000, products=args.products, users=200)
+        path = os.path.join(tmp, TABLE_FILES[0])
+        print(f"{args.products} products ({os.path.getsize(path) / 2**20:.0f} MiB CSV), {args.workers} forked workers, "
+              f"{args.lookups} lookups of each kind per worker")
+        print(f"{'catalog':<17} | {'load s':>6} | {'master RSS':>10} | {'worker dirty':>12} | {'worker PSS':>10} | "
+              f"{'get us':>6} | {'barcode us':>10} | {'name us':>7}")
+        for label, snapshot in (('dicts (CSV parse)', False), ('snapshot, build', True), ('snapshot, mapped', True)):
+            if label == 'snapshot, build':
+                shutil.rmtree(path + '.snapshot', ignore_errors=True)
+            r = run(path, args.products, args.workers, args.lookups, snapshot)
+            assert r['snapshot'] == snapshot
+            print(f"{label:<17} | {r['load_s']:6.2f} | {r['rss_mib']:6.0f} MiB | {r['dirty']:8.1f} MiB | "
+                  f"{r['pss']:6.0f} MiB | {r['get'] * 1e6:6.1f} | {r['by_barcode'] * 1e6:10.1f} | "
+                  f"{r['by_name'] * 1e6:7.1f}")
+            if label == 'snapshot, mapped':
+                size = sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path + '.snapshot')
+                           for f in files)
+                print(f"snapshot on disk: {size / 2**20:.0f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# benchmarks/bench_clean.py
+"""
+python -m app.clean on a synthetic links table: wall time, rows/s and peak
+RSS of the cleaner process at a few --memory-mb budgets, against the old
+pandas read_csv + drop_duplicates on a slice of the same table.
+
+The table has 10% exact repeats, 10% repeated links with a different
+quantity (merged) and blank quantities throughout, plus a products and a
+users table so the orphan check runs.
+
+    cd backend && python -m benchmarks.bench_clean [--rows 10000000] [--budgets 4096 512 128]
+"""
+
+import os
+import csv
+import sys
+import time
+import random
+import argparse
+import importlib.util
+import tempfile
+import subprocess
+
+from benchmarks.common import write_products, write_users, LINK_FIELDS, product_uid, user_uid
+
+
+def write_dirty_links(path, n, n_users, n_products, seed=0):
+    rng = random.Random(seed)
+    recent = []
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(LINK_FIELDS)
+        for _ in range(n):
+            r = rng.random()
+            if r < 0.1 and recent:
+                row = rng.choice(recent)                                    # exact repeat
+            elif r < 0.2 and recent:
+                row = [*rng.choice(recent)[:3], str(rng.randint(1, 4))]      # same link, new quantity
+            else:
+                row = [user_uid(rng.randrange(n_users)), product_uid(rng.randrange(n_products)),
+                       rng.choice(['', '2025-03-01']), rng.choice(['', '1', '2'])]
+            w.writerow(row)
+            if len(recent) < 10_000:
+                recent.append(row)
+            else:
+                recent[rng.randrange(10_000)] = row
+
+
+def run(args):
+    """(exit status, wall s, peak RSS MiB, stdout) of a child process"""
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+    out = proc.stdout.read()
+    _, status, usage = os.wait4(proc.pid, 0)
+    return status, time.perf_counter() - t0, usage.ru_maxrss / 1024, out
+
+
+PANDAS = """
+import sys, pandas as pd
+df = pd.read_csv(sys.argv[1], nrows=int(sys.argv[2]))
+df.drop_duplicates().to_csv(sys.argv[3], index=False)
+"""
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--rows', type=int, default=10_000_000)
+    ap.add_argument('--products', type=int, default=1_000_000)
+    ap.add_argument('--users', type=int, default=100_000)
+    ap.add_argument('--budgets', type=int, nargs='+', default=[4096, 512, 128])
+    ap.add_argument('--pandas-rows', type=int, default=2_000_000)
+    args = ap.parse_args()
+
+    # on disk next to the repo: /tmp may be RAM-backed, which would skew the RSS numbers
+    with tempfile.TemporaryDirectory(dir=os.getcwd()) as tmp:
+        links = os.path.join(tmp, 'user_product_link_table_v2.csv')
+        write_products(os.path.join(tmp, 'products_table_v2.csv'), args.products)
+        write_users(os.path.join(tmp, 'users_table_v2.csv'), args.users)
+        write_dirty_links(links, args.rows, args.users, args.products)
+        # a few links to products that don't exist
+        with open(links, 'a', newline='') as f:
+            csv.writer(f).writerows([user_uid(0), product_uid(args.products + i), '', '1'] for i in range(100))
+        size = os.path.getsize(links) / 2**20
+        print(f"links: {args.rows} rows, {size:.0f} MiB")
+
+        out = os.path.join(tmp, 'out.csv')
+        print(f"{'budget':>9} | {'partitions':>10} | {'wall':>7} | {'rows/s':>8} | {'peak RSS':>9} | rows out")
+        for budget in args.budgets:
+            status, wall, rss, report = run([sys.executable, '-m', 'app.clean', 'links', links, '-o', out,
+                                             '--memory-mb', str(budget), '--tmp-dir', tmp])
+            assert status == 0, report
+            stats = dict(line.strip().split(': ', 1) for line in report.splitlines() if ': ' in line)
+            print(f"{budget:>5} MiB | {stats['partitions']:>10} | {wall:6.1f}s | {args.rows / wall:8.0f} | "
+                  f"{rss:5.0f} MiB | {stats['rows_out']}")
+        print("last report:")
+        print('\n'.join(line for line in report.splitlines() if 'orphan:' not in line))
+
+        if importlib.util.find_spec('pandas') is None:
+            return
+        n = min(args.pandas_rows, args.rows)
+        status, wall, rss, _ = run([sys.executable, '-c', PANDAS, links, str(n), out])
+        print(f"old clean.py (pandas drop_duplicates), first {n} rows: {wall:.1f}s, peak RSS {rss:.0f} MiB "
+              f"-> ~{rss * args.rows / n:.0f} MiB for the whole table")
+
+
+if __name__ == '__main__':
+    main()
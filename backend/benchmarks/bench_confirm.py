@@ -0,0 +1,191 @@
+# benchmarks/bench_confirm.py
+"""
+Thousands of concurrent confirmations against serve.py workers, then a
+check of what reached the tables. Every link sent to /api/confirm-product
+and every new barcode sent to /api/barcode/confirm is sent --repeats times
+at once from different connections, so the duplicate checks race each
+other within and across worker processes. Afterwards:
+
+  - each confirm-product link is in the table exactly once, and exactly one
+    of its requests got 201 (the others "unchanged")
+  - each new barcode is exactly one product, every confirm of it returned
+    that product's uid, and each of those confirms added its own link
+  - no other rows appeared and none went missing
+
+Reports confirms/s and latency per --max-batch value (LASTBITE_COMMIT_MAX_BATCH;
+1 is one locked, fsync'd write per confirm). Exits 1 if a check fails.
+
+    cd backend && python -m benchmarks.bench_confirm [--confirms 5000] [--workers 2] [--concurrency 64] [--backend sqlite]
+"""
+
+import os
+import csv
+import sys
+import json
+import time
+import random
+import signal
+import sqlite3
+import argparse
+import tempfile
+import threading
+import http.client
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.common import user_uid, product_uid, percentiles
+from benchmarks.generate import generate, TABLE_FILES
+from benchmarks.bench_serve import start_server
+
+
+def workload(rng, counts, links_csv, confirms, repeats):
+    """(requests, pairs, barcodes): pairs not linked yet and barcodes not in the catalog, each sent `repeats` times"""
+    with open(links_csv, newline='') as f:
+        linked = {(r['user_uid'], r['product_uid']) for r in csv.DictReader(f)}
+    n_pairs = int(confirms * 0.6) // repeats
+    pairs = set()
+    while len(pairs) < n_pairs:
+        pair = (user_uid(rng.randrange(counts['users'])), product_uid(rng.randrange(counts['products'])))
+        if pair not in linked:
+            pairs.add(pair)
+    barcodes = [str(700000000000 + i) for i in range((confirms - n_pairs * repeats) // repeats)]
+
+    requests = [('/api/confirm-product', {'user_uid': u, 'product_uid': p, 'quantity': 1})
+                for u, p in pairs for _ in range(repeats)]
+    requests += [('/api/barcode/confirm', {'barcode': b, 'category': 'Dairy', 'item_name': f"Bench {b}",
+                                           'user_id': user_uid(rng.randrange(counts['users'])), 'quantity': 1})
+                 for b in barcodes for _ in range(repeats)]
+    rng.shuffle(requests)
+    return requests, pairs, barcodes
+
+
+def fire(port, requests, concurrency):
+    """[(path, body, status, reply, seconds)] of every request, sent over `concurrency` keep-alive connections"""
+    local = threading.local()
+
+    def send(req):
+        path, body = req
+        conn = getattr(local, 'conn', None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        t0 = time.perf_counter()
+        conn.request('POST', path, body=json.dumps(body), headers={'Content-Type': 'application/json'})
+        r = conn.getresponse()
+        reply = r.read()
+        return path, body, r.status, json.loads(reply) if r.status in (200, 201) else reply, time.perf_counter() - t0
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(send, requests))
+
+
+def stored_rows(tmp, backend):
+    """(product rows, link rows) as the server left them"""
+    if backend == 'sqlite':
+        db = sqlite3.connect(os.path.join(tmp, 'lastbite.sqlite'))
+        db.row_factory = sqlite3.Row
+        products = [dict(r) for r in db.execute('SELECT * FROM products')]
+        links = [dict(r) for r in db.execute('SELECT * FROM links')]
+        db.close()
+        return products, links
+    from app.services.inventory_index import InventoryIndex
+    from app.services.product_catalog import ProductCatalog
+    return (list(ProductCatalog(os.path.join(tmp, TABLE_FILES[0])).read_rows()),
+            list(InventoryIndex(os.path.join(tmp, TABLE_FILES[1])).read_rows()))
+
+
+def check(results, pairs, barcodes, before, after):
+    """Failed checks, as messages"""
+    failures = []
+    statuses = Counter(status for _, _, status, _, _ in results)
+    if set(statuses) - {200, 201}:
+        failures.append(f"unexpected statuses {dict(statuses)}")
+    products, links = after
+    link_count = Counter((l['user_uid'], l['product_uid']) for l in links)
+
+    created = Counter((b['user_uid'], b['product_uid']) for path, b, status, _, _ in results
+                      if path == '/api/confirm-product' and status == 201)
+    for pair in pairs:
+        if link_count[pair] != 1 or created[pair] != 1:
+            failures.append(f"link {pair}: {link_count[pair]} rows, {created[pair]} created")
+
+    by_barcode = {}
+    for p in products:
+        by_barcode.setdefault(p['barcode'], []).append(p)
+    answered = {}
+    for path, body, status, reply, _ in results:
+        if path == '/api/barcode/confirm' and status == 201:
+            answered.setdefault(body['barcode'], []).append(reply['uid'])
+    for b in barcodes:
+        rows, uids = by_barcode.get(b, []), answered.get(b, [])
+        if len(rows) != 1 or set(uids) != {rows[0]['product_uid']}:
+            failures.append(f"barcode {b}: {len(rows)} products, confirms answered with {sorted(set(uids))}")
+        elif link_count[(None, None)] or sum(n for (u, p), n in link_count.items() if p == rows[0]['product_uid']) \
+                != len(uids):
+            failures.append(f"barcode {b}: {len(uids)} confirms but a different number of links")
+
+    expected_links = len(before[1]) + len(pairs) + sum(len(u) for u in answered.values())
+    if len(links) != expected_links:
+        failures.append(f"{len(links)} link rows, expected {expected_links}")
+    if len(products) != len(before[0]) + len(barcodes):
+        failures.append(f"{len(products)} product rows, expected {len(before[0]) + len(barcodes)}")
+    return failures
+
+
+def run(args, max_batch):
+    with tempfile.TemporaryDirectory(prefix='lastbite-confirm-') as tmp:
+        counts = generate(tmp, args.links)
+        env = dict(os.environ, LASTBITE_DATA_DIR=tmp, LASTBITE_CLASSIFIER='off', LASTBITE_TLS_CERT='',
+                   LASTBITE_STORAGE=args.backend, LASTBITE_COMMIT_MAX_BATCH=str(max_batch),
+                   LASTBITE_LOG_LEVEL='INFO', LASTBITE_OFF_CACHE_PATH=os.path.join(tmp, 'off_cache.sqlite'))
+        if args.backend == 'sqlite':
+            from app.services.sqlite_repository import import_csv
+            import_csv(os.path.join(tmp, 'lastbite.sqlite'), *(os.path.join(tmp, f) for f in TABLE_FILES))
+        before = stored_rows(tmp, args.backend)
+        requests, pairs, barcodes = workload(random.Random(args.seed), counts, os.path.join(tmp, TABLE_FILES[1]),
+                                             args.confirms, args.repeats)
+
+        with open(os.path.join(tmp, 'serve.log'), 'w') as log:
+            proc = start_server(args.workers, 1, args.port, env, log)
+            try:
+                t0 = time.perf_counter()
+                results = fire(args.port, requests, args.concurrency)
+                wall = time.perf_counter() - t0
+            finally:
+                proc.send_signal(signal.SIGTERM)
+                proc.wait(timeout=60)
+
+        failures = check(results, pairs, barcodes, before, stored_rows(tmp, args.backend))
+        p = percentiles([s for *_, s in results], (50, 99))
+        print(f"{max_batch:>9} | {len(results):>8} | {len(results) / wall:10.0f} | {p['p50']:8.2f} | "
+              f"{p['p99']:8.2f} | {'ok' if not failures else f'{len(failures)} FAILED'}")
+        for f in failures[:20]:
+            print(f"    {f}")
+        if failures:
+            with open(log.name) as f:
+                errors = [line for line in f if 'ERROR' in line or 'Error' in line]
+            print(''.join(errors[:20]), end='')
+        return not failures
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--confirms', type=int, default=5000)
+    ap.add_argument('--repeats', type=int, default=4, help="concurrent copies of each confirmation")
+    ap.add_argument('--workers', type=int, default=2)
+    ap.add_argument('--concurrency', type=int, default=64, help="client connections")
+    ap.add_argument('--backend', choices=('csv', 'sqlite'), default='csv')
+    ap.add_argument('--max-batch', type=int, nargs='+', default=[1, 512])
+    ap.add_argument('--links', type=int, default=100_000, help="size of the generated tables")
+    ap.add_argument('--port', type=int, default=5092)
+    ap.add_argument('--seed', type=int, default=0)
+    args = ap.parse_args()
+
+    print(f"{args.confirms} confirms ({args.repeats} copies of each) over {args.concurrency} connections, "
+          f"{args.workers} workers, {args.backend}")
+    print(f"{'max batch':>9} | {'requests':>8} | {'confirms/s':>10} | {'p50 ms':>8} | {'p99 ms':>8} | tables")
+    ok = all([run(args, max_batch) for max_batch in args.max_batch])
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# benchmarks/bench_geo.py
+"""
+Spatial index behind /api/routing/nearest: k-nearest and radius queries on
+the grid vs. a vectorized linear haversine scan, incremental adds, and an
+exactness check against the scan (poles and the antimeridian included).
+
+    cd backend && python -m benchmarks.bench_geo [--points 1000000 --queries 2000]
+"""
+
+import os
+import math
+import time
+import random
+import argparse
+import tempfile
+
+import numpy as np
+
+from app.services.geo_index import GeoGrid, LocationIndex, haversine_km
+from benchmarks.common import user_locations, write_users, percentiles, time_calls
+
+
+class LinearScan:
+    """What any nearest-user query would cost without an index"""
+
+    def __init__(self, lat, lng):
+        self.lat, self.lng = np.radians(lat), np.radians(lng)
+
+    def distances(self, lat, lng):
+        return haversine_km(math.radians(lat), math.radians(lng), self.lat, self.lng)
+
+    def nearest(self, lat, lng, k):
+        d = self.distances(lat, lng)
+        top = np.argpartition(d, k - 1)[:k]
+        top = top[np.argsort(d[top])]
+        return list(zip(top.tolist(), d[top].tolist()))
+
+    def within(self, lat, lng, radius_km):
+        d = self.distances(lat, lng)
+        hit = np.flatnonzero(d <= radius_km)
+        return sorted(zip(hit.tolist(), d[hit].tolist()), key=lambda t: t[1])
+
+
+def same(a, b):
+    """Same distances (ids may differ on exact ties)"""
+    return len(a) == len(b) and all(abs(x[1] - y[1]) < 1e-6 for x, y in zip(a, b))
+
+
+def fmt(samples):
+    return ' '.join(f"{k} {v:.3f}ms" for k, v in percentiles(samples, (50, 99)).items())
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--points', type=int, default=1_000_000)
+    ap.add_argument('--queries', type=int, default=2000)
+    ap.add_argument('--adds', type=int, default=20000)
+    ap.add_argument('--csv-users', type=int, default=100_000)
+    args = ap.parse_args()
+
+    locs = np.array(user_locations(args.points), dtype=np.float64)
+    lat, lng = locs[:, 0], locs[:, 1]
+    rng = random.Random(1)
+    queries = [tuple(map(float, locs[rng.randrange(args.points)])) for _ in range(args.queries)]
+    queries += [(89.99, 12.0), (-89.99, -170.0), (0.0, 179.999), (0.0, -180.0), (45.0, 180.0)]
+
+    t0 = time.perf_counter()
+    grid = GeoGrid()
+    grid.build(np.arange(args.points), lat, lng)
+    print(f"{args.points} points: grid built in {time.perf_counter() - t0:.2f}s, "
+          f"cell {grid._grid.cell_deg:.4f} deg")
+    scan = LinearScan(lat, lng)
+
+    # exactness against the linear scan, including poles and the antimeridian
+    checked = queries[:200] + queries[-5:]
+    for q in checked:
+        assert same(grid.nearest(*q, k=10), scan.nearest(*q, 10)), q
+        assert same(grid.within(*q, 25.0), scan.within(*q, 25.0)), q
+    print(f"exact: {len(checked)} queries agree with the linear scan (k=10, radius 25 km)")
+
+    for k in (1, 10, 50):
+        g = time_calls(lambda q: grid.nearest(*q, k=k), [(q,) for q in queries])
+        s = time_calls(lambda q: scan.nearest(*q, k), [(q,) for q in queries[:50]])
+        print(f"nearest k={k:<3}| grid {fmt(g)} | linear scan {fmt(s)}")
+    for r in (1.0, 10.0):
+        g = time_calls(lambda q: grid.within(*q, r), [(q,) for q in queries])
+        s = time_calls(lambda q: scan.within(*q, r), [(q,) for q in queries[:50]])
+        hits = np.mean([len(grid.within(*q, r)) for q in queries[:200]])
+        print(f"radius {r:>4.0f}km | grid {fmt(g)} | linear scan {fmt(s)} | ~{hits:.0f} results per query")
+
+    # incremental: new locations land in the pending set, folded into the grid in the background
+    new = user_locations(args.adds, seed=2)
+    t0 = time.perf_counter()
+    for i, (a, b) in enumerate(new):
+        grid.add(args.points + i, a, b)
+    elapsed = time.perf_counter() - t0
+    while grid._folding:
+        time.sleep(0.01)
+    g = time_calls(lambda q: grid.nearest(*q, k=10), [(q,) for q in queries])
+    print(f"incremental: {args.adds} adds in {elapsed:.2f}s ({args.adds / elapsed:.0f}/s), "
+          f"nearest k=10 after (up to {grid.pending_max} pending points scanned linearly): {fmt(g)}")
+    all_lat = np.concatenate([lat, [p[0] for p in new]])
+    all_lng = np.concatenate([lng, [p[1] for p in new]])
+    scan = LinearScan(all_lat, all_lng)
+    for q in queries[:50]:
+        assert same(grid.nearest(*q, k=10), scan.nearest(*q, 10)), q
+
+    # the CSV-backed index the route uses: load time and one moved user
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'users.csv')
+        write_users(path, args.csv_users)
+        index = LocationIndex(path)
+        t0 = time.perf_counter()
+        index.refresh()
+        print(f"LocationIndex: {args.csv_users} users loaded from CSV in {time.perf_counter() - t0:.2f}s")
+        uid = index.nearest(41.88, -87.63, k=1)[0]['user_uid']
+        index.append_rows([{'user_uid': uid, 'user_id': '', 'user_name': 'moved',
+                            'location_lat': '-33.87', 'location_lng': '151.21'}])
+        assert index.location_of(uid) == (-33.87, 151.21)
+        assert index.nearest(-33.87, 151.21, k=1)[0]['user_uid'] == uid
+        assert all(r['user_uid'] != uid for r in index.within(41.88, -87.63, 1000.0, limit=None))
+        print(f"LocationIndex: moved {uid} Chicago -> Sydney via the journal, queries follow")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/bench_inventory.py
+"""
+GET /api/inventory/<user_uid>: full CSV scan vs. resident inventory index.
+
+    cd backend && python -m benchmarks.bench_inventory [--sizes 10000 100000 1000000]
+"""
+
+import os
+import csv
+import random
+import argparse
+import tempfile
+
+from app.services.inventory_index import InventoryIndex, parse_quantity
+from app.services.product_catalog import ProductCatalog
+from benchmarks.common import write_products, write_links, user_uid, percentiles, time_calls
+
+
+def full_scan(link_file, products_file, uid):
+    """The original get_inventory join: read both CSVs on every request"""
+    links = []
+    with open(link_file, newline='') as f:
+        for row in csv.DictReader(f):
+            if row.get('user_uid') == uid:
+                links.append({'product_uid': row.get('product_uid'),
+                              'quantity': parse_quantity(row.get('quantity'))})
+    products = {}
+    with open(products_file, newline='') as f:
+        for row in csv.DictReader(f):
+            products[row['product_uid']] = row
+    return [{**products[l['product_uid']], 'quantity': l['quantity']}
+            for l in links if l['product_uid'] in products]
+
+
+def indexed(index, catalog, uid):
+    index.refresh()
+    catalog.refresh()
+    return [{**catalog.get(l['product_uid']), 'quantity': l['quantity']}
+            for l in index.links_for(uid) if catalog.get(l['product_uid'])]
+
+
+def run(n_links, scan_iters, index_iters):
+    n_users = max(10, n_links // 50)
+    n_products = max(10, n_links // 10)
+    with tempfile.TemporaryDirectory() as tmp:
+        links_csv = os.path.join(tmp, 'links.csv')
+        products_csv = os.path.join(tmp, 'products.csv')
+        write_products(products_csv, n_products)
+        write_links(links_csv, n_links, n_users, n_products)
+
+        rng = random.Random(1)
+        users = [user_uid(rng.randrange(n_users)) for _ in range(max(scan_iters, index_iters))]
+
+        scan = time_calls(lambda u: full_scan(links_csv, products_csv, u), [(u,) for u in users[:scan_iters]])
+
+        index, catalog = InventoryIndex(links_csv), ProductCatalog(products_csv)
+        index.refresh()
+        catalog.refresh()
+        idx = time_calls(lambda u: indexed(index, catalog, u), [(u,) for u in users[:index_iters]])
+
+    s, i = percentiles(scan), percentiles(idx)
+    print(f"{n_links:>9} links | full scan p50 {s['p50']:9.3f} ms  p99 {s['p99']:9.3f} ms"
+          f" | index p50 {i['p50']:7.4f} ms  p99 {i['p99']:7.4f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    ap.add_argument('--scan-iters', type=int, default=20)
+    ap.add_argument('--index-iters', type=int, default=5000)
+    args = ap.parse_args()
+    for n in args.sizes:
+        run(n, args.scan_iters, args.index_iters)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+# benchmarks/bench_inventory_stream.py
+"""
+GET /api/inventory/<user_uid> for one large account: peak RSS growth during
+the request, time to first byte and total time, for the buffered jsonify
+reply vs. ?stream=ndjson, ?stream=json and walking ?limit= pages, as the
+account grows. Peak RSS is the kernel's high-water mark, reset before each
+request (Linux /proc/self/clear_refs).
+
+    cd backend && python -m benchmarks.bench_inventory_stream [--sizes 10000 100000 400000]
+"""
+
+import os
+import csv
+import json
+import time
+import argparse
+import tempfile
+
+from run import create_app
+from app.services.repository import CsvRepository, set_repository
+from benchmarks.common import write_products, write_users, LINK_FIELDS, product_uid, user_uid
+
+
+def reset_peak_rss():
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+
+
+def rss_kib(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field):
+                return int(line.split()[1])
+
+
+def measure(client, url, paged=False):
+    """(peak RSS growth MiB, time to first byte s, total s, bytes)"""
+    reset_peak_rss()
+    before = rss_kib('VmRSS:')
+    t0 = time.perf_counter()
+    first, size = None, 0
+    while url:
+        r = client.get(url, buffered=False)
+        page = []
+        for chunk in r.response:
+            if first is None:
+                first = time.perf_counter() - t0
+            size += len(chunk)
+            if paged:
+                page.append(chunk)
+        r.close()
+        url = None
+        if paged:
+            cursor = json.loads(b''.join(page))['next_cursor']
+            url = cursor and f"{paged}&cursor={cursor}"
+    return (rss_kib('VmHWM:') - before) / 1024, first, time.perf_counter() - t0, size
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 400_000])
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        n = max(args.sizes)
+        write_products(os.path.join(tmp, 'products_table_v2.csv'), n)
+        write_users(os.path.join(tmp, 'users_table_v2.csv'), len(args.sizes))
+        with open(os.path.join(tmp, 'user_product_link_table_v2.csv'), 'w', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(LINK_FIELDS)
+            for u, size in enumerate(args.sizes):       # user u holds `size` items
+                w.writerows([user_uid(u), product_uid(i), '2025-03-01', '1'] for i in range(size))
+
+        set_repository(CsvRepository.in_dir(tmp))
+        client = create_app(classifier='off').test_client()
+        client.get(f'/api/inventory/{user_uid(0)}?limit=1')       # load the indexes first
+
+        print(f"{'items':>8} | {'mode':<22}| {'peak RSS':>9} | {'first byte':>10} | {'total':>8} | size")
+        for u, size in enumerate(args.sizes):
+            base = f'/api/inventory/{user_uid(u)}'
+            for mode, url, paged in (
+                    ('buffered jsonify', base, False),
+                    ('stream=ndjson', f'{base}?stream=ndjson', False),
+                    ('stream=json', f'{base}?stream=json', False),
+                    ('stream=ndjson, 2 fields', f'{base}?stream=ndjson&fields=item_name,expiry_date', False),
+                    ('pages of 1000', f'{base}?limit=1000', f'{base}?limit=1000')):
+                rss, first, total, nbytes = measure(client, url, paged)
+                print(f"{size:>8} | {mode:<22}| {rss:6.1f} MiB | {first * 1000:7.1f} ms | {total:6.2f} s "
+                      f"| {nbytes / 2**20:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# benchmarks/bench_off_lookup.py
+"""
+OpenFoodFacts lookup layer against a local stand-in server: concurrent scans
+with repeated barcodes, in-flight coalescing, and a simulated restart to show
+the on-disk tier. Reports hit ratio and upstream latency.
+
+    cd backend && python -m benchmarks.bench_off_lookup [--scans 5000 --threads 16]
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+from app.services.off_lookup import OffLookup
+from benchmarks.stubs import StubServer, off_handler
+
+
+def drive(lookup, barcodes, threads):
+    chunks = [barcodes[i::threads] for i in range(threads)]
+    workers = [threading.Thread(target=lambda c=c: [lookup.lookup(b) for b in c]) for c in chunks]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return time.perf_counter() - t0
+
+
+def report(label, lookup, server, elapsed, n):
+    s = lookup.stats()
+    print(f"{label:>10} | {n / elapsed:8.0f} scans/s | hit ratio {s['hit_ratio']:6.1%}"
+          f" | upstream calls {s['upstream_calls']:5} (server saw {server.requests:5})"
+          f" | upstream avg {s['upstream_avg_ms']:6.1f} ms max {s['upstream_max_ms']:6.1f} ms"
+          f" | coalesced {s['coalesced']}, negative hits {s['negative_hits']}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--scans', type=int, default=5000)
+    ap.add_argument('--distinct', type=int, default=500)
+    ap.add_argument('--threads', type=int, default=16)
+    ap.add_argument('--latency-ms', type=float, default=20)
+    args = ap.parse_args()
+
+    rng = random.Random(0)
+    universe = [str(400000000000 + i) for i in range(args.distinct)]
+    known = {b: f"Product {b}" for b in universe[: args.distinct // 2]}   # half are unknown to OFF
+    # skewed scan stream: popular products are scanned far more often
+    scans = [universe[min(int(rng.paretovariate(1.2)) - 1, args.distinct - 1)] for _ in range(args.scans)]
+
+    with StubServer(off_handler(known, args.latency_ms / 1000)) as server, tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, 'off_cache.sqlite')
+
+        # ten users scanning the same unknown barcode at once -> one upstream call
+        lookup = OffLookup(base_url=server.url, cache_path=cache)
+        threads = [threading.Thread(target=lookup.lookup, args=(universe[-1],)) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert server.requests == 1, server.requests
+        print(f"coalescing: 10 concurrent scans of one barcode -> {server.requests} upstream call")
+
+        server.requests = 0
+        lookup = OffLookup(base_url=server.url, cache_path=cache)
+        report('cold', lookup, server, drive(lookup, scans, args.threads), len(scans))
+
+        server.requests = 0
+        restarted = OffLookup(base_url=server.url, cache_path=cache)   # empty memory tier, same disk
+        report('restarted', restarted, server, drive(restarted, scans, args.threads), len(scans))
+
+
+if __name__ == '__main__':
+    main()
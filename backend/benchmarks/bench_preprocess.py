@@ -0,0 +1,93 @@
+# benchmarks/bench_preprocess.py
+"""
+Upload preprocessing: full decode + torchvision transforms vs. reduced-resolution
+decode + NumPy normalize. Checks the two agree numerically, then reports time
+per image and peak RSS (each pipeline measured in a fresh process).
+
+    cd backend && python -m benchmarks.bench_preprocess [--width 4000 --height 3000]
+"""
+
+import io
+import time
+import argparse
+import multiprocessing as mp
+
+import numpy as np
+from PIL import Image
+
+from app.models.fruit_model import preprocess
+from app.services.image_preprocess import fast_preprocess, to_model_input
+
+
+def synthetic_photo(width, height, fmt, seed=0):
+    """Smooth colour gradients plus sensor-like noise, encoded as JPEG or PNG"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    img = np.stack([
+        128 + 100 * np.sin(x / width * 6.0),
+        128 + 100 * np.cos(y / height * 4.0),
+        128 + 60 * np.sin((x + y) / (width + height) * 9.0),
+    ], axis=-1)
+    img += rng.normal(0, 8, img.shape)
+    buf = io.BytesIO()
+    Image.fromarray(img.clip(0, 255).astype(np.uint8)).save(buf, fmt, **({'quality': 90} if fmt == 'JPEG' else {}))
+    return buf.getvalue()
+
+
+def reference(img_bytes):
+    return preprocess(Image.open(io.BytesIO(img_bytes)).convert('RGB')).numpy()
+
+
+def validate(img_bytes):
+    img = Image.open(io.BytesIO(img_bytes)).convert('RGB')
+    # the NumPy normalize on its own must match ToTensor + Normalize
+    exact = np.abs(to_model_input(img.resize((128, 128), Image.BILINEAR)) - preprocess(img).numpy()).max()
+    # the reduced decode changes pixels slightly (DCT scaling / box reduce)
+    diff = np.abs(fast_preprocess(img_bytes) - reference(img_bytes))
+    return exact, diff.mean(), diff.max()
+
+
+def proc_status_kb(key):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(key + ':'):
+                return int(line.split()[1])
+    return 0
+
+
+def measure(img_bytes, pipeline, iters):
+    fn = reference if pipeline == 'torchvision' else fast_preprocess
+    # reset the peak-RSS watermark (VmHWM) so import-time peaks don't count
+    with open('/proc/self/clear_refs', 'w') as f:
+        f.write('5')
+    base = proc_status_kb('VmRSS')
+    fn(img_bytes)
+    t0 = time.perf_counter()
+    for _ in range(iters):
+        fn(img_bytes)
+    per_image = (time.perf_counter() - t0) / iters
+    peak = proc_status_kb('VmHWM') - base
+    return per_image * 1000, peak / 1024
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--width', type=int, default=4000)
+    ap.add_argument('--height', type=int, default=3000)
+    ap.add_argument('--iters', type=int, default=10)
+    args = ap.parse_args()
+
+    ctx = mp.get_context('spawn')
+    for fmt in ('JPEG', 'PNG'):
+        img_bytes = synthetic_photo(args.width, args.height, fmt)
+        exact, mean_diff, max_diff = validate(img_bytes)
+        print(f"{fmt} {args.width}x{args.height} ({len(img_bytes) / 1e6:.1f} MB) | normalize max|d| {exact:.1e}"
+              f" | fast vs torchvision mean|d| {mean_diff:.4f} max|d| {max_diff:.4f}")
+        for pipeline in ('torchvision', 'fast'):
+            with ctx.Pool(1) as pool:
+                ms, peak_mb = pool.apply(measure, (img_bytes, pipeline, args.iters))
+            print(f"  {pipeline:>11} | {ms:8.1f} ms/image | peak RSS +{peak_mb:7.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
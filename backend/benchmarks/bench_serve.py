@@ -0,0 +1,160 @@
+# benchmarks/bench_serve.py
+"""
+serve.py at a few worker counts: for each --workers value, start the server
+on generated tables with a random-weight checkpoint (result cache off, so
+every upload runs the model), drive POST /api/classify/model with distinct
+photos and GET /api/inventory/<user> from client processes over keep-alive
+connections, and report req/s, p50/p99 and each worker's memory from
+/proc/<pid>/smaps_rollup after the run.
+
+RSS counts every page a worker maps, including the weights and indexes it
+shares with the master; PSS charges shared pages in equal parts to the
+processes sharing them (so master + workers PSS is what the box really
+spends); private is what one worker added on its own.
+
+Throughput can only grow with workers up to os.cpu_count(), and the client
+processes run on the same cores.
+
+    cd backend && python -m benchmarks.bench_serve [--workers 1 2 4 8] [--seconds 15] [--concurrency 16]
+"""
+
+import os
+import sys
+import time
+import random
+import signal
+import argparse
+import tempfile
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from benchmarks.common import user_uid, percentiles
+from benchmarks.generate import generate, parse_count
+from benchmarks.bench_api import write_random_checkpoint, photos
+
+BOUNDARY = 'lastbite-bench'
+
+
+def multipart(image):
+    return (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="image"; filename="a.jpg"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + image + f'\r\n--{BOUNDARY}--\r\n'.encode()
+
+
+CLASSIFY_HEADERS = {'Content-Type': f'multipart/form-data; boundary={BOUNDARY}'}
+
+
+def drive(port, route, n_users, seconds, connections, seed):
+    """Latencies (s) and error count of `connections` keep-alive clients hammering one route"""
+    # request bodies are built before the clock starts
+    bodies = [multipart(img) for img in photos(16, seed=seed * 16)] if route == 'classify' else None
+    stop = time.perf_counter() + seconds
+
+    def client(i):
+        rng = random.Random(seed * 1000 + i)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        samples, errors = [], 0
+        while time.perf_counter() < stop:
+            t0 = time.perf_counter()
+            if bodies:
+                conn.request('POST', '/api/classify/model', body=rng.choice(bodies), headers=CLASSIFY_HEADERS)
+            else:
+                conn.request('GET', f'/api/inventory/{user_uid(rng.randrange(n_users))}?limit=100')
+            r = conn.getresponse()
+            r.read()
+            samples.append(time.perf_counter() - t0)
+            errors += r.status != 200
+        conn.close()
+        return samples, errors
+
+    with ThreadPoolExecutor(connections) as pool:
+        results = list(pool.map(client, range(connections)))
+    return [s for samples, _ in results for s in samples], sum(e for _, e in results)
+
+
+def memory(pid):
+    """(RSS, PSS, private) MiB of a process"""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if value.strip().endswith('kB'):
+                fields[key] = int(value.split()[0]) / 1024
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(p) for p in f.read().split()]
+
+
+def start_server(workers, torch_threads, port, env, log):
+    proc = subprocess.Popen([sys.executable, 'serve.py', '--workers', str(workers), '--torch-threads',
+                             str(torch_threads), '--bind', f'127.0.0.1:{port}'], env=env, stderr=log)
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        with open(log.name) as f:
+            if f.read().count(' ready in ') >= workers:
+                return proc
+        if proc.poll() is not None:
+            break
+        time.sleep(0.2)
+    proc.kill()
+    with open(log.name) as f:
+        raise RuntimeError(f"server didn't start:\n{f.read()}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    ap.add_argument('--torch-threads', type=int, default=0, help="per worker; 0 = serve.py's default")
+    ap.add_argument('--links', type=parse_count, default=parse_count('1m'))
+    ap.add_argument('--seconds', type=float, default=15, help="per route and worker count")
+    ap.add_argument('--concurrency', type=int, default=16, help="keep-alive connections in all")
+    ap.add_argument('--client-procs', type=int, default=2)
+    ap.add_argument('--port', type=int, default=5091)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='lastbite-serve-') as tmp:
+        counts = generate(tmp, args.links)
+        checkpoint = os.path.join(tmp, 'random.pth')
+        write_random_checkpoint(checkpoint)
+        env = dict(os.environ, LASTBITE_DATA_DIR=tmp, LASTBITE_MODEL_PATH=checkpoint, LASTBITE_TLS_CERT='',
+                   LASTBITE_RESULT_CACHE_SIZE='0', LASTBITE_OFF_CACHE_PATH=os.path.join(tmp, 'off_cache.sqlite'))
+        print(f"tables: {counts}; {os.cpu_count()} cores, {args.concurrency} connections "
+              f"from {args.client_procs} client processes")
+        print(f"{'workers':>7} | {'route':<9}| {'req/s':>8} | {'p50 ms':>8} | {'p99 ms':>8} | errors")
+        memory_rows = []
+        for workers in args.workers:
+            with open(os.path.join(tmp, f'serve-{workers}.log'), 'w') as log:
+                proc = start_server(workers, args.torch_threads, args.port, env, log)
+                try:
+                    for route in ('classify', 'inventory'):
+                        per_proc = [args.concurrency // args.client_procs + (i < args.concurrency % args.client_procs)
+                                    for i in range(args.client_procs)]
+                        with ProcessPoolExecutor(args.client_procs) as clients:
+                            runs = [clients.submit(drive, args.port, route, counts['users'], args.seconds, n, i)
+                                    for i, n in enumerate(per_proc) if n]
+                            results = [r.result() for r in runs]
+                        samples = [s for run, _ in results for s in run]
+                        errors = sum(e for _, e in results)
+                        p = percentiles(samples, (50, 99))
+                        print(f"{workers:7d} | {route:<9}| {len(samples) / args.seconds:8.1f} | {p['p50']:8.2f} | "
+                              f"{p['p99']:8.2f} | {errors or ''}")
+                    pids = children(proc.pid)
+                    per_worker = [memory(pid) for pid in pids]
+                    memory_rows.append((workers, memory(proc.pid), per_worker))
+                finally:
+                    proc.send_signal(signal.SIGTERM)
+                    proc.wait(timeout=60)
+
+        print(f"\n{'workers':>7} | {'master RSS':>10} | {'worker RSS':>10} | {'worker PSS':>10} | "
+              f"{'private':>8} | {'all PSS':>9}   (worker columns: mean per worker)")
+        for workers, (m_rss, m_pss, _), per_worker in memory_rows:
+            rss, pss, private = (sum(col) / len(per_worker) for col in zip(*per_worker))
+            print(f"{workers:7d} | {m_rss:6.0f} MiB | {rss:6.0f} MiB | {pss:6.0f} MiB | {private:4.0f} MiB | "
+                  f"{m_pss + pss * len(per_worker):5.0f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# benchmarks/bench_startup.py
+"""
+Cold-start cost of create_app() with the classification stack off, lazy and
+warm, plus the latency of the first and second /api/classify/model request.
+Each mode runs in a fresh interpreter so import costs are real.
+
+    cd backend && python -m benchmarks.bench_startup --checkpoint app/models/fruit_dual_cnn.pth
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CHILD = r'''
+import io, sys, json, time
+t0 = time.perf_counter()
+from run import create_app
+app = create_app(classifier=sys.argv[1])
+startup = time.perf_counter() - t0
+out = {'startup_s': startup, 'torch_imported': 'torch' in sys.modules}
+if sys.argv[1] != 'off':
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new('RGB', (640, 480), (180, 40, 40)).save(buf, 'JPEG')
+    client = app.test_client()
+    for key in ('first_request_s', 'second_request_s'):
+        t0 = time.perf_counter()
+        r = client.post('/api/classify/model', data={'image': (io.BytesIO(buf.getvalue()), 'a.jpg')},
+                        content_type='multipart/form-data')
+        out[key] = time.perf_counter() - t0
+        assert r.status_code == 200, r.get_json()
+print(json.dumps(out))
+'''
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--checkpoint', required=True)
+    ap.add_argument('--repeat', type=int, default=3)
+    args = ap.parse_args()
+
+    env = {**os.environ, 'LASTBITE_MODEL_PATH': os.path.abspath(args.checkpoint)}
+    for mode in ('off', 'lazy', 'warm'):
+        runs = []
+        for _ in range(args.repeat):
+            proc = subprocess.run([sys.executable, '-W', 'ignore', '-c', CHILD, mode], cwd=BACKEND_DIR, env=env,
+                                  capture_output=True, text=True, check=True)
+            runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        best = {k: min(r[k] for r in runs) for k in runs[0] if k.endswith('_s')}
+        line = f"{mode:>4} | create_app {best['startup_s'] * 1000:8.1f} ms | torch imported: {runs[0]['torch_imported']!s:5}"
+        if 'first_request_s' in best:
+            line += (f" | 1st classify {best['first_request_s'] * 1000:8.1f} ms"
+                     f" | 2nd classify {best['second_request_s'] * 1000:6.1f} ms")
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
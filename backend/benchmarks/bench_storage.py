@@ -0,0 +1,123 @@
+# benchmarks/bench_storage.py
+"""
+Every /api endpoint that touches storage, on the CSV backend and on SQLite
+(imported from the same synthetic tables), through the Flask test client.
+Also checks both backends return the same answers. Classification is
+represented by its catalog enrichment (product_by_name); the model itself
+doesn't touch storage.
+
+Writes are not like for like: a CSV append fsyncs its journal, SQLite in
+WAL mode with synchronous=NORMAL defers the fsync to checkpoints.
+
+    cd backend && python -m benchmarks.bench_storage [--products 100000 --users 50000 --links 1000000]
+"""
+
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from run import create_app
+from app.services.repository import CsvRepository, set_repository
+from app.services.sqlite_repository import SqliteRepository, import_csv
+from benchmarks.common import (write_products, write_links, write_users, ITEMS, CITIES,
+                               product_uid, user_uid, percentiles, time_calls)
+
+
+def endpoints(args, rng):
+    """(label, [(method, url, json)]) per endpoint; the same calls for both backends"""
+    users = [user_uid(rng.randrange(args.users)) for _ in range(args.requests)]
+    products = [rng.randrange(args.products) for _ in range(args.requests)]
+    barcode = lambda i: str(100000000000 + i)
+    return [
+        ('GET inventory/<user>', [('GET', f'/api/inventory/{u}', None) for u in users]),
+        ('POST barcode/scan (known)', [('POST', '/api/barcode/scan', {'barcode': barcode(p)}) for p in products]),
+        ('GET expiring (3 days)', [('GET', f'/api/expiring?days=3&as_of=2025-06-01&offset={o}', None)
+                                   for o in rng.choices((0, 50, 1000), k=args.requests)]),
+        ('GET expiring/<user> (30 days)', [('GET', f'/api/expiring/{u}?days=30&as_of=2025-06-01', None)
+                                           for u in users]),
+        ('GET routing/nearest user', [('GET', f'/api/routing/nearest?user_uid={u}&k=10', None) for u in users]),
+        ('GET routing/nearest point', [('GET', f'/api/routing/nearest?lat={lat + rng.gauss(0, .1)}'
+                                               f'&lng={lng + rng.gauss(0, .1)}&radius_km=5&k=50', None)
+                                       for lat, lng in rng.choices(CITIES, k=args.requests)]),
+        ('POST confirm-product', [('POST', '/api/confirm-product', {'user_uid': u, 'product_uid': product_uid(p)})
+                                  for u, p in zip(users, products)]),
+        ('POST barcode/confirm', [('POST', '/api/barcode/confirm', {'barcode': barcode(p), 'category': 'Dairy',
+                                                                    'user_id': u, 'quantity': 1})
+                                  for u, p in zip(users, products)]),
+        ('POST routing/locations', [('POST', '/api/routing/locations',
+                                     {'user_uid': u, 'location_lat': lat + rng.gauss(0, .1),
+                                      'location_lng': lng + rng.gauss(0, .1)})
+                                    for u, (lat, lng) in zip(users, rng.choices(CITIES, k=args.requests))]),
+    ]
+
+
+def call(client, method, url, payload):
+    r = client.open(url, method=method, json=payload)
+    assert r.status_code < 400, (url, r.status_code, r.get_data(as_text=True)[:200])
+    return r.get_json()
+
+
+def fmt(samples):
+    p = percentiles(samples, (50, 99))
+    return f"p50 {p['p50']:7.3f} ms  p99 {p['p99']:7.3f} ms"
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--products', type=int, default=100_000)
+    ap.add_argument('--users', type=int, default=50_000)
+    ap.add_argument('--links', type=int, default=1_000_000)
+    ap.add_argument('--requests', type=int, default=1000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_products(os.path.join(tmp, 'products_table_v2.csv'), args.products)
+        write_users(os.path.join(tmp, 'users_table_v2.csv'), args.users)
+        write_links(os.path.join(tmp, 'user_product_link_table_v2.csv'), args.links, args.users, args.products)
+        db = os.path.join(tmp, 'lastbite.sqlite')
+        t0 = time.perf_counter()
+        counts = import_csv(db, *(os.path.join(tmp, f) for f in (
+            'products_table_v2.csv', 'user_product_link_table_v2.csv', 'users_table_v2.csv')))
+        print(f"import: {counts} in {time.perf_counter() - t0:.1f}s, {os.path.getsize(db) / 2**20:.0f} MiB")
+
+        backends = {'csv': CsvRepository.in_dir(tmp), 'sqlite': SqliteRepository(db)}
+        app = create_app(classifier='off')
+        client = app.test_client()
+        results = {}
+        for name, repo in backends.items():
+            set_repository(repo)
+            t0 = time.perf_counter()
+            call(client, 'GET', f'/api/inventory/{user_uid(0)}', None)
+            call(client, 'GET', '/api/expiring?days=3&as_of=2025-06-01', None)
+            call(client, 'GET', f'/api/routing/nearest?user_uid={user_uid(0)}', None)
+            print(f"{name}: first requests (loading indexes / opening the database) {time.perf_counter() - t0:.2f}s")
+
+            rng = random.Random(7)
+            answers = results[name] = {}
+            for label, calls in endpoints(args, rng):
+                answers[label] = [call(client, *calls[i]) for i in range(0, len(calls), len(calls) // 5)]
+                answers[label + ' timing'] = time_calls(lambda *c: call(client, *c), calls)
+            names = [n for n, _ in ITEMS] + ['apples', 'Bananas', 'unknown']
+            answers['product_by_name'] = [repo.product_by_name(n) for n in names]
+            answers['product_by_name timing'] = time_calls(repo.product_by_name, [(n,) for n in names] * 200)
+
+        # reads issued before any write must agree; writes change state, so only their status is compared
+        for label in ('GET inventory/<user>', 'POST barcode/scan (known)', 'GET expiring (3 days)',
+                      'GET expiring/<user> (30 days)', 'GET routing/nearest user', 'GET routing/nearest point',
+                      'product_by_name'):
+            a, b = results['csv'][label], results['sqlite'][label]
+            for x, y in zip(a, b):
+                if isinstance(x, dict):
+                    x, y = ({k: v for k, v in d.items() if k not in ('scan_date',)} for d in (x, y))
+                assert x == y, (label, x, y)
+        print("answers agree between backends\n")
+
+        print(f"{'endpoint':<32}| {'csv':^33}| {'sqlite':^33}")
+        for label in [k for k in results['csv'] if k.endswith(' timing')]:
+            print(f"{label[:-7]:<32}| {fmt(results['csv'][label])} | {fmt(results['sqlite'][label])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+# benchmarks/bench_vision_fallback.py
+"""
+OpenAI vision fallback against a local mock of the chat-completions API:
+coalescing of identical uploads, bounded upstream concurrency, deadline and
+circuit breaker behaviour while the upstream is slow, and recovery through
+the half-open probe once it is healthy again.
+
+    cd backend && python -m benchmarks.bench_vision_fallback [--concurrency 4]
+"""
+
+import os
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+
+from app.services.vision_fallback import VisionFallback, CircuitBreaker, FallbackUnavailable
+from benchmarks.common import percentiles
+from benchmarks.stubs import StubServer, openai_handler
+
+
+class Upstream:
+    """Reply callable for the stub: adjustable latency, tracks peak concurrency"""
+
+    def __init__(self):
+        self.latency_s = 0.1
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, body):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.latency_s)
+        finally:
+            with self._lock:
+                self.active -= 1
+        return '{"fruit": "apple", "state": "fresh"}'
+
+
+def image(i):
+    return b'\xff\xd8' + i.to_bytes(8, 'big') + os.urandom(32)   # distinct bytes, never a cache hit
+
+
+def fmt(samples):
+    return ' '.join(f"{k} {v:.2f}ms" for k, v in percentiles(samples, (50, 95, 99)).items())
+
+
+def timed_call(fallback, img, deadline_s=None):
+    t0 = time.perf_counter()
+    try:
+        fallback.classify(img, deadline_s)
+        outcome = 'ok'
+    except FallbackUnavailable as e:
+        outcome = e.reason
+    return time.perf_counter() - t0, outcome
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--concurrency', type=int, default=4)
+    ap.add_argument('--requests', type=int, default=40)
+    ap.add_argument('--deadline-s', type=float, default=0.5)
+    ap.add_argument('--slow-s', type=float, default=2.0)
+    ap.add_argument('--cooldown-s', type=float, default=1.0)
+    args = ap.parse_args()
+
+    upstream = Upstream()
+    with StubServer(openai_handler(reply=upstream, latency_s=0)) as server:
+        client = openai.OpenAI(base_url=server.url + '/v1', api_key='stub', max_retries=0)
+        breaker = CircuitBreaker(window=10, min_calls=5, failure_rate=0.5,
+                                 slow_s=args.deadline_s, cooldown_s=args.cooldown_s)
+        fallback = VisionFallback(model='stub', deadline_s=args.deadline_s,
+                                  max_concurrency=args.concurrency, breaker=breaker, client=client)
+        n = 0
+
+        # ten users uploading the same photo at once -> one upstream call
+        img = image(n := n + 1)
+        with ThreadPoolExecutor(10) as ex:
+            results = list(ex.map(lambda _: fallback.classify(img), range(10)))
+        assert server.requests == 1, server.requests
+        assert all(parsed == {'fruit': 'apple', 'state': 'fresh'} for parsed, _ in results)
+        print(f"coalescing: 10 concurrent identical uploads -> {server.requests} upstream call")
+
+        # healthy upstream, many distinct uploads: in-flight calls stay bounded (generous
+        # deadline here, a call abandoned at its deadline keeps the server busy a while longer)
+        server.requests = 0
+        upstream.latency_s = 0.05
+        with ThreadPoolExecutor(32) as ex:
+            t0 = time.perf_counter()
+            times = list(ex.map(lambda i: timed_call(fallback, image(i), 30), range(n + 1, n + 1 + args.requests)))
+            elapsed = time.perf_counter() - t0
+        n += args.requests
+        assert upstream.peak <= args.concurrency, upstream.peak
+        print(f"healthy:    {args.requests} uploads from 32 threads in {elapsed:.2f}s, "
+              f"peak upstream concurrency {upstream.peak} (limit {args.concurrency}), "
+              f"{sum(o == 'ok' for _, o in times)} ok, {fmt([t for t, _ in times])}")
+
+        # upstream turns slow: calls stop at the deadline, then the breaker opens and requests fail fast
+        upstream.latency_s = args.slow_s
+        slow = [timed_call(fallback, image(n + i)) for i in range(1, 11)]
+        n += 10
+        print(f"slow:       upstream {args.slow_s:.1f}s, deadline {args.deadline_s:.1f}s -> "
+              + ', '.join(f"{t * 1000:.0f}ms {o}" for t, o in slow))
+        assert all(t < args.deadline_s + 0.25 for t, _ in slow)
+        assert fallback.breaker.state == 'open'
+        fast = [timed_call(fallback, image(n + i)) for i in range(1, 101)]
+        n += 100
+        assert all(o == 'circuit_open' for _, o in fast)
+        print(f"open:       100 requests skipped, {fmt([t for t, _ in fast])}")
+
+        # healthy again: after the cooldown one probe goes through and closes the circuit
+        upstream.latency_s = 0.05
+        time.sleep(args.cooldown_s)
+        print(f"cooldown:   circuit {fallback.breaker.state}", end='')
+        t, outcome = timed_call(fallback, image(n := n + 1))
+        assert outcome == 'ok' and fallback.breaker.state == 'closed', (outcome, fallback.breaker.state)
+        print(f" -> probe {outcome} in {t * 1000:.0f}ms -> circuit {fallback.breaker.state}")
+
+        print(f"stats:      {fallback.stats()}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# benchmarks/common.py
+"""Shared helpers for the benchmark scripts: synthetic tables and percentiles."""
+
+import csv
+import random
+import time
+
+PRODUCT_FIELDS = ['product_uid', 'product_id', 'barcode', 'item_name', 'category', 'scanned_date', 'expiry_date']
+LINK_FIELDS    = ['user_uid', 'product_uid', 'scan_date', 'quantity']
+USER_FIELDS    = ['user_uid', 'user_id', 'user_name', 'location_lat', 'location_lng', 'points_awarded']
+
+ITEMS = [
+    ('Potato', 'Vegetables'), ('Popcorn', 'Snacks'), ('Chicken', 'Meat'), ('Apple', 'Fruits'),
+    ('Banana', 'Fruits'), ('Orange', 'Fruits'), ('Milk', 'Dairy'), ('Bread', 'Bakery'),
+]
+
+
+def product_uid(i):
+    return f"PRD_{i:010x}"
+
+
+def user_uid(i):
+    return f"USR_{i:010x}"
+
+
+def write_products(path, n, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(PRODUCT_FIELDS)
+        for i in range(n):
+            name, cat = rng.choice(ITEMS)
+            w.writerow([product_uid(i), f"{cat[:3].upper()}-{i % 100000:05d}", str(100000000000 + i),
+                        name, cat, '2025-03-01', f"2025-{rng.randint(3, 12):02d}-{rng.randint(1, 28):02d}"])
+
+
+# (lat, lng) of a few metro areas; synthetic users cluster around them
+CITIES = [(41.88, -87.63), (40.71, -74.01), (34.05, -118.24), (29.76, -95.37), (47.61, -122.33),
+          (51.51, -0.13), (35.68, 139.69), (-33.87, 151.21), (19.43, -99.13), (28.61, 77.21)]
+
+
+def user_locations(n, seed=0):
+    """n (lat, lng) pairs: 90% scattered around CITIES (~20 km), 10% anywhere"""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        if rng.random() < 0.9:
+            lat, lng = rng.choice(CITIES)
+            out.append((max(-90.0, min(90.0, lat + rng.gauss(0, 0.2))), (lng + rng.gauss(0, 0.25) + 180) % 360 - 180))
+        else:
+            out.append((rng.uniform(-90, 90), rng.uniform(-180, 180)))
+    return out
+
+
+def write_users(path, n, seed=0):
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(USER_FIELDS)
+        for i, (lat, lng) in enumerate(user_locations(n, seed)):
+            w.writerow([user_uid(i), str(100000 + i), f"user{i}", f"{lat:.6f}", f"{lng:.6f}", '10'])
+
+
+def write_links(path, n, n_users, n_products, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(LINK_FIELDS)
+        for _ in range(n):
+            w.writerow([user_uid(rng.randrange(n_users)), product_uid(rng.randrange(n_products)),
+                        '2025-03-01', rng.choice(['', '1', '2', '3'])])
+
+
+def percentiles(samples, points=(50, 99)):
+    """Percentiles of a list of latencies (seconds) in milliseconds"""
+    s = sorted(samples)
+    return {f"p{p}": s[min(len(s) - 1, int(len(s) * p / 100))] * 1000 for p in points}
+
+
+def time_calls(fn, args_iter):
+    samples = []
+    for args in args_iter:
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - t0)
+    return samples
@@ -0,0 +1,175 @@
+# benchmarks/generate.py
+"""
+Synthetic products, users and links tables shaped like data/*.csv, at any
+scale. Vocabulary, category mix, product_id prefixes and shelf lives follow
+the shipped tables; users reappear with nearby locations (the shipped table
+averages six rows per user); most links have a blank scan_date and quantity;
+a few users and products account for most links.
+
+Entities are addressable by index (product_uid(i), barcode(i), user_uid(i)),
+so benchmarks can build requests without reading the tables back. Rows are
+written a chunk at a time, so 10M links take constant memory.
+
+    cd backend && python -m benchmarks.generate --links 1m --out /tmp/lastbite-1m [--sqlite]
+"""
+
+import os
+import csv
+import time
+import argparse
+from datetime import date, timedelta
+
+import numpy as np
+
+from benchmarks.common import PRODUCT_FIELDS, LINK_FIELDS, USER_FIELDS, CITIES, product_uid, user_uid
+
+# category -> (product_id prefix, share of the catalog, item names, shelf life range in days)
+CATALOG = {
+    'Snacks':     ('CHP', 188, ['Popcorn', 'Granola Bar', 'Chips', 'Cookies', 'Crackers', 'Biscuits'], (45, 180)),
+    'Beverages':  ('BEV', 178, ['Water', 'Soda', 'Juice'], (30, 180)),
+    'Meat':       ('MEA', 175, ['Chicken', 'Pork', 'Beef'], (5, 7)),
+    'Vegetables': ('VEG', 172, ['Potato', 'Spinach', 'Carrot', 'Broccoli'], (5, 60)),
+    'Bakery':     ('BAK', 162, ['Muffin', 'Bagel', 'Bread'], (5, 7)),
+    'Dairy':      ('DRY', 161, ['Milk', 'Yogurt', 'Cheese'], (7, 30)),
+    'Fruits':     ('FRT', 160, ['Apple', 'Banana', 'Grapes', 'Orange'], (7, 30)),
+}
+NAMES = ['Linda', 'James', 'Maria', 'Wei', 'Aisha', 'Carlos', 'Priya', 'Olga', 'Kenji', 'Fatima',
+         'Noah', 'Emma', 'Liam', 'Sofia', 'Mateo', 'Chloe', 'Arjun', 'Yuki', 'Omar', 'Grace']
+
+SCAN_START = date(2024, 10, 9)     # the shipped tables span ~6 months of scans
+SCAN_DAYS  = 180
+CHUNK      = 100_000
+
+
+def barcode(i):
+    """12-digit barcode of product i; a bijection scattered over the UPC range, not sequential"""
+    return str(100000000000 + (i * 2654435761) % 900000000000)
+
+
+def parse_count(value):
+    """'10k', '2.5M', '10000000' -> int"""
+    value = value.strip().lower().replace('_', '')
+    scale = {'k': 10**3, 'm': 10**6}.get(value[-1:], 1)
+    return int(float(value[:-1] if scale > 1 else value) * scale)
+
+
+def skewed(rng, n, size, skew):
+    """`size` indices in [0, n), index 0 the most popular; skew 1 is uniform"""
+    return np.minimum((n * rng.random(size) ** skew).astype(np.int64), n - 1)
+
+
+def _dates(offsets):
+    base = SCAN_START.toordinal()
+    return [date.fromordinal(base + int(d)).isoformat() for d in offsets]
+
+
+def write_products(path, n, seed=0):
+    rng = np.random.default_rng(seed)
+    cats = list(CATALOG)
+    share = np.array([CATALOG[c][1] for c in cats], dtype=np.float64)
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(PRODUCT_FIELDS)
+        for start in range(0, n, CHUNK):
+            k = min(CHUNK, n - start)
+            cat = rng.choice(len(cats), size=k, p=share / share.sum())
+            pick = rng.random(k)
+            serial = rng.integers(10000, 100000, size=k)
+            scanned = rng.integers(0, SCAN_DAYS, size=k)
+            life = rng.random(k)
+            rows = []
+            for j in range(k):
+                c = cats[cat[j]]
+                prefix, _, items, (lo, hi) = CATALOG[c]
+                scan = SCAN_START + timedelta(days=int(scanned[j]))
+                rows.append([product_uid(start + j), f"{prefix}-{serial[j]}", barcode(start + j),
+                             items[int(pick[j] * len(items))], c, scan.isoformat(),
+                             (scan + timedelta(days=lo + int(life[j] * (hi - lo + 1)))).isoformat()])
+            w.writerows(rows)
+
+
+def write_users(path, n, rows_per_user=6.0, seed=0):
+    """n users; each appears ~rows_per_user times in a row, drifting a few km between rows"""
+    rng = np.random.default_rng(seed + 1)
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(USER_FIELDS)
+        for start in range(0, n, CHUNK):
+            k = min(CHUNK, n - start)
+            city = rng.integers(0, len(CITIES), size=k)
+            anywhere = rng.random(k) < 0.1
+            repeats = rng.geometric(1 / max(rows_per_user, 1.0), size=k)
+            points = np.where(rng.random(k) < 0.8, 10, rng.integers(0, 50, size=k) * 10)
+            names = rng.integers(0, len(NAMES), size=k)
+            rows = []
+            for j in range(k):
+                if anywhere[j]:
+                    lat, lng = rng.uniform(-60, 70), rng.uniform(-180, 180)
+                else:
+                    lat, lng = CITIES[city[j]]
+                    lat, lng = lat + rng.normal(0, 0.2), lng + rng.normal(0, 0.25)
+                i = start + j
+                for _ in range(int(repeats[j])):
+                    lat = min(90.0, max(-90.0, lat + rng.normal(0, 0.02)))
+                    lng = (lng + rng.normal(0, 0.02) + 180) % 360 - 180
+                    rows.append([user_uid(i), str(100000 + i), NAMES[names[j]],
+                                 f"{lat:.6f}", f"{lng:.6f}", str(points[j])])
+            w.writerows(rows)
+
+
+def write_links(path, n, n_users, n_products, blank_rate=0.9, seed=0):
+    """n links; users and products drawn with a long tail, scan_date/quantity blank at `blank_rate`"""
+    rng = np.random.default_rng(seed + 2)
+    with open(path, 'w', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(LINK_FIELDS)
+        for start in range(0, n, CHUNK):
+            k = min(CHUNK, n - start)
+            users = skewed(rng, n_users, k, 2.0)
+            products = skewed(rng, n_products, k, 1.5)
+            blank = rng.random(k) < blank_rate
+            scans = _dates(rng.integers(0, SCAN_DAYS, size=k))
+            quantity = rng.integers(1, 6, size=k)
+            w.writerows([user_uid(u), product_uid(p), '', ''] if b else
+                        [user_uid(u), product_uid(p), s, str(q)]
+                        for u, p, b, s, q in zip(users.tolist(), products.tolist(), blank, scans, quantity.tolist()))
+
+
+TABLE_FILES = ('products_table_v2.csv', 'user_product_link_table_v2.csv', 'users_table_v2.csv')
+
+
+def generate(out, links, products=None, users=None, blank_rate=0.9, seed=0):
+    """Write the three tables into `out`; returns {table: rows} (users: distinct users)"""
+    products = products or max(1000, links // 10)
+    users = users or max(200, links // 100)
+    os.makedirs(out, exist_ok=True)
+    write_products(os.path.join(out, TABLE_FILES[0]), products, seed)
+    write_links(os.path.join(out, TABLE_FILES[1]), links, users, products, blank_rate, seed)
+    write_users(os.path.join(out, TABLE_FILES[2]), users, seed=seed)
+    return {'products': products, 'links': links, 'users': users}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument('--links', type=parse_count, default=parse_count('100k'), help="e.g. 10k, 1m, 10m")
+    ap.add_argument('--products', type=parse_count, help="default: links / 10")
+    ap.add_argument('--users', type=parse_count, help="default: links / 100")
+    ap.add_argument('--blank-rate', type=float, default=0.9, help="share of links with no scan_date/quantity")
+    ap.add_argument('--seed', type=int, default=0)
+    ap.add_argument('--out', required=True)
+    ap.add_argument('--sqlite', action='store_true', help="also import the tables into <out>/lastbite.sqlite")
+    args = ap.parse_args()
+
+    t0 = time.perf_counter()
+    counts = generate(args.out, args.links, args.products, args.users, args.blank_rate, args.seed)
+    sizes = ', '.join(f"{f} {os.path.getsize(os.path.join(args.out, f)) / 2**20:.0f} MiB" for f in TABLE_FILES)
+    print(f"{counts} in {time.perf_counter() - t0:.1f}s: {sizes}")
+    if args.sqlite:
+        from app.services.sqlite_repository import import_csv
+        t0 = time.perf_counter()
+        import_csv(os.path.join(args.out, 'lastbite.sqlite'), *(os.path.join(args.out, f) for f in TABLE_FILES))
+        print(f"sqlite import in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+# benchmarks/stubs.py
+"""Local stand-ins for the upstream HTTP APIs, so benchmarks run offline."""
+
+import json
+import time
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass   # clients hanging up mid-reply (deadlines) are expected
+
+
+class StubServer:
+    """Runs a ThreadingHTTPServer on 127.0.0.1 in a background thread; counts requests"""
+
+    def __init__(self, handler_cls):
+        self.requests = 0
+        self._lock = threading.Lock()
+        outer = self
+
+        class Handler(handler_cls):
+            # headers and body go out in separate writes; with Nagle on, the
+            # client's delayed ACK would add ~40 ms to every reply
+            disable_nagle_algorithm = True
+
+            def count(self):
+                with outer._lock:
+                    outer.requests += 1
+
+        self.httpd = _QuietServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def off_handler(known, latency_s=0.02):
+    """OpenFoodFacts /api/v0/product/<barcode>.json; `known` maps barcode -> product name"""
+
+    class OffHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.count()
+            time.sleep(latency_s)
+            barcode = self.path.rsplit('/', 1)[-1].removesuffix('.json')
+            if barcode in known:
+                body = {'status': 1, 'product': {'product_name': known[barcode]}}
+            else:
+                body = {'status': 0, 'status_verbose': 'product not found'}
+            data = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return OffHandler
+
+
+def openai_handler(reply='{"fruit": "apple", "state": "fresh"}', latency_s=0.2):
+    """OpenAI POST /v1/chat/completions returning `reply` (a str, or a callable taking the request JSON)"""
+
+    class OpenAIHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.count()
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            time.sleep(latency_s)
+            content = reply(body) if callable(reply) else reply
+            data = json.dumps({
+                'id': 'chatcmpl-stub', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': body.get('model', 'stub'),
+                'choices': [{'index': 0, 'finish_reason': 'stop',
+                             'message': {'role': 'assistant', 'content': content}}],
+                'usage': {'prompt_tokens': 1, 'completion_tokens': 1, 'total_tokens': 2},
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return OpenAIHandler
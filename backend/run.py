@@ -1,10 +1,30 @@
+import os
+import logging
 from flask import Flask
 from app.routes import register_blueprints
+from app.services import metrics
 from flask_cors import CORS
-def create_app():
+
+# How this process serves /api/classify*:
+#   lazy  load the model on the first classification request (default)
+#   warm  load it and run a warm-up forward pass before serving anything
+#   off   don't register the classification routes (barcode/inventory-only workers)
+CLASSIFIER = os.getenv('LASTBITE_CLASSIFIER', 'lazy')
+
+# DEBUG adds per-request details (upload names, tensor stats, logits); off by default
+LOG_LEVEL = os.getenv('LASTBITE_LOG_LEVEL', 'INFO')
+
+def create_app(classifier=CLASSIFIER):
+    logging.basicConfig(level=LOG_LEVEL, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    # the OpenAI client logs every upstream call at INFO
+    logging.getLogger('httpx').setLevel(max(logging.WARNING, logging.getLogger().level))
     app = Flask(__name__)
     CORS(app)
-    register_blueprints(app)
+    metrics.init_app(app)
+    register_blueprints(app, classification=classifier != 'off')
+    if classifier == 'warm':
+        from app.services.classification_service import warm_up
+        warm_up()
     return app
 
 if __name__ == '__main__':
@@ -13,4 +33,4 @@ if __name__ == '__main__':
         port=5001, 
         debug=True,
         ssl_context=('cert.pem', 'key.pem') 
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,208 @@
+"""
+Production server: a master process that loads everything once and forks
+the workers that serve requests.
+
+    cd backend && python serve.py [--workers 4] [--torch-threads 1] [--bind 0.0.0.0:5001]
+
+The master builds the app, loads the classifier weights and the storage
+indexes, takes them out of the garbage collector's reach (gc.freeze) and
+forks. Workers share those pages copy-on-write, so N workers hold about
+one copy of the model and the indexes plus their own request-time memory.
+Each worker caps PyTorch at --torch-threads intra-op threads (by default the
+cores divided among the workers, so workers × threads doesn't oversubscribe
+them), warms up its own inference batcher and accepts connections on the
+listening socket they all share. The master replaces workers that die and,
+on SIGTERM or Ctrl-C, stops them and waits for requests in flight.
+
+/metrics sums every worker: each writes its values to LASTBITE_METRICS_DIR
+(a fresh temporary directory unless set) every LASTBITE_METRICS_FLUSH_S, and
+the worker answering a scrape adds the others' to its own. Workers that
+exited keep their last values there, so counters never go back. run.py
+remains the development server.
+"""
+
+import gc
+import os
+import sys
+import time
+import shutil
+import signal
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# ── tweak these for your deployment ─────────────────────────────
+BIND          = os.getenv('LASTBITE_BIND', '0.0.0.0:5001')
+WORKERS       = int(os.getenv('LASTBITE_WORKERS', os.cpu_count() or 1))
+TORCH_THREADS = int(os.getenv('LASTBITE_TORCH_THREADS', 0))       # per worker; 0 = cores / workers
+GRACE_S       = float(os.getenv('LASTBITE_GRACE_S', 10))          # for requests in flight at shutdown
+# TLS as in run.py; set LASTBITE_TLS_CERT to an empty string for plain HTTP behind a proxy
+TLS_CERT      = os.getenv('LASTBITE_TLS_CERT', os.path.join(BACKEND_DIR, 'cert.pem'))
+TLS_KEY       = os.getenv('LASTBITE_TLS_KEY', os.path.join(BACKEND_DIR, 'key.pem'))
+# ----------------------------------------------------------------
+
+logger = logging.getLogger('serve')
+
+
+def torch_threads_per_worker(workers, torch_threads=TORCH_THREADS):
+    return torch_threads or max(1, (os.cpu_count() or 1) // workers)
+
+
+def listen(bind):
+    host, _, port = bind.rpartition(':')
+    return socket.create_server((host.strip('[]') or '0.0.0.0', int(port)), backlog=1024)
+
+
+def metrics_dir():
+    """LASTBITE_METRICS_DIR, emptied of a previous run's workers, or a new temporary one (and whether it's ours)"""
+    path = os.getenv('LASTBITE_METRICS_DIR')
+    if not path:
+        return tempfile.mkdtemp(prefix='lastbite-metrics-'), True
+    os.makedirs(path, exist_ok=True)
+    for name in os.listdir(path):
+        if name.endswith(('.json', '.json.tmp')):
+            os.remove(os.path.join(path, name))
+    return path, False
+
+
+def preload(classifier):
+    """Everything the workers should share: storage indexes and, unless classification is off, the weights"""
+    from app.services.repository import get_repository
+    get_repository().preload()
+    if classifier != 'off':
+        from app.services.classification_service import ensure_loaded
+        ensure_loaded()
+    # a fork copies only the calling thread: let background folds/sorts the loads started finish
+    for t in threading.enumerate():
+        if t is not threading.current_thread():
+            t.join(timeout=60)
+    # objects the collector tracks would otherwise be written to (so copied) by every worker's collections
+    gc.collect()
+    gc.freeze()
+
+
+def run_worker(app, sock, torch_threads, classifier, ssl_context):
+    from werkzeug.serving import ThreadedWSGIServer
+    from app.services import metrics
+    import torch
+
+    class WorkerServer(ThreadedWSGIServer):
+        daemon_threads = False      # server_close() waits for requests in flight
+
+    t0 = time.perf_counter()
+    metrics.reset()         # the master wrote what it recorded itself; don't count it once per worker
+    torch.set_num_threads(torch_threads)
+    if classifier != 'off':
+        from app.services.classification_service import warm_up
+        warm_up()
+    host, port = sock.getsockname()[:2]
+    server = WorkerServer(host, port, app, ssl_context=ssl_context, fd=sock.fileno())
+    # shutdown() waits for serve_forever() to return, so it can't run on the thread serving
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    signal.pthread_sigmask(signal.SIG_SETMASK, set())
+    metrics.start_flushing()
+    logger.info("worker %d ready in %.1fs (%d torch threads)", os.getpid(), time.perf_counter() - t0, torch_threads)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        metrics.flush()     # what the other workers go on reporting for this one
+
+
+def supervise(workers, start_worker):
+    """Fork `workers` processes running start_worker(); replace any that die until SIGTERM/SIGINT, then stop them"""
+    watched = {signal.SIGCHLD, signal.SIGTERM, signal.SIGINT}
+    # delivered through sigwaitinfo below rather than as handlers
+    signal.pthread_sigmask(signal.SIG_BLOCK, watched)
+    children = {}
+
+    def fork():
+        pid = os.fork()
+        if pid == 0:
+            # Ctrl-C reaches the whole process group; the master decides what happens
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            code = 0
+            try:
+                start_worker()
+            except BaseException:
+                logger.exception("worker %d failed", os.getpid())
+                code = 1
+            finally:
+                logging.shutdown()
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    for _ in range(workers):
+        fork()
+    while True:
+        sig = signal.sigwaitinfo(watched).si_signo
+        if sig != signal.SIGCHLD:
+            break
+        while children and (pid := os.waitpid(-1, os.WNOHANG)[0]):
+            started = children.pop(pid, None)
+            if started is None:
+                continue
+            logger.warning("worker %d exited; starting another", pid)
+            if time.monotonic() - started < 1:
+                time.sleep(1)       # don't spin on a worker that dies at start-up
+            fork()
+
+    logger.info("stopping %d workers", len(children))
+    for pid in children:
+        os.kill(pid, signal.SIGTERM)
+    deadline = time.monotonic() + GRACE_S
+    while children and time.monotonic() < deadline:
+        pid = os.waitpid(-1, os.WNOHANG)[0]
+        if pid:
+            children.pop(pid, None)
+        else:
+            time.sleep(0.05)
+    for pid in children:
+        logger.warning("worker %d still busy after %.0fs; killing it", pid, GRACE_S)
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve the API from pre-forked workers sharing one loaded model")
+    ap.add_argument('--bind', default=BIND, help="host:port (default %(default)s)")
+    ap.add_argument('--workers', type=int, default=WORKERS, help="default: one per core")
+    ap.add_argument('--torch-threads', type=int, default=TORCH_THREADS,
+                    help="intra-op threads per worker; 0 = cores / workers")
+    args = ap.parse_args()
+    if args.workers < 1 or args.torch_threads < 0:
+        ap.error("--workers must be at least 1 and --torch-threads at least 0")
+    torch_threads = torch_threads_per_worker(args.workers, args.torch_threads)
+    # read at import: decode threads per worker follow the torch budget unless set
+    os.environ.setdefault('LASTBITE_DECODE_THREADS', str(torch_threads))
+    # also read at import: where workers leave their metrics for one another
+    metrics_path, own_metrics_dir = metrics_dir()
+    os.environ['LASTBITE_METRICS_DIR'] = metrics_path
+
+    import torch
+    from run import create_app, CLASSIFIER
+    from app.services import metrics
+    # no intra-op thread pool in the master: OpenMP's pool doesn't survive a fork
+    torch.set_num_threads(1)
+    classifier = 'off' if CLASSIFIER == 'off' else 'lazy'
+    app = create_app(classifier=classifier)
+
+    sock = listen(args.bind)
+    ssl_context = (TLS_CERT, TLS_KEY) if TLS_CERT else None
+    t0 = time.perf_counter()
+    preload(classifier)
+    metrics.flush()
+    logger.info("preloaded in %.1fs; %d workers on %s%s", time.perf_counter() - t0, args.workers, args.bind,
+                ' (TLS)' if ssl_context else '')
+    supervise(args.workers, lambda: run_worker(app, sock, torch_threads, classifier, ssl_context))
+    sock.close()
+    if own_metrics_dir:
+        shutil.rmtree(metrics_path, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())